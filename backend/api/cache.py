@@ -0,0 +1,130 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .replicas import primary_reads, read_from_replica
+
+
+def get_version(namespace):
+    """Текущая версия пространства имен кэша. Версия хранится в самом кэше,
+    поэтому общая для всех процессов при общем бэкенде (Redis)."""
+    key = f'version:{namespace}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        return cache.get(key, 1)
+    return version
+
+
+def bump_version(namespace):
+    """Инвалидирует все записи пространства имен сменой версии: старые
+    ключи больше не запрашиваются и вытесняются по таймауту."""
+    try:
+        cache.incr(f'version:{namespace}')
+    except ValueError:
+        cache.add(f'version:{namespace}', 2, timeout=None)
+    mark_changed(namespace)
+
+
+def mark_changed(*names):
+    """Отмечает данные как недавно измененные на время допустимого
+    отставания реплик (DATABASE_REPLICA_LAG)."""
+    if settings.DATABASE_REPLICAS and names:
+        cache.set_many(
+            {f'changed:{name}': True for name in names},
+            settings.DATABASE_REPLICA_LAG,
+        )
+
+
+def get_changed(names):
+    """Недавно измененные данные из names, если текущий запрос читал
+    с реплики: такие данные могли быть прочитаны до того, как изменение
+    дошло до реплики, и их нельзя кэшировать."""
+    if not read_from_replica():
+        return set()
+    found = cache.get_many([f'changed:{name}' for name in names])
+    return {name for name in names if f'changed:{name}' in found}
+
+
+def make_key(namespace, *parts):
+    return ':'.join(
+        (namespace, f'v{get_version(namespace)}', *map(str, parts))
+    )
+
+
+def make_etag(data):
+    payload = json.dumps(data, sort_keys=True, default=str).encode()
+    return quote_etag(hashlib.md5(payload).hexdigest())
+
+
+def cached_response(request, key, get_data):
+    """Ответ с данными из кэша (по ключу key) или из get_data() с
+    сохранением в кэш. Ответ содержит ETag; при совпадении с
+    If-None-Match возвращается 304 без тела. Данные для кэша читаются
+    с основной базы, а не с реплики."""
+    cached = cache.get(key)
+    if cached is None:
+        with primary_reads():
+            data = get_data()
+        cached = (make_etag(data), data)
+        cache.set(key, cached, settings.API_CACHE_TIMEOUT)
+    etag, data = cached
+    headers = {'ETag': etag}
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
+
+
+class CachedReadOnlyMixin:
+    """Кэширует ответы list и retrieve вьюсета в пространстве имен
+    cache_namespace (ключ - полный путь запроса с параметрами).
+    Пространство инвалидируется функцией bump_version, например
+    из обработчиков сигналов моделей."""
+
+    cache_namespace = None
+
+    def get_cache_key(self, request):
+        return make_key(
+            self.cache_namespace,
+            request.accepted_renderer.format,
+            request.get_full_path(),
+        )
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            request,
+            self.get_cache_key(request),
+            lambda: super(CachedReadOnlyMixin, self).list(
+                request, *args, **kwargs
+            ).data,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(
+            request,
+            self.get_cache_key(request),
+            lambda: super(CachedReadOnlyMixin, self).retrieve(
+                request, *args, **kwargs
+            ).data,
+        )
+
+
+def incr_counter(name, delta=1):
+    """Увеличивает общий (в кэше) счетчик статистики."""
+    if not delta:
+        return
+    try:
+        cache.incr(f'counter:{name}', delta)
+    except ValueError:
+        if not cache.add(f'counter:{name}', delta, timeout=None):
+            cache.incr(f'counter:{name}', delta)
+
+
+def get_counters(*names):
+    values = cache.get_many([f'counter:{name}' for name in names])
+    return {name: values.get(f'counter:{name}', 0) for name in names}
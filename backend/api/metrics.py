@@ -0,0 +1,143 @@
+import bisect
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from rest_framework.serializers import BaseSerializer
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """Гистограмма в духе Prometheus: счетчики по верхним границам
+    корзин, сумма и количество наблюдений для каждого набора меток.
+    Данные хранятся в памяти процесса."""
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            counts, total = self.series.get(
+                labels,
+                ([0] * (len(self.buckets) + 1), 0),
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.series[labels] = (counts, total + value)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self.series.items()
+            )
+        for labels, counts, total in series:
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса.',
+    DURATION_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries',
+    'Количество SQL-запросов на запрос к API.',
+    COUNT_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'foodgram_db_duration_seconds',
+    'Суммарное время SQL-запросов на запрос к API.',
+    DURATION_BUCKETS,
+)
+SERIALIZER_DURATION = Histogram(
+    'foodgram_serializer_duration_seconds',
+    'Время сериализации ответа.',
+    DURATION_BUCKETS,
+)
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZER_DURATION)
+
+
+class RequestStats:
+    """Статистика одного запроса: SQL-запросы (через
+    connection.execute_wrapper) и время сериализации."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.serializer_time = 0
+        self.serializing = False
+        self.statements = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def record(self, view, method, duration):
+        labels = (('view', view), ('method', method))
+        REQUEST_DURATION.observe(labels, duration)
+        DB_QUERIES.observe(labels, self.queries)
+        DB_DURATION.observe(labels, self.db_time)
+        SERIALIZER_DURATION.observe(labels, self.serializer_time)
+
+
+request_stats = ContextVar('request_stats', default=None)
+
+
+def instrument_serializers():
+    """Оборачивает BaseSerializer.data для учета времени сериализации
+    в статистике текущего запроса. Вложенные вызовы (сериализатор внутри
+    сериализатора) не учитываются повторно."""
+    original = BaseSerializer.data.fget
+    if getattr(original, 'instrumented', False):
+        return
+
+    def data(self):
+        stats = request_stats.get()
+        if stats is None or stats.serializing:
+            return original(self)
+        stats.serializing = True
+        started = time.perf_counter()
+        try:
+            return original(self)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.serializing = False
+
+    data.instrumented = True
+    BaseSerializer.data = property(data)
+
+
+def render_metrics(extra_lines=()):
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
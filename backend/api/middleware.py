@@ -0,0 +1,59 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import RequestStats, request_stats
+
+SQL_PREVIEW_LENGTH = 500
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """Собирает для каждого запроса время обработки, количество и время
+    SQL-запросов, время сериализации и добавляет их в гистограммы
+    по имени маршрута (basename роутера и action, например
+    recipes-list). Если запрос превысил QUERY_BUDGET SQL-запросов,
+    пишет предупреждение с самыми частыми запросами - так сразу видны
+    N+1 в сериализаторах."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(stats.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        match = request.resolver_match
+        stats.record(
+            match.url_name if match and match.url_name else 'unmatched',
+            request.method,
+            time.perf_counter() - started,
+        )
+        if stats.queries > settings.QUERY_BUDGET:
+            self.log_budget_exceeded(request, stats)
+        return response
+
+    @staticmethod
+    def log_budget_exceeded(request, stats):
+        top = '\n'.join(
+            f'  {count} x {sql[:SQL_PREVIEW_LENGTH]}'
+            for sql, count in stats.statements.most_common(3)
+        )
+        logger.warning(
+            f'{request.method} {request.get_full_path()}: '
+            f'{stats.queries} SQL-запросов при бюджете '
+            f'{settings.QUERY_BUDGET}, чаще всего:\n{top}'
+        )
@@ -1,5 +1,210 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core import exceptions
+from django.core.exceptions import FieldError
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    """Постраничная пагинация с размером страницы из параметра limit.
+    При наличии в запросе параметра cursor (в том числе пустого - первая
+    страница) переключается в режим keyset-пагинации: страница выбирается
+    условием по ключу сортировки запроса (для рецептов - (pub_date, id)),
+    без OFFSET и без COUNT(*). Поле count в этом режиме приблизительное
+    (по статистике PostgreSQL) или null. Списки (не QuerySet) всегда
+    разбиваются на страницы по номеру."""
+
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор.'
+    invalid_ordering_message = (
+        'Курсорная пагинация недоступна для выбранной сортировки.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = (
+            self.cursor_query_param in request.query_params
+            and isinstance(queryset, QuerySet)
+        )
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.approximate_count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        return self.get_cursor_link(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        return self.get_cursor_link(self.previous_position, reverse=True)
+
+    def paginate_keyset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_keyset_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        self.approximate_count = self.get_approximate_count(queryset)
+        if position is not None:
+            if len(position) != len(ordering):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                queryset = queryset.filter(
+                    self.get_keyset_filter(ordering, position)
+                )
+            except (ValueError, TypeError, FieldError,
+                    exceptions.ValidationError):
+                # Значения позиции из курсора приводятся к типам полей
+                # при построении условия; ошибка значит подмененный курсор.
+                raise NotFound(self.invalid_cursor_message)
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            ordering = [self.invert(field) for field in ordering]
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        self.next_position = (
+            self.get_position(results[-1], ordering)
+            if has_next and results else None
+        )
+        self.previous_position = (
+            self.get_position(results[0], ordering)
+            if has_previous and results else None
+        )
+        return results
+
+    def get_keyset_ordering(self, queryset):
+        """Ключ keyset-пагинации: сортировка запроса (явная или из Meta
+        модели), дополненная первичным ключом для однозначности. Допускаются
+        только поля модели и аннотации, но не связанные поля и выражения."""
+        query = queryset.query
+        ordering = list(
+            query.order_by
+            or (query.default_ordering and queryset.model._meta.ordering)
+            or ()
+        )
+        pk_name = queryset.model._meta.pk.name
+        fields = []
+        for field in ordering:
+            if not isinstance(field, str) or LOOKUP_SEP in field:
+                raise ValidationError(self.invalid_ordering_message)
+            if field.lstrip('-') == 'pk':
+                field = field.replace('pk', pk_name)
+            fields.append(field)
+        if pk_name not in (field.lstrip('-') for field in fields):
+            descending = bool(fields) and fields[-1].startswith('-')
+            fields.append(f'-{pk_name}' if descending else pk_name)
+        return fields
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def get_keyset_filter(ordering, position):
+        """Условие «строго после позиции» для составного ключа:
+        (a > x) OR (a = x AND b > y) OR ... с учетом направлений.
+        Дополнительное условие a >= x ограничивает диапазон просмотра
+        индекса по ключу сортировки: страница читается с позиции, а не
+        с начала индекса."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        first, value = ordering[0], position[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': value}) & condition
+
+    @staticmethod
+    def get_position(obj, ordering):
+        position = []
+        for field in ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return list(cursor['p']), bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        cursor = {'p': position}
+        if reverse:
+            cursor['r'] = 1
+        return force_str(base64.urlsafe_b64encode(
+            json.dumps(cursor, separators=(',', ':')).encode()
+        ))
+
+    def get_cursor_link(self, position, reverse):
+        if position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param,
+        )
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(position, reverse),
+        )
+
+    @staticmethod
+    def get_approximate_count(queryset):
+        """Приблизительное количество строк без COUNT(*): для запроса без
+        условий - pg_class.reltuples, для отфильтрованного - оценка
+        планировщика. На других СУБД возвращает None."""
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+                return int(row[0]) if row and row[0] >= 0 else None
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,19 @@
+import hmac
+
+from django.conf import settings
+from rest_framework import permissions
+
+
+class IsStaffOrMetricsToken(permissions.BasePermission):
+    """Доступ для администраторов или по токену METRICS_TOKEN
+    в заголовке Authorization: Bearer <токен> (для Prometheus)."""
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        token = settings.METRICS_TOKEN
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(token) and hmac.compare_digest(
+            header.encode(),
+            f'Bearer {token}'.encode(),
+        )
@@ -0,0 +1,68 @@
+from django.db import connections, router
+
+
+def add_relation(model, **values):
+    """Добавляет строку связи пользователя с рецептом или автором
+    (избранное, корзина, подписка) одним INSERT ... ON CONFLICT DO NOTHING
+    по id, без чтения и сохранения связанных объектов. Возвращает False,
+    если такая связь уже есть (ограничение уникальности модели); при
+    одновременной вставке одной связи добавит ее только один запрос."""
+    return bool(add_relations(model, None, [values]))
+
+
+def add_relations(model, returning, rows):
+    """Добавляет строки связей rows (словари поле - id с одинаковыми
+    ключами) одним многострочным INSERT ... ON CONFLICT DO NOTHING.
+    Возвращает значения поля returning только фактически добавленных
+    строк (RETURNING): уже существующие связи и связи, добавленные
+    одновременным запросом, в результат не попадают. Без returning
+    возвращает количество добавленных строк."""
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = list(rows[0])
+    columns = ', '.join(
+        quote(model._meta.get_field(name).column) for name in fields
+    )
+    placeholders = ', '.join(
+        [f'({", ".join(["%s"] * len(fields))})'] * len(rows)
+    )
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+        f'VALUES {placeholders} ON CONFLICT DO NOTHING'
+    )
+    if returning is not None:
+        sql += f' RETURNING {quote(model._meta.get_field(returning).column)}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [row[name] for row in rows for name in fields])
+        if returning is None:
+            return cursor.rowcount
+        return [row[0] for row in cursor.fetchall()]
+
+
+def remove_relations(model, returning, **filters):
+    """Удаляет строки связей по условиям filters (поле - id или список id)
+    одним DELETE ... RETURNING и возвращает значения поля returning
+    фактически удаленных строк: связь, удаленная одновременным запросом,
+    в результат не попадает."""
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    conditions = []
+    params = []
+    for name, value in filters.items():
+        column = quote(model._meta.get_field(name).column)
+        if isinstance(value, (list, tuple)):
+            conditions.append(
+                f'{column} IN ({", ".join(["%s"] * len(value))})'
+            )
+            params.extend(value)
+        else:
+            conditions.append(f'{column} = %s')
+            params.append(value)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {" AND ".join(conditions)} '
+            f'RETURNING {quote(model._meta.get_field(returning).column)}',
+            params,
+        )
+        return [row[0] for row in cursor.fetchall()]
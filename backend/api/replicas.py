@@ -0,0 +1,96 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+class ReplicaState:
+    """Маршрутизация текущего запроса: выбранная на весь запрос реплика,
+    признак закрепления за основной базой (после записи) и признак того,
+    что данные читались с реплики."""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.pinned = False
+        self.primary_only = False
+        self.used = False
+
+
+replica_state = ContextVar('replica_state', default=None)
+
+
+class ReplicaRouter:
+    """Роутер баз данных: чтение в рамках replica_reads() выполняется
+    на реплике, все остальное - на основной базе (default).
+    Запрос закрепляется за основной базой после первой записи, чтобы
+    прочитать только что записанные данные; внутри транзакции чтение
+    также идет в основную базу."""
+
+    def db_for_read(self, model, **hints):
+        state = replica_state.get()
+        if (
+            state is None
+            or state.pinned
+            or state.primary_only
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        state.used = True
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = replica_state.get()
+        if state is not None:
+            state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Включает чтение с реплик внутри блока (если реплики настроены)."""
+    token = replica_state.set(
+        ReplicaState(random.choice(settings.DATABASE_REPLICAS))
+        if enabled and settings.DATABASE_REPLICAS else None
+    )
+    try:
+        yield
+    finally:
+        replica_state.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Чтение с основной базы внутри блока, например при заполнении
+    кэша: данные с отстающей реплики остались бы в кэше надолго."""
+    state = replica_state.get()
+    if state is None or state.primary_only:
+        yield
+        return
+    state.primary_only = True
+    try:
+        yield
+    finally:
+        state.primary_only = False
+
+
+def read_from_replica():
+    state = replica_state.get()
+    return state is not None and state.used
+
+
+class ReplicaReadMixin:
+    """Чтение в безопасных (SAFE_METHODS) запросах к вьюсету выполняется
+    на репликах; запросы на изменение работают с основной базой."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(request.method in SAFE_METHODS):
+            return super().dispatch(request, *args, **kwargs)
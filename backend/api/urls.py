@@ -4,6 +4,8 @@ from recipes.views import (FavoriteViewSet, IngredientViewSet, RecipeViewSet,
 from rest_framework.routers import DefaultRouter
 from users.views import SubscriptionViewSet, UserViewSet
 
+from .views import CacheStatsView, MetricsView
+
 app_name = 'api'
 
 router = DefaultRouter()
@@ -30,4 +32,6 @@ router.register('ingredients', IngredientViewSet, basename='ingredients')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache_stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
@@ -0,0 +1,73 @@
+from jobs.queue import queue_stats
+from recipes.cache import FRAGMENT_HITS, FRAGMENT_MISSES
+from rest_framework import permissions
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .cache import get_counters
+from .metrics import render_metrics
+from .permissions import IsStaffOrMetricsToken
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return '\n'.join(
+            f'# {key}: {value}' for key, value in data.items()
+        ).encode(self.charset)
+
+
+class CacheStatsView(APIView):
+    """Статистика кэша фрагментов рецептов (только для администраторов):
+    попадания, промахи и доля попаданий."""
+
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        counters = get_counters(FRAGMENT_HITS, FRAGMENT_MISSES)
+        hits, misses = counters[FRAGMENT_HITS], counters[FRAGMENT_MISSES]
+        return Response({
+            'recipe_fragments': {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': hits / (hits + misses) if hits + misses else None,
+            },
+        })
+
+
+class MetricsView(APIView):
+    """Метрики процесса в формате Prometheus: гистограммы времени
+    обработки, SQL-запросов и сериализации по маршрутам API
+    (api.middleware.MetricsMiddleware), счетчики кэша фрагментов
+    рецептов, размер и задержка фоновой очереди задач (jobs)."""
+
+    permission_classes = (IsStaffOrMetricsToken,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        counters = get_counters(FRAGMENT_HITS, FRAGMENT_MISSES)
+        jobs, lag = queue_stats()
+        return Response(render_metrics((
+            '# TYPE foodgram_recipe_fragment_cache_hits_total counter',
+            'foodgram_recipe_fragment_cache_hits_total '
+            f'{counters[FRAGMENT_HITS]}',
+            '# TYPE foodgram_recipe_fragment_cache_misses_total counter',
+            'foodgram_recipe_fragment_cache_misses_total '
+            f'{counters[FRAGMENT_MISSES]}',
+            '# HELP foodgram_jobs Задачи фоновой очереди.',
+            '# TYPE foodgram_jobs gauge',
+            *(
+                f'foodgram_jobs{{task="{task}",status="{status}"}} {count}'
+                for (task, status), count in sorted(jobs.items())
+            ),
+            '# HELP foodgram_jobs_lag_seconds Время ожидания самой старой '
+            'готовой к выполнению задачи.',
+            '# TYPE foodgram_jobs_lag_seconds gauge',
+            f'foodgram_jobs_lag_seconds {lag}',
+        )))
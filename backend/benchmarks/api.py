@@ -0,0 +1,236 @@
+"""Нагрузочный бенчмарк основных эндпоинтов API.
+
+Генерирует данные (benchmarks.generate), загружает их командой load_data
+в отдельную тестовую базу и выполняет запросы к API в том же процессе
+через тестовый клиент DRF. Для каждого эндпоинта считает p50/p95/p99
+времени ответа, количество SQL-запросов и строк, полученных из базы,
+на один запрос. Результат пишется в JSON; с --baseline сравнивается
+с прошлым прогоном, и при регрессии больше --threshold скрипт
+завершается с кодом 1.
+
+Запуск из каталога backend:
+    python -m benchmarks.api --users 200 --recipes 5000 --output new.json
+    python -m benchmarks.api --baseline old.json --threshold 0.2
+"""
+import argparse
+import contextlib
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from benchmarks.common import (load_names, percentile, setup_django, summarize,
+                               test_database, write_report)
+from benchmarks.generate import generate
+from benchmarks.ingredient_search import build_queries
+
+ROW_COUNTERS = {
+    'fetchone': lambda result: result is not None,
+    'fetchmany': len,
+    'fetchall': len,
+}
+
+
+@contextlib.contextmanager
+def count_rows():
+    """Считает строки, полученные из базы через курсоры Django."""
+    from django.db.backends.utils import CursorWrapper
+    counter = {'rows': 0}
+
+    def wrap(name, count):
+        def method(self, *args, **kwargs):
+            result = getattr(self.cursor, name)(*args, **kwargs)
+            counter['rows'] += count(result)
+            return result
+        return method
+
+    for name, count in ROW_COUNTERS.items():
+        setattr(CursorWrapper, name, wrap(name, count))
+    try:
+        yield counter
+    finally:
+        for name in ROW_COUNTERS:
+            delattr(CursorWrapper, name)
+
+
+def configure():
+    """Настройки, близкие к рабочим: без DEBUG (и debug_toolbar)
+    и без ограничения частоты запросов."""
+    from django.conf import settings
+    from rest_framework.settings import api_settings
+    settings.DEBUG = False
+    settings.INTERNAL_IPS = []
+    settings.REST_FRAMEWORK = {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_CLASSES': [],
+    }
+    api_settings.reload()
+
+
+def populate(path):
+    from django.core.management import call_command
+    logging.disable(logging.INFO)
+    try:
+        call_command('load_ingredients')
+        call_command('load_data', path)
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def build_requests(args):
+    """Список запросов по эндпоинтам: {имя: [(пользователь, url), ...]}.
+    Пользователи и объекты выбираются детерминированно."""
+    from recipes.models import Ingredient, Recipe
+    from users.models import User
+    rnd = random.Random(args.seed)
+    users = list(User.objects.order_by('id'))
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    followers = list(User.objects.filter(
+        subscriber__isnull=False,
+    ).distinct().order_by('id'))
+    buyers = list(User.objects.filter(
+        shopping_cart__isnull=False,
+    ).distinct().order_by('id'))
+    pages = max(1, len(recipe_ids) // 6)
+    queries = build_queries(load_names())
+    assert Ingredient.objects.exists(), 'Ингредиенты не загружены'
+    count = args.requests
+    return {
+        'recipe_list': [
+            (rnd.choice(users), f'/api/recipes/?page={rnd.randint(1, pages)}')
+            for _ in range(count)
+        ],
+        'recipe_detail': [
+            (rnd.choice(users), f'/api/recipes/{rnd.choice(recipe_ids)}/')
+            for _ in range(count)
+        ],
+        'subscriptions': [
+            (rnd.choice(followers),
+             '/api/users/subscriptions/?recipes_limit=3')
+            for _ in range(count)
+        ] if followers else [],
+        'ingredient_search': [
+            (None, f'/api/ingredients/?name={quote(rnd.choice(queries))}')
+            for _ in range(count)
+        ],
+        'shopping_list': [
+            (rnd.choice(buyers), '/api/recipes/download_shopping_cart/')
+            for _ in range(count)
+        ] if buyers else [],
+    }
+
+
+def run_request(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f'{url}: {response.status_code}')
+    if response.streaming:
+        b''.join(response.streaming_content)
+
+
+def measure(requests, cold):
+    """Выполняет запросы эндпоинта; cold - очищать кэш перед каждым."""
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+    client = APIClient()
+    durations, queries, rows = [], [], []
+    for user, url in requests:
+        client.force_authenticate(user)
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            with count_rows() as counter:
+                started = time.perf_counter()
+                run_request(client, url)
+                durations.append(time.perf_counter() - started)
+        queries.append(len(context.captured_queries))
+        rows.append(counter['rows'])
+    return {
+        **summarize(durations),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+        'rows_mean': round(sum(rows) / len(rows), 2),
+        'rows_p95': percentile(rows, 95),
+    }
+
+
+def compare(report, baseline, threshold):
+    """Регрессии относительно baseline: рост p95 времени ответа или
+    среднего количества запросов больше чем на threshold (доля)."""
+    regressions = []
+    for name, result in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('p95_ms', 'queries_mean'):
+            if result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(
+                    f'{name}: {metric} {previous[metric]} -> {result[metric]}'
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--cold', action='store_true',
+                        help='очищать кэш перед каждым запросом')
+    parser.add_argument('--endpoint', action='append',
+                        help='измерять только указанные эндпоинты')
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    setup_django()
+    configure()
+    from django.db import connection
+
+    with test_database(), tempfile.TemporaryDirectory() as path:
+        counts = generate(
+            path,
+            users=args.users,
+            recipes=args.recipes,
+            seed=args.seed,
+        )
+        started = time.perf_counter()
+        populate(path)
+        load_seconds = time.perf_counter() - started
+        requests = build_requests(args)
+        endpoints = {}
+        for name, endpoint_requests in requests.items():
+            if not endpoint_requests or (
+                args.endpoint and name not in args.endpoint
+            ):
+                continue
+            measure(endpoint_requests[:args.warmup], args.cold)
+            endpoints[name] = measure(endpoint_requests, args.cold)
+        report = {
+            'benchmark': 'api',
+            'vendor': connection.vendor,
+            'data': counts,
+            'cold_cache': args.cold,
+            'load_seconds': round(load_seconds, 3),
+            'endpoints': endpoints,
+        }
+    write_report(report, args.output)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(report, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f'Регрессия: {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import contextlib
+import csv
+import json
+import math
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    """Настраивает Django для запуска бенчмарка как отдельного скрипта
+    (python -m benchmarks.<имя> из каталога backend)."""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(keepdb=False):
+    """Создает отдельную тестовую базу (как test runner Django), чтобы
+    бенчмарк не трогал рабочие данные, и удаляет ее по завершении."""
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+        keepdb=keepdb,
+    )
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(
+            old_name,
+            verbosity=0,
+            keepdb=keepdb,
+        )
+
+
+def load_names(path=None):
+    """Пары (наименование, единица измерения) из data/ingredients.csv
+    без повторов наименований."""
+    path = path or os.path.join(BACKEND_DIR, 'data', 'ingredients.csv')
+    with open(path, newline='', encoding='utf-8') as csvfile:
+        return list(dict(csv.reader(csvfile)).items())
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(samples):
+    """Сводка по замерам в миллисекундах."""
+    return {
+        'runs': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+    }
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def write_report(report, path):
+    if path:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,193 @@
+"""Детерминированный генератор тестовых данных для команды load_data.
+
+Создает теги, пользователей, рецепты (с тегами и ингредиентами),
+избранное, корзины и подписки. Популярность авторов, рецептов
+и ингредиентов распределена по закону Ципфа: несколько авторов
+с тысячами подписчиков и рецептов, длинный хвост - с единицами.
+При одинаковых параметрах и --seed результат всегда одинаков.
+
+Запуск из каталога backend:
+    python -m benchmarks.generate --users 1000 --recipes 100000 \\
+        --output data/seed
+    python manage.py load_ingredients
+    python manage.py load_data data/seed
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+
+from benchmarks.common import load_names
+
+TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+)
+PASSWORD = 'benchmark-password'
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса для random.choices: вес элемента i - 1/(i+1)^s."""
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** exponent for rank in range(size)
+    ))
+
+
+def sample_distinct(rnd, population, cum_weights, count):
+    """До count различных элементов с учетом весов."""
+    chosen = dict.fromkeys(rnd.choices(
+        population,
+        cum_weights=cum_weights,
+        k=count * 2,
+    ))
+    return list(chosen)[:count]
+
+
+def write_jsonl(path, records):
+    """Пишет записи в файл jsonl, возвращает их количество."""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def username(index):
+    return f'user{index}'
+
+
+def recipe_records(rnd, authors, names, ingredient_weights, ingredients):
+    for index, author in enumerate(authors):
+        yield {
+            'author': username(author),
+            'name': f'Рецепт {index}',
+            'text': f'Описание рецепта {index}',
+            'cooking_time': rnd.randint(5, 180),
+            'tags': [
+                slug for _, slug, _ in rnd.sample(TAGS, rnd.randint(1, 2))
+            ],
+            'ingredients': [
+                {'name': name, 'amount': rnd.randint(1, 500)}
+                for name in sample_distinct(
+                    rnd,
+                    names,
+                    ingredient_weights,
+                    rnd.randint(*ingredients),
+                )
+            ],
+        }
+
+
+def relation_records(rnd, users, authors, recipe_weights, average):
+    """Избранное или корзина: каждый пользователь выбирает в среднем
+    average рецептов, популярные рецепты выбираются чаще."""
+    for user in range(users):
+        for recipe in sample_distinct(
+            rnd,
+            range(len(authors)),
+            recipe_weights,
+            rnd.randint(0, 2 * average),
+        ):
+            yield {
+                'user': username(user),
+                'author': username(authors[recipe]),
+                'recipe': f'Рецепт {recipe}',
+            }
+
+
+def subscription_records(rnd, users, author_weights, follows):
+    """Граф подписок: популярные авторы получают больше подписчиков."""
+    for user in range(users):
+        for author in sample_distinct(
+            rnd,
+            range(users),
+            author_weights,
+            rnd.randint(0, 2 * follows),
+        ):
+            if author != user:
+                yield {'user': username(user), 'author': username(author)}
+
+
+def generate(path, users=200, recipes=5000, seed=0, ingredients=(3, 12),
+             favorites=20, cart=5, follows=10, exponent=1.1):
+    """Пишет в папку path файлы tags.jsonl, users.jsonl, recipes.jsonl,
+    favorites.jsonl, shopping_cart.jsonl и subscriptions.jsonl.
+    favorites, cart и follows - среднее количество рецептов в избранном,
+    в корзине и подписок на пользователя. Возвращает количество записей
+    по файлам."""
+    rnd = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    names = [name for name, _ in load_names()]
+    rnd.shuffle(names)
+    ingredient_weights = zipf_weights(len(names), exponent)
+    author_weights = zipf_weights(users, exponent)
+    recipe_weights = zipf_weights(recipes, exponent)
+    authors = rnd.choices(
+        range(users),
+        cum_weights=author_weights,
+        k=recipes,
+    )
+    counts = {}
+
+    counts['tags'] = write_jsonl(os.path.join(path, 'tags.jsonl'), (
+        {'name': name, 'slug': slug, 'color': color}
+        for name, slug, color in TAGS
+    ))
+    counts['users'] = write_jsonl(os.path.join(path, 'users.jsonl'), (
+        {
+            'username': username(index),
+            'email': f'{username(index)}@example.com',
+            'first_name': f'Имя{index}',
+            'last_name': f'Фамилия{index}',
+            'password': PASSWORD,
+        }
+        for index in range(users)
+    ))
+
+    counts['recipes'] = write_jsonl(
+        os.path.join(path, 'recipes.jsonl'),
+        recipe_records(rnd, authors, names, ingredient_weights, ingredients),
+    )
+
+    for file, average in (('favorites', favorites), ('shopping_cart', cart)):
+        counts[file] = write_jsonl(
+            os.path.join(path, f'{file}.jsonl'),
+            relation_records(rnd, users, authors, recipe_weights, average),
+        )
+
+    counts['subscriptions'] = write_jsonl(
+        os.path.join(path, 'subscriptions.jsonl'),
+        subscription_records(rnd, users, author_weights, follows),
+    )
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--favorites', type=int, default=20)
+    parser.add_argument('--cart', type=int, default=5)
+    parser.add_argument('--follows', type=int, default=10)
+    parser.add_argument('--exponent', type=float, default=1.1)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    counts = generate(
+        args.output,
+        users=args.users,
+        recipes=args.recipes,
+        seed=args.seed,
+        favorites=args.favorites,
+        cart=args.cart,
+        follows=args.follows,
+        exponent=args.exponent,
+    )
+    print(json.dumps(counts, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
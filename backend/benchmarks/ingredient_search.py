@@ -0,0 +1,106 @@
+"""Бенчмарк поиска ингредиентов (автодополнение на фронтенде).
+
+Загружает data/ingredients.csv, размноженный в --scale раз, в отдельную
+тестовую базу и сравнивает прежний фильтр (name__icontains + сортировка
+Case/When по istartswith) с search_ingredients: на PostgreSQL - индексы
+pg_trgm, на прочих СУБД - индекс в памяти процесса.
+
+Запуск из каталога backend:
+    python -m benchmarks.ingredient_search --scale 100 --output result.json
+"""
+import argparse
+
+from benchmarks.common import (load_names, setup_django, summarize,
+                               test_database, timed, write_report)
+
+
+def build_queries(names):
+    """Запросы, которые фронтенд шлет при наборе: нарастающие префиксы
+    реальных наименований, вхождения в середину слова и опечатки."""
+    queries = []
+    for name, _ in names[::len(names) // 20]:
+        word = name.split()[0]
+        queries.extend(word[:length] for length in range(1, len(word) + 1))
+        if len(word) > 4:
+            queries.append(word[1:4])
+            queries.append(word[:2] + word[3:])
+    return queries
+
+
+def populate(names, scale, batch_size):
+    from recipes.models import Ingredient
+    Ingredient.objects.bulk_create(
+        (
+            Ingredient(
+                name=f'{name} {copy}' if copy else name,
+                measurement_unit=measurement_unit,
+            )
+            for copy in range(scale)
+            for name, measurement_unit in names
+        ),
+        batch_size=batch_size,
+    )
+
+
+def legacy_search(queryset, value):
+    from django.db.models import Case, Value, When
+    return queryset.filter(name__icontains=value).annotate(
+        order=Case(
+            When(name__istartswith=value, then=Value(1)),
+            default=Value(2)
+        )
+    ).order_by('order')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from recipes.models import Ingredient
+    from recipes.search import reset_index, search_ingredients
+
+    names = load_names()
+    queries = build_queries(names)
+    with test_database():
+        elapsed, _ = timed(populate, names, args.scale, args.batch_size)
+        reset_index()
+        queryset = Ingredient.objects.all()
+        index_build, _ = timed(
+            lambda: list(search_ingredients(queryset, 'а', args.limit))
+        )
+        results = {'legacy': [], 'search': []}
+        for _ in range(args.repeat):
+            for value in queries:
+                results['legacy'].append(timed(
+                    lambda: list(legacy_search(queryset, value))
+                )[0])
+                results['search'].append(timed(
+                    lambda: list(
+                        search_ingredients(queryset, value, args.limit)
+                    )
+                )[0])
+        report = {
+            'benchmark': 'ingredient_search',
+            'vendor': connection.vendor,
+            'rows': len(names) * args.scale,
+            'queries': len(queries),
+            'limit': args.limit,
+            'load_seconds': round(elapsed, 3),
+            'first_search_seconds': round(index_build, 3),
+            'results': {
+                method: summarize(samples)
+                for method, samples in results.items()
+            },
+        }
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Бенчмарк подбора рецептов по продуктам (/recipes/by_ingredients/).
+
+Создает в отдельной тестовой базе --ingredients ингредиентов и --recipes
+рецептов по --min-size..--max-size ингредиентов; популярность
+ингредиентов распределена по закону Ципфа (соль и мука есть в большей
+части рецептов), и строит индекс подбора (rebuild_index). Затем выполняет
+подбор так же, как представление: количество найденных рецептов (COUNT
+для пагинации) и первая страница
+(--limit рецептов) для наборов продуктов трех видов - только самые
+частые ингредиенты (common), случайные с учетом частоты (mixed) и редкие
+(rare), с missing_max от 0 до --missing-max. Считаются p50/p95/p99
+времени на запрос и доля запросов, уложившихся в --target-ms.
+
+Запуск из каталога backend:
+    python -m benchmarks.pantry --recipes 100000
+    python -m benchmarks.pantry --recipes 1000000 --target-ms 50 \\
+        --output pantry.json
+"""
+import argparse
+import random
+
+from benchmarks.common import (setup_django, summarize, test_database, timed,
+                               write_report)
+from benchmarks.generate import sample_distinct, zipf_weights
+
+
+def populate(args, rnd):
+    """Ингредиенты, автор и рецепты с составами; возвращает id
+    ингредиентов в порядке убывания частоты."""
+    from recipes.models import Ingredient, IngredientAmount, Recipe
+    from users.models import User
+    author = User.objects.create(
+        username='author',
+        email='author@example.com',
+        first_name='author',
+        last_name='author',
+    )
+    ingredient_ids = [
+        ingredient.id for ingredient in Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient {number}', measurement_unit='г')
+            for number in range(args.ingredients)
+        )
+    ]
+    weights = zipf_weights(len(ingredient_ids), args.exponent)
+    for start in range(0, args.recipes, args.batch_size):
+        count = min(args.batch_size, args.recipes - start)
+        compositions = [
+            sample_distinct(
+                rnd,
+                ingredient_ids,
+                weights,
+                rnd.randint(args.min_size, args.max_size),
+            )
+            for _ in range(count)
+        ]
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f'recipe {start + number}',
+                cooking_time=1,
+            )
+            for number, composition in enumerate(compositions)
+        )
+        IngredientAmount.objects.bulk_create(
+            (
+                IngredientAmount(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_id,
+                    amount=1,
+                )
+                for recipe, composition in zip(recipes, compositions)
+                for ingredient_id in composition
+            ),
+            batch_size=args.batch_size,
+        )
+    return ingredient_ids
+
+
+def build_pantries(ingredient_ids, args, rnd):
+    """Наборы продуктов по видам."""
+    weights = zipf_weights(len(ingredient_ids), args.exponent)
+    rare = ingredient_ids[len(ingredient_ids) // 2:]
+    pantries = {'common': [], 'mixed': [], 'rare': []}
+    for _ in range(args.queries):
+        size = rnd.randint(3, args.pantry_size)
+        pantries['common'].append(ingredient_ids[:size])
+        pantries['mixed'].append(
+            sample_distinct(rnd, ingredient_ids, weights, size)
+        )
+        pantries['rare'].append(rnd.sample(rare, size))
+    return pantries
+
+
+def lookup(pantry, missing_max, limit):
+    """Подбор как в представлении: COUNT для пагинации и первая
+    страница."""
+    from recipes.models import Recipe
+    from recipes.pantry import find_recipes
+    recipes = find_recipes(Recipe.objects.all(), pantry, missing_max)
+    return recipes.count(), list(recipes.values_list('id', flat=True)[:limit])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--ingredients', type=int, default=2000)
+    parser.add_argument('--min-size', type=int, default=3)
+    parser.add_argument('--max-size', type=int, default=15)
+    parser.add_argument('--exponent', type=float, default=1.1,
+                        help='показатель распределения Ципфа')
+    parser.add_argument('--pantry-size', type=int, default=10)
+    parser.add_argument('--missing-max', type=int, default=2)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=6)
+    parser.add_argument('--target-ms', type=float, default=50)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from recipes.pantry import rebuild_index
+
+    rnd = random.Random(args.seed)
+    with test_database():
+        elapsed, ingredient_ids = timed(populate, args, rnd)
+        index_elapsed, _ = timed(rebuild_index)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM ANALYZE')
+        pantries = build_pantries(ingredient_ids, args, rnd)
+        results = {}
+        for kind, kind_pantries in pantries.items():
+            samples = []
+            found = []
+            for pantry in kind_pantries:
+                for missing_max in range(args.missing_max + 1):
+                    duration, (count, _) = timed(
+                        lookup, pantry, missing_max, args.limit,
+                    )
+                    samples.append(duration)
+                    found.append(count)
+            results[kind] = {
+                **summarize(samples),
+                'within_target': round(
+                    sum(sample * 1000 <= args.target_ms
+                        for sample in samples) / len(samples),
+                    3,
+                ),
+                'found_max': max(found),
+            }
+        report = {
+            'benchmark': 'pantry',
+            'vendor': connection.vendor,
+            'recipes': args.recipes,
+            'ingredients': args.ingredients,
+            'target_ms': args.target_ms,
+            'load_seconds': round(elapsed, 3),
+            'index_seconds': round(index_elapsed, 3),
+            'results': results,
+        }
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
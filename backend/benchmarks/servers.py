@@ -0,0 +1,258 @@
+"""Сравнение WSGI- и ASGI-конфигураций сервера при высокой конкуренции.
+
+Генерирует и загружает данные (как benchmarks.api) в отдельную тестовую
+базу, затем по очереди запускает gunicorn с синхронными воркерами
+(foodgram.wsgi, команда run) и gunicorn с воркерами uvicorn
+(foodgram.asgi, команда run-asgi) с одинаковым количеством процессов.
+Каждый эндпоинт нагружается --concurrency одновременными клиентами
+в течение --duration секунд; для каждого считаются запросы в секунду,
+ошибки и p50/p95/p99 времени ответа. --slow-clients добавляет клиентов,
+передающих запрос по байту в --slow-pause секунд (медленная сеть):
+синхронный воркер занят таким клиентом целиком, ASGI-воркер - нет.
+
+Запуск из каталога backend:
+    python -m benchmarks.servers --concurrency 64 --duration 10
+    python -m benchmarks.servers --slow-clients 16 --output servers.json
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.api import build_requests, populate
+from benchmarks.common import (BACKEND_DIR, setup_django, summarize,
+                               test_database, write_report)
+from benchmarks.generate import generate
+
+SETTINGS_MODULE = 'benchmarks.settings'
+SERVERS = {
+    'wsgi': ('foodgram.wsgi:application', 'sync'),
+    'asgi': ('foodgram.asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+ENDPOINTS = (
+    'recipe_list',
+    'recipe_detail',
+    'tags',
+    'ingredient_search',
+    'shopping_list',
+)
+SLOW_PATH = '/api/tags/'
+
+
+def make_request(path, token=None):
+    lines = [f'GET {path} HTTP/1.1', 'Host: localhost', 'Connection: close']
+    if token:
+        lines.append(f'Authorization: Token {token}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+async def fetch(port, request):
+    """Выполняет запрос в новом соединении и читает ответ до закрытия
+    соединения сервером. Возвращает код ответа."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+    return int(status_line.split()[1]) if status_line else None
+
+
+async def client(port, requests, deadline, result):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status = await fetch(port, next(requests))
+        except (OSError, ValueError, IndexError):
+            status = None
+        if status == 200:
+            result['durations'].append(time.perf_counter() - started)
+        else:
+            result['errors'] += 1
+
+
+async def slow_client(port, deadline, pause):
+    request = make_request(SLOW_PATH)
+    while time.perf_counter() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            for byte in request:
+                writer.write(bytes((byte,)))
+                await writer.drain()
+                await asyncio.sleep(pause)
+            await reader.read()
+            writer.close()
+        except OSError:
+            await asyncio.sleep(pause)
+
+
+async def load(port, requests, args):
+    """Нагрузка одного эндпоинта: --concurrency клиентов по кругу
+    выполняют запросы из requests, параллельно работают медленные
+    клиенты."""
+    deadline = time.perf_counter() + args.duration
+    requests = itertools.cycle(requests)
+    result = {'durations': [], 'errors': 0}
+    await asyncio.gather(
+        *(client(port, requests, deadline, result)
+          for _ in range(args.concurrency)),
+        *(slow_client(port, deadline, args.slow_pause)
+          for _ in range(args.slow_clients)),
+    )
+    return {
+        'rps': round(len(result['durations']) / args.duration, 1),
+        'errors': result['errors'],
+        **(summarize(result['durations']) if result['durations'] else {}),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, port, args, env):
+    application, worker_class = SERVERS[name]
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', application,
+            f'--bind=127.0.0.1:{port}',
+            f'--workers={args.workers}',
+            f'--worker-class={worker_class}',
+            '--log-level=warning',
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    request = make_request(SLOW_PATH)
+    started = time.monotonic()
+    while time.monotonic() - started < args.startup_timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f'Сервер {name} завершился при запуске')
+        try:
+            if asyncio.run(fetch(port, request)) == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'Сервер {name} не запустился')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def build_targets(args):
+    """Запросы по эндпоинтам в виде готовых байтов HTTP-запроса
+    с токеном пользователя."""
+    from rest_framework.authtoken.models import Token
+    tokens = {}
+
+    def get_token(user):
+        if user is None:
+            return None
+        if user.id not in tokens:
+            tokens[user.id] = Token.objects.get_or_create(user=user)[0].key
+        return tokens[user.id]
+
+    requests = build_requests(args)
+    requests['tags'] = [(None, '/api/tags/')]
+    return {
+        name: [make_request(url, get_token(user)) for user, url in pairs]
+        for name, pairs in requests.items()
+        if pairs and name in args.endpoint
+    }
+
+
+def run_server(name, targets, args, env):
+    port = free_port()
+    process = start_server(name, port, args, env)
+    try:
+        return {
+            endpoint: asyncio.run(load(port, requests, args))
+            for endpoint, requests in targets.items()
+        }
+    finally:
+        stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='различных запросов на эндпоинт')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='процессов gunicorn для каждого сервера')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--slow-clients', type=int, default=0)
+    parser.add_argument('--slow-pause', type=float, default=0.1)
+    parser.add_argument('--startup-timeout', type=float, default=30)
+    parser.add_argument('--server', action='append', choices=SERVERS,
+                        help='запускать только указанные серверы')
+    parser.add_argument('--endpoint', action='append',
+                        help='измерять только указанные эндпоинты')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    args.endpoint = args.endpoint or ENDPOINTS
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = SETTINGS_MODULE
+    setup_django()
+    from django.db import connection
+
+    with tempfile.TemporaryDirectory() as path:
+        if connection.vendor == 'sqlite':
+            # Серверы работают в отдельных процессах, поэтому тестовая
+            # база SQLite должна быть файлом, а не базой в памяти.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                path, 'servers.sqlite3',
+            )
+        with test_database():
+            counts = generate(
+                os.path.join(path, 'data'),
+                users=args.users,
+                recipes=args.recipes,
+                seed=args.seed,
+            )
+            populate(os.path.join(path, 'data'))
+            targets = build_targets(args)
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': SETTINGS_MODULE,
+                'DB_NAME': connection.settings_dict['NAME'],
+            }
+            connection.close()
+            servers = {
+                name: run_server(name, targets, args, env)
+                for name in args.server or SERVERS
+            }
+            report = {
+                'benchmark': 'servers',
+                'vendor': connection.vendor,
+                'data': counts,
+                'workers': args.workers,
+                'concurrency': args.concurrency,
+                'slow_clients': args.slow_clients,
+                'duration': args.duration,
+                'servers': servers,
+            }
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""Настройки серверов, запускаемых бенчмарками benchmarks.servers
+и benchmarks.uploads: рабочие настройки проекта без DEBUG
+(и debug_toolbar) и без ограничения частоты запросов; медиафайлы -
+в каталоге BENCHMARK_MEDIA_ROOT, если он задан."""
+import os
+
+from foodgram.settings import *  # noqa: F401,F403
+from foodgram.settings import MEDIA_ROOT, REST_FRAMEWORK
+
+DEBUG = False
+INTERNAL_IPS = []
+REST_FRAMEWORK = {**REST_FRAMEWORK, 'DEFAULT_THROTTLE_CLASSES': []}
+MEDIA_ROOT = os.getenv('BENCHMARK_MEDIA_ROOT', default=MEDIA_ROOT)
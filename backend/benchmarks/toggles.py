@@ -0,0 +1,223 @@
+"""Пропускная способность переключения избранного, корзины и подписок.
+
+Создает в отдельной тестовой базе --users пользователей с токенами,
+--authors авторов и --recipes рецептов, запускает gunicorn (foodgram.wsgi,
+--workers синхронных воркеров) и нагружает каждый вид связи --concurrency
+одновременными клиентами в течение --duration секунд: клиент от имени
+своего пользователя по кругу добавляет (POST) и удаляет (DELETE) связь
+со случайными рецептами или авторами - общими для всех клиентов, так что
+клиенты соперничают за строки счетчиков. Считаются переключения
+(пары POST + DELETE) в секунду, ошибки и p50/p95/p99 времени ответа.
+Затем для каждого вида связи одновременно отправляются --duplicates
+одинаковых POST одного пользователя: ровно один должен получить 201,
+остальные - 400. В конце хранимые счетчики (favorites_count, cart_count,
+followers_count) сравниваются с фактическим количеством связей.
+
+Запуск из каталога backend:
+    python -m benchmarks.toggles --concurrency 32 --duration 10
+    python -m benchmarks.toggles --kind favorite --output toggles.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.common import (setup_django, summarize, test_database,
+                               write_report)
+from benchmarks.servers import free_port, start_server, stop_server
+from benchmarks.uploads import headers, send
+
+SETTINGS_MODULE = 'benchmarks.settings'
+KINDS = {
+    'favorite': '/api/recipes/{}/favorite/',
+    'shopping_cart': '/api/recipes/{}/shopping_cart/',
+    'subscribe': '/api/users/{}/subscribe/',
+}
+
+
+def prepare(args):
+    """Пользователи с токенами, авторы и рецепты. Возвращает токены
+    пользователей, id рецептов и id авторов."""
+    from recipes.models import Recipe
+    from rest_framework.authtoken.models import Token
+    from users.models import User
+    users = User.objects.bulk_create(
+        User(
+            username=f'{role}{number}',
+            email=f'{role}{number}@example.com',
+            first_name=role,
+            last_name=role,
+        )
+        for role, count in (('user', args.users), ('author', args.authors))
+        for number in range(count)
+    )
+    users, authors = users[:args.users], users[args.users:]
+    tokens = Token.objects.bulk_create(
+        Token(user=user, key=Token.generate_key()) for user in users
+    )
+    recipes = Recipe.objects.bulk_create(
+        Recipe(
+            author=authors[number % len(authors)],
+            name=f'recipe {number}',
+            text='toggle',
+            cooking_time=1,
+        )
+        for number in range(args.recipes)
+    )
+    return (
+        [token.key for token in tokens],
+        [recipe.id for recipe in recipes],
+        [author.id for author in authors],
+    )
+
+
+def request(method, path, token):
+    return headers(method, path, token, 'application/json', 0)
+
+
+async def client(port, token, paths, deadline, result):
+    """Пары добавление + удаление по кругу до истечения времени."""
+    while time.perf_counter() < deadline:
+        path = next(paths)
+        started = time.perf_counter()
+        statuses = []
+        for method in ('POST', 'DELETE'):
+            try:
+                statuses.append(
+                    await send(port, request(method, path, token), b'')
+                )
+            except OSError:
+                statuses.append(None)
+        if statuses == [201, 204]:
+            result['durations'].append(time.perf_counter() - started)
+        else:
+            result['errors'] += 1
+
+
+def cycle_random(targets, template, rng):
+    while True:
+        yield template.format(rng.choice(targets))
+
+
+async def load(port, tokens, targets, template, args):
+    deadline = time.perf_counter() + args.duration
+    result = {'durations': [], 'errors': 0}
+    await asyncio.gather(*(
+        client(
+            port,
+            tokens[number % len(tokens)],
+            cycle_random(targets, template, random.Random(number)),
+            deadline,
+            result,
+        )
+        for number in range(args.concurrency)
+    ))
+    return {
+        'toggles_per_second': round(
+            len(result['durations']) / args.duration, 1,
+        ),
+        'errors': result['errors'],
+        **(summarize(result['durations']) if result['durations'] else {}),
+    }
+
+
+async def duplicates(port, token, path, count):
+    """count одновременных одинаковых POST; возвращает количество ответов
+    по кодам и удаляет созданную связь."""
+    statuses = await asyncio.gather(*(
+        send(port, request('POST', path, token), b'') for _ in range(count)
+    ))
+    await send(port, request('DELETE', path, token), b'')
+    return dict(Counter(str(status) for status in statuses))
+
+
+def counter_mismatches():
+    """Количество рецептов и авторов, у которых хранимый счетчик не равен
+    фактическому количеству связей."""
+    from django.db.models import Count, F
+    from recipes.models import Recipe
+    from users.models import User
+    return {
+        'favorites_count': Recipe.objects.annotate(
+            actual=Count('favorited'),
+        ).exclude(favorites_count=F('actual')).count(),
+        'cart_count': Recipe.objects.annotate(
+            actual=Count('in_shopping_cart'),
+        ).exclude(cart_count=F('actual')).count(),
+        'followers_count': User.objects.annotate(
+            actual=Count('subscribed'),
+        ).exclude(followers_count=F('actual')).count(),
+    }
+
+
+def run(args, env, context):
+    tokens, recipe_ids, author_ids = context
+    port = free_port()
+    server = start_server('wsgi', port, args, env)
+    try:
+        kinds = {}
+        for kind in args.kind or KINDS:
+            template = KINDS[kind]
+            targets = author_ids if kind == 'subscribe' else recipe_ids
+            kinds[kind] = asyncio.run(
+                load(port, tokens, targets, template, args)
+            )
+            kinds[kind]['duplicates'] = asyncio.run(duplicates(
+                port, tokens[0], template.format(targets[0]), args.duplicates,
+            ))
+    finally:
+        stop_server(server)
+    return kinds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--authors', type=int, default=20)
+    parser.add_argument('--recipes', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='процессов gunicorn')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--duplicates', type=int, default=8)
+    parser.add_argument('--startup-timeout', type=float, default=30)
+    parser.add_argument('--kind', action='append', choices=KINDS,
+                        help='измерять только указанные связи')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = SETTINGS_MODULE
+    setup_django()
+    from django.db import connection
+
+    with tempfile.TemporaryDirectory() as path:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                path, 'toggles.sqlite3',
+            )
+        with test_database():
+            context = prepare(args)
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': SETTINGS_MODULE,
+                'DB_NAME': connection.settings_dict['NAME'],
+            }
+            connection.close()
+            kinds = run(args, env, context)
+            report = {
+                'benchmark': 'toggles',
+                'vendor': connection.vendor,
+                'workers': args.workers,
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'kinds': kinds,
+                'counter_mismatches': counter_mismatches(),
+            }
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""Пиковая память процесса сервера при загрузке картинок рецептов.
+
+Запускает gunicorn (foodgram.wsgi, один синхронный воркер) на отдельной
+тестовой базе и для каждого режима загрузки отправляет --requests
+запросов с картинкой размером около --image-mb МБ от --concurrency
+одновременных клиентов:
+    json       рецепт в JSON, картинка в base64 (POST /api/recipes/);
+    multipart  JSON рецепта в части data, картинка файлом в части image
+               (POST /api/recipes/);
+    binary     картинка телом запроса (PUT /api/recipes/{id}/image/).
+Для каждого режима сервер запускается заново; до и после нагрузки
+читаются текущий (VmRSS) и пиковый (VmHWM) размер памяти процесса
+воркера из /proc (только Linux). Также проверяется, что запрос
+с Content-Length больше RECIPE_UPLOAD_MAX_BYTES отклоняется кодом 413
+без передачи тела.
+
+Запуск из каталога backend:
+    python -m benchmarks.uploads --image-mb 8 --requests 20
+    python -m benchmarks.uploads --mode json --output uploads.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import itertools
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import setup_django, test_database, write_report
+from benchmarks.servers import free_port, start_server, stop_server
+
+SETTINGS_MODULE = 'benchmarks.settings'
+MODES = ('json', 'multipart', 'binary')
+BOUNDARY = 'foodgram-benchmark-boundary'
+
+
+def make_image(size_mb):
+    """JPEG из случайного шума (почти не сжимается) размером около
+    size_mb МБ."""
+    from PIL import Image
+    side = int((size_mb * 2 ** 20 / 0.9) ** 0.5)
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def prepare():
+    """Пользователь с токеном, тег, ингредиент и рецепт для режима
+    binary. Возвращает токен, данные рецепта и id рецепта."""
+    from recipes.models import Ingredient, Recipe, Tag
+    from rest_framework.authtoken.models import Token
+    from users.models import User
+    user = User.objects.create_user(
+        username='uploader',
+        email='uploader@example.com',
+        password='uploader-password',
+        first_name='Uploader',
+        last_name='Uploader',
+    )
+    tag = Tag.objects.create(name='upload', color='#000000', slug='upload')
+    ingredient = Ingredient.objects.create(
+        name='upload',
+        measurement_unit='г',
+    )
+    recipe = Recipe.objects.create(
+        author=user,
+        name='upload',
+        text='upload',
+        cooking_time=1,
+    )
+    recipe_data = {
+        'text': 'Рецепт для замера памяти',
+        'cooking_time': 10,
+        'tags': [tag.id],
+        'ingredients': [{'id': ingredient.id, 'amount': 100}],
+    }
+    return Token.objects.create(user=user).key, recipe_data, recipe.id
+
+
+def build_request(mode, number, image, token, recipe_data, recipe_id):
+    """Заголовки и тело запроса режима mode (number - для уникального
+    названия рецепта)."""
+    data = {**recipe_data, 'name': f'{mode} {number}'}
+    if mode == 'json':
+        data['image'] = (
+            'data:image/jpeg;base64,' + base64.b64encode(image).decode()
+        )
+        method, path = 'POST', '/api/recipes/'
+        content_type, body = 'application/json', json.dumps(data).encode()
+    elif mode == 'multipart':
+        method, path = 'POST', '/api/recipes/'
+        content_type = f'multipart/form-data; boundary={BOUNDARY}'
+        body = b''.join((
+            f'--{BOUNDARY}\r\n'
+            'Content-Disposition: form-data; name="data"\r\n\r\n'.encode(),
+            json.dumps(data).encode(),
+            f'\r\n--{BOUNDARY}\r\n'
+            'Content-Disposition: form-data; name="image"; '
+            'filename="image.jpg"\r\n'
+            'Content-Type: image/jpeg\r\n\r\n'.encode(),
+            image,
+            f'\r\n--{BOUNDARY}--\r\n'.encode(),
+        ))
+    else:
+        method, path = 'PUT', f'/api/recipes/{recipe_id}/image/'
+        content_type, body = 'image/jpeg', image
+    return headers(method, path, token, content_type, len(body)), body
+
+
+def headers(method, path, token, content_type, length):
+    return (
+        f'{method} {path} HTTP/1.1\r\n'
+        'Host: localhost\r\n'
+        'Connection: close\r\n'
+        f'Authorization: Token {token}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Length: {length}\r\n\r\n'
+    ).encode()
+
+
+async def send(port, head, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(head)
+        writer.write(body)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+    return int(status_line.split()[1]) if status_line else None
+
+
+async def load(port, requests, concurrency):
+    """Клиенты по очереди забирают запросы из общего итератора.
+    Возвращает коды ответов."""
+    requests = iter(requests)
+
+    async def client():
+        return [await send(port, head, body) for head, body in requests]
+
+    results = await asyncio.gather(*(client() for _ in range(concurrency)))
+    return list(itertools.chain.from_iterable(results))
+
+
+async def oversized(port, token, recipe_id, limit):
+    """Запрос с Content-Length больше предела без тела: ответ 413 должен
+    прийти сразу, не дожидаясь тела."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    started = time.perf_counter()
+    try:
+        writer.write(headers(
+            'PUT', f'/api/recipes/{recipe_id}/image/', token, 'image/jpeg',
+            limit + 1,
+        ))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), 10)
+    finally:
+        writer.close()
+    return {
+        'status': int(status_line.split()[1]) if status_line else None,
+        'ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def worker_pid(master):
+    with open(f'/proc/{master}/task/{master}/children') as file:
+        return int(file.read().split()[0])
+
+
+def memory(pid):
+    """Текущий и пиковый RSS процесса, МБ."""
+    with open(f'/proc/{pid}/status') as file:
+        fields = dict(line.split(':', 1) for line in file)
+    return {
+        key: round(int(fields[key].split()[0]) / 1024, 1)
+        for key in ('VmRSS', 'VmHWM')
+    }
+
+
+def run_mode(mode, args, env, context):
+    from django.conf import settings
+    token, recipe_data, recipe_id, image = context
+    port = free_port()
+    server = start_server('wsgi', port, args, env)
+    try:
+        pid = worker_pid(server.pid)
+        before = memory(pid)
+        requests = (
+            build_request(mode, number, image, token, recipe_data, recipe_id)
+            for number in itertools.count()
+        )
+        started = time.perf_counter()
+        statuses = asyncio.run(load(
+            port,
+            itertools.islice(requests, args.requests),
+            args.concurrency,
+        ))
+        elapsed = time.perf_counter() - started
+        after = memory(pid)
+        rejected = asyncio.run(oversized(
+            port, token, recipe_id, settings.RECIPE_UPLOAD_MAX_BYTES,
+        ))
+    finally:
+        stop_server(server)
+    return {
+        'ok': sum(status in (200, 201) for status in statuses),
+        'errors': sum(status not in (200, 201) for status in statuses),
+        'rps': round(len(statuses) / elapsed, 2),
+        'rss_before_mb': before['VmRSS'],
+        'peak_rss_mb': after['VmHWM'],
+        'peak_growth_mb': round(after['VmHWM'] - before['VmRSS'], 1),
+        'oversized': rejected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--image-mb', type=float, default=8)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--startup-timeout', type=float, default=30)
+    parser.add_argument('--mode', action='append', choices=MODES,
+                        help='измерять только указанные режимы')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    args.workers = 1
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = SETTINGS_MODULE
+    setup_django()
+    from django.db import connection
+
+    with tempfile.TemporaryDirectory() as path:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                path, 'uploads.sqlite3',
+            )
+        with test_database():
+            image = make_image(args.image_mb)
+            context = (*prepare(), image)
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': SETTINGS_MODULE,
+                'DB_NAME': connection.settings_dict['NAME'],
+                'BENCHMARK_MEDIA_ROOT': os.path.join(path, 'media'),
+            }
+            connection.close()
+            modes = {
+                mode: run_mode(mode, args, env, context)
+                for mode in args.mode or MODES
+            }
+            report = {
+                'benchmark': 'uploads',
+                'vendor': connection.vendor,
+                'image_mb': round(len(image) / 2 ** 20, 2),
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'modes': modes,
+            }
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
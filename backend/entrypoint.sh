@@ -10,6 +10,9 @@ elif [ $1 = "migrate" ]
 elif [ $1 = "load_ingredients" ]
   then
     python manage.py load_ingredients
+elif [ $1 = "update_trending" ]
+  then
+    python manage.py update_trending
 elif [ $1 = "pre-run" ]
   then
     python manage.py collectstatic --noinput
@@ -17,6 +20,18 @@ elif [ $1 = "run" ]
   then
     exec $(which gunicorn) foodgram.wsgi:application --bind=0:8000
     exit $?
+elif [ $1 = "run-asgi" ]
+  then
+    # Под ASGI каждый запрос выполняется в новом потоке, постоянные
+    # соединения не переиспользуются - используйте пул (DB_POOL_MAX_SIZE).
+    export DB_CONN_MAX_AGE=${DB_CONN_MAX_AGE:-0}
+    exec $(which gunicorn) foodgram.asgi:application --bind=0:8000 \
+      --worker-class=uvicorn.workers.UvicornWorker
+    exit $?
+elif [ $1 = "worker" ]
+  then
+    exec python manage.py run_worker
+    exit $?
 else
   echo "Invalid argument"
   exit 1
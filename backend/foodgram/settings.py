@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'debug_toolbar',
     'rest_framework',
     'rest_framework.authtoken',
@@ -29,10 +30,12 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
+    'jobs.apps.JobsConfig',
     'django_cleanup.apps.CleanupConfig',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,15 +72,70 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
+        'ENGINE': os.getenv('DB_ENGINE', default='foodgram.db.postgresql'),
         'NAME': os.getenv('DB_NAME', default='foodgram'),
         'USER': os.getenv('POSTGRES_USER', default='foodgram_user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='foodgram12345'),
         'HOST': os.getenv('DB_HOST', default='127.0.0.1'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Постоянные соединения: время жизни в секундах (0 - закрывать после
+        # каждого запроса). Под ASGI соединения не переиспользуются между
+        # запросами, там вместо них нужен пул (DB_POOL_MAX_SIZE).
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # Проверка соединения перед первым использованием в запросе
+        # (бэкенд foodgram.db.postgresql).
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', default='true').lower() == 'true',
+        # Пул соединений процесса (бэкенд foodgram.db.postgresql).
+        'POOL': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', default=2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+        } if os.getenv('DB_POOL_MAX_SIZE') else None,
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433.
+# Безопасные запросы к вьюсетам с api.replicas.ReplicaReadMixin читают
+# с реплик, запись и чтение после записи - с основной базы.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', default='').split(',')),
+    start=1,
+):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Допустимое отставание реплик, секунд: столько после изменения данные,
+# прочитанные с реплики, не кэшируются.
+DATABASE_REPLICA_LAG = int(os.getenv('DB_REPLICA_LAG', default=5))
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'foodgram',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', default=60 * 60))
+# Кэширование id избранного, корзины и подписок пользователя (users.viewer).
+VIEWER_STATE_CACHE = os.getenv('VIEWER_STATE_CACHE', default='true').lower() == 'true'
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -112,6 +170,41 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'back_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Изображения рецептов: предельный размер загрузки (байт после
+# декодирования base64) и в пикселях, наибольшая сторона хранимого
+# изображения, стороны вариантов для списка и карточки рецепта.
+RECIPE_IMAGE_MAX_BYTES = int(os.getenv('RECIPE_IMAGE_MAX_BYTES', default=10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', default=40_000_000))
+# Предельный размер тела запроса на создание и изменение рецепта
+# (картинка в base64 занимает на треть больше самого файла).
+RECIPE_UPLOAD_MAX_BYTES = int(os.getenv('RECIPE_UPLOAD_MAX_BYTES', default=RECIPE_IMAGE_MAX_BYTES * 4 // 3 + 1024 * 1024))
+RECIPE_IMAGE_MAX_SIDE = 2048
+RECIPE_IMAGE_VARIANTS = {
+    'list': 480,
+    'detail': 1024,
+}
+RECIPE_IMAGE_QUALITY = 82
+
+# Фоновая очередь задач (jobs): процессов воркера, попыток выполнения,
+# задержка перед первым повтором (далее удваивается) и время, после
+# которого выполняемая задача считается зависшей, секунд.
+JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', default=2))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', default=5))
+JOB_RETRY_DELAY = 10
+JOB_TIMEOUT = 10 * 60
+
+# Лента подписок (recipes.feed): новые рецепты авторов, у которых
+# подписчиков не больше FEED_FANOUT_MAX_FOLLOWERS, записываются в ленты
+# подписчиков при публикации, рецепты более популярных авторов читаются
+# при запросе ленты; при подписке в ленту добавляются FEED_BACKFILL_SIZE
+# последних рецептов автора.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=5000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', default=100))
+
+# Предельное количество рецептов в одном запросе пакетного добавления
+# в избранное или корзину (и удаления из них).
+RECIPE_BULK_MAX_SIZE = int(os.getenv('RECIPE_BULK_MAX_SIZE', default=100))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -137,4 +230,14 @@ DJOSER = {
     'LOGIN_FIELD': 'email',
 }
 
+TRENDING_GRAVITY = float(os.getenv('TRENDING_GRAVITY', default=1.8))
+
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', default='russian')
+
+SHOPPING_LIST_PDF_FONT = os.getenv('SHOPPING_LIST_PDF_FONT', default='DejaVuSans.ttf')
+
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', default=30))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 CSRF_TRUSTED_ORIGINS = ['http://84.201.153.225', 'http://127.0.0.1']
@@ -0,0 +1,17 @@
+from django.contrib import admin
+from jobs.models import Job
+from jobs.queue import retry
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'task', 'status', 'attempts', 'run_at', 'locked_at', 'created',
+    )
+    readonly_fields = ('attempts', 'locked_at', 'last_error', 'created',)
+    list_filter = ('status', 'task',)
+    actions = ('retry_jobs',)
+
+    @admin.action(description='Повторить выполнение')
+    def retry_jobs(self, request, queryset):
+        retry(queryset)
@@ -0,0 +1,119 @@
+import logging
+import multiprocessing
+import signal
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from jobs.queue import claim, complete, fail
+from jobs.worker import execute, setup_process
+
+formatter = logging.Formatter(
+    '%(asctime)s [%(levelname)s] %(message)s'
+)
+handler = logging.StreamHandler(stream=sys.stdout)
+handler.setFormatter(formatter)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+
+class Command(BaseCommand):
+    help = ('Выполняет задачи фоновой очереди (jobs.Job) в пуле процессов: '
+            'основной процесс забирает задачи из базы, дочерние выполняют '
+            'их, ошибочные задачи повторяются с задержкой')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.JOB_WORKER_PROCESSES,
+            help='Количество процессов, выполняющих задачи',
+        )
+        parser.add_argument(
+            '--poll_interval',
+            type=float,
+            default=1.0,
+            help='Период опроса очереди при отсутствии задач, секунд',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Завершиться, когда готовых к выполнению задач не останется',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        processes = self.processes = options['processes']
+        logger.info(f'Воркер запущен, процессов: {processes}')
+        self.executor = self.make_executor()
+        running = {}
+        try:
+            while not self.stopping or running:
+                close_old_connections()
+                jobs = []
+                if not self.stopping and len(running) < processes:
+                    jobs = claim(processes - len(running))
+                for job in jobs:
+                    running[self.submit(job)] = job
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, _ = wait(
+                    running,
+                    timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    self.finish(running.pop(future), future)
+        finally:
+            self.executor.shutdown()
+            connections.close_all()
+        logger.info('Воркер остановлен')
+
+    def stop(self, signum, frame):
+        logger.info('Остановка: ожидание выполняемых задач')
+        self.stopping = True
+
+    def make_executor(self):
+        # spawn: дочерние процессы не наследуют соединения с базой
+        # и другие ресурсы основного процесса.
+        return ProcessPoolExecutor(
+            self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=setup_process,
+        )
+
+    def submit(self, job):
+        try:
+            return self.executor.submit(execute, job.task, job.payload)
+        except BrokenProcessPool:
+            # Дочерний процесс завершился аварийно (например, по нехватке
+            # памяти): его задачи уже получили ошибку, пул пересоздается.
+            logger.warning('Пул процессов пересоздан после сбоя')
+            self.executor.shutdown(wait=False)
+            self.executor = self.make_executor()
+            return self.executor.submit(execute, job.task, job.payload)
+
+    @staticmethod
+    def finish(job, future):
+        error = future.exception()
+        if error is None:
+            complete(job)
+            logger.info(f'{job.task} #{job.id}: выполнена')
+            return
+        fail(job, ''.join(traceback.format_exception(
+            type(error), error, error.__traceback__,
+        )))
+        logger.warning(
+            f'{job.task} #{job.id}: ошибка (попытка {job.attempts}): {error!r}'
+        )
@@ -0,0 +1,115 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+TASKS = {}
+
+
+def task(name):
+    """Регистрирует функцию как задачу очереди под именем name.
+    Параметры задачи передаются именованными аргументами и должны
+    сериализоваться в JSON."""
+
+    def register(function):
+        TASKS[name] = function
+        return function
+
+    return register
+
+
+def enqueue(name, /, **payload):
+    """Ставит задачу в очередь. Внутри транзакции задача становится
+    видна воркеру только после ее фиксации - вместе с данными, которые
+    она обрабатывает."""
+    if name not in TASKS:
+        raise KeyError(f'Неизвестная задача: {name}')
+    return Job.objects.create(task=name, payload=payload)
+
+
+def claim(limit):
+    """Забирает до limit готовых к выполнению задач: ожидающих в очереди
+    и зависших (выполняются дольше JOB_TIMEOUT - воркер, вероятно,
+    остановился). Строки блокируются с SKIP LOCKED, поэтому несколько
+    воркеров не получат одну задачу."""
+    now = timezone.now()
+    stale = Q(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.JOB_TIMEOUT),
+    )
+    with transaction.atomic():
+        # Зависшие задачи, исчерпавшие попытки (например, воркер
+        # каждый раз завершается на них аварийно), больше не выполняются.
+        Job.objects.filter(
+            stale,
+            attempts__gte=settings.JOB_MAX_ATTEMPTS,
+        ).update(status=Job.FAILED, last_error='Превышено время выполнения')
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=Job.QUEUED, run_at__lte=now) | stale)
+            .order_by('run_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        Job.objects.filter(id__in=ids).update(
+            status=Job.RUNNING,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(id__in=ids))
+
+
+def complete(job):
+    # Условие по locked_at: задачу, признанную зависшей и отданную
+    # другому воркеру, удалит тот, кто ее выполняет.
+    Job.objects.filter(id=job.id, locked_at=job.locked_at).delete()
+
+
+def fail(job, error):
+    """Возвращает задачу в очередь с экспоненциальной задержкой
+    (JOB_RETRY_DELAY, 2 * JOB_RETRY_DELAY, ...) или, если попытки
+    исчерпаны (JOB_MAX_ATTEMPTS), помечает ее ошибочной."""
+    if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+        changes = {'status': Job.FAILED}
+    else:
+        changes = {
+            'status': Job.QUEUED,
+            'run_at': timezone.now() + timedelta(
+                seconds=settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            ),
+        }
+    Job.objects.filter(id=job.id, locked_at=job.locked_at).update(
+        last_error=error,
+        **changes,
+    )
+
+
+def retry(queryset):
+    """Повторное выполнение задач (например, ошибочных) со сбросом
+    счетчика попыток."""
+    return queryset.update(
+        status=Job.QUEUED,
+        run_at=timezone.now(),
+        attempts=0,
+        locked_at=None,
+    )
+
+
+def queue_stats():
+    """Количество задач по имени и статусу и возраст самой старой
+    готовой к выполнению задачи в секундах (задержка очереди)."""
+    counts = {
+        (row['task'], row['status']): row['count']
+        for row in Job.objects.order_by().values('task', 'status').annotate(
+            count=Count('id'),
+        )
+    }
+    oldest = Job.objects.filter(
+        status=Job.QUEUED,
+        run_at__lte=timezone.now(),
+    ).aggregate(oldest=Min('run_at'))['oldest']
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0
+    return counts, lag
@@ -0,0 +1,21 @@
+"""Функции, выполняемые в дочерних процессах воркера (run_worker).
+Процессы запускаются методом spawn и импортируют этот модуль до
+настройки Django, поэтому модели и задачи импортируются только внутри
+функций."""
+import signal
+
+import django
+
+
+def setup_process():
+    """Инициализация процесса пула: настройка Django (регистрация задач
+    из tasks.py приложений). Сигналы остановки обрабатывает только
+    основной процесс, дочерние дорабатывают текущую задачу."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    django.setup()
+
+
+def execute(name, payload):
+    from .queue import TASKS
+    TASKS[name](**payload)
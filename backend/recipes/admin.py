@@ -1,5 +1,14 @@
+from collections import Counter
+
 from django.contrib import admin
-from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from django.db.models import F
+from jobs.queue import enqueue
+from recipes.feed import fan_out
+from recipes.models import (Ingredient, IngredientAmount, Recipe, Tag,
+                            TimelineEntry)
+from recipes.pantry import update_index
+from recipes.search import update_search_vectors
+from users.models import User
 
 
 class IngredientAmountInline(admin.TabularInline):
@@ -15,6 +24,14 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     list_filter = ('name',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'name' in form.changed_data:
+            # Наименование ингредиента входит в поисковый вектор рецептов.
+            update_search_vectors(
+                obj.recipe_set.values_list('id', flat=True)
+            )
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -25,12 +42,63 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'pub_date', 'get_favorited_number',)
+    list_display = (
+        'name', 'author', 'pub_date', 'favorites_count', 'cart_count',
+    )
+    readonly_fields = ('favorites_count', 'cart_count',)
     inlines = (IngredientAmountInline,)
     date_hierarchy = 'pub_date'
     search_fields = ('first_name', 'last_name',)
     list_filter = ('name', 'author', 'tags',)
 
-    @staticmethod
-    def get_favorited_number(obj):
-        return obj.favorited.count()
+    def save_model(self, request, obj, form, change):
+        image_changed = 'image' in form.changed_data
+        if image_changed or not change:
+            obj.image_ready = not obj.image
+        super().save_model(request, obj, form, change)
+        if image_changed and obj.image:
+            # Как и при загрузке через API: копии создает фоновая задача.
+            enqueue(
+                'recipes.process_image',
+                recipe_id=obj.id,
+                name=obj.image.name,
+            )
+        if not change:
+            User.objects.filter(id=obj.author_id).update(
+                recipes_count=F('recipes_count') + 1
+            )
+            fan_out(obj.id)
+        elif 'author' in form.changed_data:
+            # Рецепт передан другому автору: счетчики рецептов обоих
+            # авторов и ленты подписчиков (записи с прежним автором).
+            User.objects.filter(id=form.initial['author']).update(
+                recipes_count=F('recipes_count') - 1
+            )
+            User.objects.filter(id=obj.author_id).update(
+                recipes_count=F('recipes_count') + 1
+            )
+            TimelineEntry.objects.filter(recipe_id=obj.id).delete()
+            fan_out(obj.id)
+
+    def save_related(self, request, form, formsets, change):
+        """После сохранения ингредиентов из inline-формы пересчитываются
+        данные подбора по продуктам (количество и места ингредиентов
+        рецепта) и поисковый вектор рецепта."""
+        super().save_related(request, form, formsets, change)
+        update_index([form.instance.id])
+        update_search_vectors([form.instance.id])
+
+    def delete_model(self, request, obj):
+        author_id = obj.author_id
+        super().delete_model(request, obj)
+        User.objects.filter(id=author_id).update(
+            recipes_count=F('recipes_count') - 1
+        )
+
+    def delete_queryset(self, request, queryset):
+        authors = Counter(queryset.values_list('author_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for author_id, deleted in authors.items():
+            User.objects.filter(id=author_id).update(
+                recipes_count=F('recipes_count') - deleted
+            )
@@ -0,0 +1,61 @@
+from api.cache import get_changed, get_version, incr_counter, mark_changed
+from django.core.cache import cache
+from django.db import transaction
+
+FRAGMENT_KEY = 'recipes:fragment:{}'
+FRAGMENT_HITS = 'recipe_fragments:hits'
+FRAGMENT_MISSES = 'recipe_fragments:misses'
+
+
+def get_fragments_version():
+    """Версия фрагментов: представление рецепта включает теги и
+    ингредиенты, поэтому их изменение делает недействительными все
+    фрагменты."""
+    return (get_version('tags'), get_version('ingredients'))
+
+
+def get_fragments(recipe_ids, version):
+    """Закэшированные фрагменты представления рецептов:
+    {id рецепта: фрагмент}. Учитывает попадания и промахи."""
+    cached = cache.get_many([FRAGMENT_KEY.format(pk) for pk in recipe_ids])
+    fragments = {}
+    for pk in recipe_ids:
+        entry = cached.get(FRAGMENT_KEY.format(pk))
+        if entry is not None and entry[0] == version:
+            fragments[pk] = entry[1]
+    incr_counter(FRAGMENT_HITS, len(fragments))
+    incr_counter(FRAGMENT_MISSES, len(recipe_ids) - len(fragments))
+    return fragments
+
+
+def set_fragments(fragments, version, timeout):
+    """Сохраняет фрагменты. Если рецепты читались с реплики, фрагменты
+    недавно измененных рецептов (и всех рецептов - после изменения тегов
+    или ингредиентов) не сохраняются: реплика могла вернуть прежние
+    данные."""
+    changed = get_changed(
+        ['tags', 'ingredients', *(f'recipe:{pk}' for pk in fragments)]
+    )
+    if {'tags', 'ingredients'} & changed:
+        return
+    cache.set_many(
+        {FRAGMENT_KEY.format(pk): (version, fragment)
+         for pk, fragment in fragments.items()
+         if f'recipe:{pk}' not in changed},
+        timeout,
+    )
+
+
+def delete_fragments(recipe_ids):
+    """Удаляет фрагменты рецептов после фиксации текущей транзакции:
+    при удалении до фиксации параллельный запрос успел бы закэшировать
+    прежние данные заново."""
+    keys = [FRAGMENT_KEY.format(pk) for pk in recipe_ids]
+    if not keys:
+        return
+
+    def delete():
+        cache.delete_many(keys)
+        mark_changed(*(f'recipe:{pk}' for pk in recipe_ids))
+
+    transaction.on_commit(delete)
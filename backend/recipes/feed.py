@@ -0,0 +1,237 @@
+import heapq
+
+from api.pagination import LimitPageNumberPagination
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from jobs.queue import enqueue
+from rest_framework.exceptions import NotFound
+from users.models import Subscription, User
+
+from .models import Recipe, TimelineEntry
+
+# Рецепты в ленты подписчиков их авторов (у которых подписчиков не больше
+# FEED_FANOUT_MAX_FOLLOWERS): {recipes} - подзапрос рецептов с полями id,
+# author_id, pub_date. WHERE нужен SQLite для разбора ON CONFLICT после
+# SELECT.
+FAN_OUT_SQL = '''
+    INSERT INTO {timeline} (user_id, recipe_id, author_id, pub_date)
+    SELECT subscription.user_id, recipe.id, recipe.author_id, recipe.pub_date
+    FROM ({recipes}) recipe
+    JOIN {user} author ON author.id = recipe.author_id
+    JOIN {subscription} subscription
+        ON subscription.author_id = recipe.author_id
+    WHERE author.followers_count <= %s
+    ON CONFLICT DO NOTHING
+'''
+RECIPE_SQL = 'SELECT id, author_id, pub_date FROM {recipe} WHERE id = %s'
+LATEST_SQL = '''
+    SELECT id, author_id, pub_date FROM {recipe} WHERE author_id = %s
+    ORDER BY pub_date DESC, id DESC LIMIT %s
+'''
+# Последние FEED_BACKFILL_SIZE рецептов каждого автора.
+LATEST_ALL_SQL = '''
+    SELECT id, author_id, pub_date FROM (
+        SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+            PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+        ) AS number
+        FROM {recipe}
+    ) numbered WHERE number <= %s
+'''
+BACKFILL_SQL = '''
+    INSERT INTO {timeline} (user_id, recipe_id, author_id, pub_date)
+    SELECT %s, recipe.id, recipe.author_id, recipe.pub_date
+    FROM ({recipes}) recipe
+    JOIN {user} author ON author.id = recipe.author_id
+    WHERE author.followers_count <= %s
+    ON CONFLICT DO NOTHING
+'''
+
+
+def execute(sql, params, **subqueries):
+    """Выполняет запрос записи в ленты (имена таблиц подставляются из
+    моделей) и возвращает количество добавленных записей."""
+    tables = {
+        'timeline': TimelineEntry._meta.db_table,
+        'recipe': Recipe._meta.db_table,
+        'user': User._meta.db_table,
+        'subscription': Subscription._meta.db_table,
+    }
+    tables.update(
+        (name, sql.format(**tables)) for name, sql in subqueries.items()
+    )
+    connection = connections[router.db_for_write(TimelineEntry)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(**tables), params)
+        return cursor.rowcount
+
+
+def fan_out(recipe_id):
+    """Добавляет новый рецепт в ленты подписчиков автора одним
+    INSERT ... SELECT. Рецепты авторов, у которых подписчиков больше
+    FEED_FANOUT_MAX_FOLLOWERS, в ленты не записываются - они читаются
+    при запросе ленты (Feed.page)."""
+    return execute(
+        FAN_OUT_SQL,
+        [recipe_id, settings.FEED_FANOUT_MAX_FOLLOWERS],
+        recipes=RECIPE_SQL,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту нового подписчика FEED_BACKFILL_SIZE последних
+    рецептов автора."""
+    return execute(
+        BACKFILL_SQL,
+        [
+            user_id,
+            author_id,
+            settings.FEED_BACKFILL_SIZE,
+            settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ],
+        recipes=LATEST_SQL,
+    )
+
+
+def backfill_followers(author_id):
+    """Добавляет последние рецепты автора в ленты всех его подписчиков:
+    после того как подписчиков стало не больше FEED_FANOUT_MAX_FOLLOWERS,
+    рецепты автора перестают читаться при запросе ленты."""
+    return execute(
+        FAN_OUT_SQL,
+        [
+            author_id,
+            settings.FEED_BACKFILL_SIZE,
+            settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ],
+        recipes=LATEST_SQL,
+    )
+
+
+def add_subscription(user_id, author_id):
+    """Подписка user_id на author_id: счетчик подписчиков автора и
+    последние рецепты автора в ленте подписчика."""
+    User.objects.filter(id=author_id).update(
+        followers_count=F('followers_count') + 1
+    )
+    backfill(user_id, author_id)
+
+
+def remove_subscription(user_id, author, deleted):
+    """Отписка user_id от author (deleted - количество удаленных подписок):
+    счетчик подписчиков и удаление рецептов автора из ленты. Если автор
+    перестал превышать FEED_FANOUT_MAX_FOLLOWERS, его последние рецепты
+    записываются в ленты подписчиков фоновой задачей."""
+    User.objects.filter(id=author.id).update(
+        followers_count=F('followers_count') - deleted
+    )
+    TimelineEntry.objects.filter(user_id=user_id, author=author).delete()
+    if (author.followers_count - deleted
+            <= settings.FEED_FANOUT_MAX_FOLLOWERS
+            < author.followers_count):
+        enqueue('recipes.backfill_followers', author_id=author.id)
+
+
+@transaction.atomic
+def rebuild_timelines():
+    """Полностью перестраивает ленты: каждому подписчику - последние
+    FEED_BACKFILL_SIZE рецептов каждого автора, на которого он подписан
+    (кроме авторов, рецепты которых читаются при запросе ленты).
+    Возвращает количество записей."""
+    TimelineEntry.objects.all().delete()
+    return execute(
+        FAN_OUT_SQL,
+        [settings.FEED_BACKFILL_SIZE, settings.FEED_FANOUT_MAX_FOLLOWERS],
+        recipes=LATEST_ALL_SQL,
+    )
+
+
+def before(position, recipe_field):
+    """Условие «раньше позиции» (дата публикации, id рецепта). Отдельное
+    условие pub_date <= ... ограничивает диапазон просмотра индекса."""
+    pub_date, recipe_id = position
+    return Q(pub_date__lte=pub_date) & (
+        Q(pub_date__lt=pub_date) | Q(**{f'{recipe_field}__lt': recipe_id})
+    )
+
+
+class Feed:
+    """Лента подписок пользователя: рецепты авторов, на которых он
+    подписан, от новых к старым. Записи ленты читаются одним проходом по
+    индексу timeline_user_idx; рецепты авторов с числом подписчиков больше
+    FEED_FANOUT_MAX_FOLLOWERS выбираются из таблицы рецептов и
+    объединяются с ними (hybrid pull)."""
+
+    def __init__(self, user):
+        self.user = user
+
+    def page(self, position, limit):
+        """До limit пар (дата публикации, id рецепта) после позиции
+        position (None - с начала ленты)."""
+        timeline = TimelineEntry.objects.filter(user=self.user)
+        pulled = Recipe.objects.filter(
+            author__in=Subscription.objects.filter(
+                user=self.user,
+                author__followers_count__gt=(
+                    settings.FEED_FANOUT_MAX_FOLLOWERS
+                ),
+            ).values('author')
+        )
+        if position is not None:
+            timeline = timeline.filter(before(position, 'recipe_id'))
+            pulled = pulled.filter(before(position, 'id'))
+        streams = (
+            timeline.order_by('-pub_date', '-recipe_id').values_list(
+                'pub_date',
+                'recipe_id',
+            )[:limit],
+            pulled.order_by('-pub_date', '-id').values_list(
+                'pub_date',
+                'id',
+            )[:limit],
+        )
+        entries = []
+        # Рецепт может быть и в ленте, и среди выбранных из таблицы
+        # рецептов, если у автора стало больше подписчиков после его
+        # публикации; в объединенном порядке повторы идут подряд.
+        for entry in heapq.merge(*streams, reverse=True):
+            if entries and entries[-1] == entry:
+                continue
+            entries.append(entry)
+            if len(entries) == limit:
+                break
+        return entries
+
+
+class FeedPagination(LimitPageNumberPagination):
+    """Пагинация ленты подписок (Feed) только по курсору: позиция - дата
+    публикации и id последнего рецепта страницы, переход возможен лишь
+    к следующей странице, общее количество не считается (count - null).
+    Возвращает id рецептов страницы."""
+
+    def paginate_queryset(self, feed, request, view=None):
+        self.keyset = True
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.approximate_count = None
+        self.previous_position = None
+        position, _ = self.decode_cursor(request)
+        if position is not None:
+            position = self.parse_position(position)
+        entries = feed.page(position, self.page_size + 1)
+        self.next_position = None
+        if len(entries) > self.page_size:
+            pub_date, recipe_id = entries[self.page_size - 1]
+            self.next_position = [pub_date.isoformat(), recipe_id]
+        return [recipe_id for _, recipe_id in entries[:self.page_size]]
+
+    def parse_position(self, position):
+        try:
+            pub_date, recipe_id = position
+            pub_date, recipe_id = parse_datetime(pub_date), int(recipe_id)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, recipe_id
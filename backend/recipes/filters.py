@@ -1,17 +1,21 @@
-from django.db.models import Case, Value, When
 from django_filters.rest_framework import (BooleanFilter, CharFilter,
-                                           FilterSet,
-                                           ModelMultipleChoiceFilter)
+                                           ChoiceFilter, FilterSet,
+                                           ModelMultipleChoiceFilter,
+                                           NumberFilter)
 
 from .models import Ingredient, Recipe, Tag
+from .search import search_ingredients, search_recipes
 
 
 class IngredientFilter(FilterSet):
     """Фильтр для выбора ингредиентов.
     Фильтрует по наименованию ингредиента (name) сначала по вхождению
-    в начало наименования, затем по вхождению в произвользном месте."""
+    в начало наименования, затем по вхождению в произвольном месте,
+    затем по сходству наименований (с учетом опечаток).
+    Количество результатов ограничивается параметром limit."""
 
     name = CharFilter(method='name_filter')
+    limit = NumberFilter(method='limit_filter', min_value=1)
 
     class Meta:
         model = Ingredient
@@ -20,19 +24,35 @@ class IngredientFilter(FilterSet):
     def name_filter(self, queryset, name, value):
         if not value:
             return queryset
-        filtered_queryset = queryset.filter(name__icontains=value).annotate(
-            order=Case(
-                When(name__istartswith=value, then=Value(1)),
-                default=Value(2)
-            )
+        limit = self.form.cleaned_data.get('limit')
+        return search_ingredients(
+            queryset,
+            value,
+            int(limit) if limit else None,
         )
-        return filtered_queryset.order_by('order')
+
+    def limit_filter(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset[:int(value)]
 
 
 class RecipeFilter(FilterSet):
     """Фильтр рецептов.
     Фильтрует по наименованию (name), автору (author), тегам(tags),
-    вхождению в корзину (is_in_shopping_cart) и избранное(is_favorited)."""
+    вхождению в корзину (is_in_shopping_cart) и избранное(is_favorited).
+    Ищет по словам в наименовании, описании и ингредиентах (search),
+    упорядочивая по релевантности.
+    Сортирует (ordering) по популярности (popular), предрасчитанной
+    позиции в рейтинге «в тренде» (trending, индекс recipe_trending_idx,
+    доступна курсорная пагинация) или времени приготовления
+    (cooking_time); по умолчанию - по дате публикации."""
+
+    ORDERINGS = {
+        'popular': (Recipe.popularity().desc(), '-pub_date'),
+        'trending': ('trending_position', '-pub_date'),
+        'cooking_time': ('cooking_time', '-pub_date'),
+    }
 
     tags = ModelMultipleChoiceFilter(
         field_name='tags__slug',
@@ -48,6 +68,11 @@ class RecipeFilter(FilterSet):
         field_name='in_shopping_cart',
         method='choice_filter',
     )
+    search = CharFilter(method='search_filter')
+    ordering = ChoiceFilter(
+        choices=[(ordering, ordering) for ordering in ORDERINGS],
+        method='ordering_filter',
+    )
 
     class Meta:
         model = Recipe
@@ -60,3 +85,13 @@ class RecipeFilter(FilterSet):
             name: self.request.user.id,
         }
         return queryset.filter(**kwargs)
+
+    def search_filter(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
+    def ordering_filter(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.order_by(*self.ORDERINGS[value])
@@ -0,0 +1,161 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+VARIANTS_DIR = 'recipes/variants'
+# Форматы вариантов: (формат Pillow, расширение).
+VARIANT_FORMATS = (('JPEG', 'jpg'), ('WEBP', 'webp'))
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def open_image(file):
+    """Открывает изображение, проверяя размер в пикселях по заголовку -
+    до декодирования, которое для огромных изображений заняло бы
+    гигабайты памяти."""
+    try:
+        image = Image.open(file)
+    except Image.DecompressionBombError:
+        raise ImageTooLarge('Слишком большое изображение.')
+    width, height = image.size
+    if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(
+            f'Изображение {width}x{height} больше '
+            f'{settings.RECIPE_IMAGE_MAX_PIXELS} пикселей.'
+        )
+    return image
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def fit(image, side):
+    """Копия изображения, вписанная в квадрат side x side, с учетом
+    ориентации из EXIF. Для JPEG используется draft: декодер сразу
+    уменьшает изображение в 2-8 раз, не распаковывая его целиком."""
+    if image.format == 'JPEG':
+        image.draft('RGB', (side, side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((side, side), Image.LANCZOS)
+    return image
+
+
+def to_rgb(image):
+    if not has_alpha(image):
+        return image.convert('RGB')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+    return background
+
+
+def encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    # Пустой exif: иначе PNG сохранил бы EXIF из image.info.
+    image.save(
+        buffer,
+        format=image_format,
+        icc_profile=image.info.get('icc_profile'),
+        exif=b'',
+        **options,
+    )
+    return buffer.getvalue()
+
+
+def normalize(file, name):
+    """Исходное изображение рецепта для хранения: вписанное в
+    RECIPE_IMAGE_MAX_SIDE, без EXIF (в нем бывают координаты съемки),
+    в JPEG или, при наличии прозрачности, в PNG. Возвращает ContentFile
+    с именем name и подходящим расширением."""
+    image = open_image(file)
+    image = fit(image, settings.RECIPE_IMAGE_MAX_SIDE)
+    stem = os.path.splitext(name)[0]
+    if has_alpha(image):
+        return ContentFile(
+            encode(image.convert('RGBA'), 'PNG', optimize=True),
+            name=f'{stem}.png',
+        )
+    return ContentFile(
+        encode(
+            image.convert('RGB'),
+            'JPEG',
+            quality=settings.RECIPE_IMAGE_QUALITY,
+            optimize=True,
+            progressive=True,
+        ),
+        name=f'{stem}.jpg',
+    )
+
+
+def save_normalized(name, storage=default_storage):
+    """Сохраняет рядом с файлом name его перекодированную копию
+    (normalize) и возвращает ее имя."""
+    with storage.open(name) as file:
+        content = normalize(file, os.path.basename(name))
+    return storage.save(
+        os.path.join(os.path.dirname(name), content.name),
+        content,
+    )
+
+
+def variant_name(name, variant, extension):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{VARIANTS_DIR}/{stem}_{variant}.{extension}'
+
+
+def variant_names(name):
+    """Имена всех вариантов изображения: {вариант: {расширение: имя}}."""
+    return {
+        variant: {
+            extension: variant_name(name, variant, extension)
+            for _, extension in VARIANT_FORMATS
+        }
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def generate_variants(name, storage=default_storage):
+    """Создает уменьшенные копии изображения для списка и карточки
+    рецепта (RECIPE_IMAGE_VARIANTS) в JPEG и WebP. Существующие
+    варианты перезаписываются. Возвращает количество файлов."""
+    with storage.open(name) as file:
+        source = fit(
+            open_image(file),
+            max(settings.RECIPE_IMAGE_VARIANTS.values()),
+        )
+    count = 0
+    for variant, side in settings.RECIPE_IMAGE_VARIANTS.items():
+        image = to_rgb(fit(source.copy(), side))
+        for image_format, extension in VARIANT_FORMATS:
+            target = variant_name(name, variant, extension)
+            storage.delete(target)
+            storage.save(target, ContentFile(encode(
+                image,
+                image_format,
+                quality=settings.RECIPE_IMAGE_QUALITY,
+                optimize=image_format == 'JPEG',
+            )))
+            count += 1
+    return count
+
+
+def has_variants(name, storage=default_storage):
+    return all(
+        storage.exists(target)
+        for names in variant_names(name).values()
+        for target in names.values()
+    )
+
+
+def delete_variants(name, storage=default_storage):
+    for names in variant_names(name).values():
+        for target in names.values():
+            storage.delete(target)
@@ -0,0 +1,72 @@
+import csv
+import json
+import os
+from itertools import islice
+
+READ_SIZE = 1 << 16
+
+
+def chunked(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не более size."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def skip_separators(file, buffer, position, read_size):
+    """Пропускает пробелы и запятые между элементами JSON-массива,
+    при необходимости дочитывая файл."""
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            return buffer, position
+        buffer, position = file.read(read_size), 0
+        if not buffer:
+            raise ValueError('Неожиданный конец JSON-массива.')
+
+
+def iter_json_array(file, read_size=READ_SIZE):
+    """Потоково читает JSON-массив объектов: файл читается блоками,
+    объекты разбираются по одному (JSONDecoder.raw_decode), поэтому весь
+    файл в память не загружается."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(read_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидается JSON-массив объектов.')
+    position = 1
+    while True:
+        buffer, position = skip_separators(file, buffer, position, read_size)
+        if buffer[position] == ']':
+            return
+        while True:
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                chunk = file.read(read_size)
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+        yield item
+
+
+def read_records(path, fieldnames=None):
+    """Потоково читает записи (словари) из файла csv, json (массив
+    объектов) или jsonl (объект в каждой строке). Для csv без строки
+    заголовка нужно передать fieldnames."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8') as file:
+        if extension == '.csv':
+            yield from csv.DictReader(file, fieldnames=fieldnames)
+        elif extension == '.json':
+            yield from iter_json_array(file)
+        elif extension == '.jsonl':
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f'Неподдерживаемый формат файла: {path}')
@@ -0,0 +1,327 @@
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from api.cache import bump_version
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.feed import rebuild_timelines
+from recipes.loaders import chunked, read_records
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from recipes.pantry import rebuild_index
+from recipes.search import reset_index, update_search_vectors
+from users.models import Subscription, User
+
+# Порядок загрузки: каждый файл ссылается только на загруженные ранее.
+ENTITIES = (
+    'tags',
+    'users',
+    'recipes',
+    'ingredient_amounts',
+    'favorites',
+    'shopping_cart',
+    'subscriptions',
+)
+EXTENSIONS = ('.jsonl', '.csv', '.json')
+
+formatter = logging.Formatter(
+    '%(asctime)s [%(levelname)s] %(message)s'
+)
+handler = logging.StreamHandler(stream=sys.stdout)
+handler.setFormatter(formatter)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+
+@lru_cache(maxsize=None)
+def hash_password(password):
+    """Хэширование пароля занимает десятки миллисекунд, поэтому
+    одинаковые пароли тестовых пользователей хэшируются один раз."""
+    return make_password(password or None)
+
+
+def split_list(value):
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return value or []
+
+
+class Command(BaseCommand):
+    help = ('Массово загружает теги, пользователей, рецепты, ингредиенты '
+            'рецептов, избранное, корзины и подписки из csv/jsonl-файлов '
+            'папки (tags.csv, users.jsonl, ...). Ссылки задаются '
+            'естественными ключами: slug тега, username, наименование '
+            'ингредиента, автор и название рецепта')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            type=str,
+            help='Путь к папке с файлами данных',
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=5000,
+            help='Размер пакета записей',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Количество параллельно загружаемых пакетов (PostgreSQL)',
+        )
+        parser.add_argument(
+            '--no_post_process',
+            action='store_true',
+            help=('Не пересчитывать счетчики, поисковые векторы и индекс '
+                  'ингредиентов после загрузки'),
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isdir(path):
+            raise CommandError(f'Директория {path} не найдена!')
+        self.batch_size = options['batch_size']
+        # SQLite не допускает параллельной записи.
+        self.workers = (
+            options['workers'] if connection.vendor == 'postgresql' else 1
+        )
+        self.tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredient_ids = dict(
+            Ingredient.objects.values_list('name', 'id')
+        )
+        self.user_ids = dict(User.objects.values_list('username', 'id'))
+        loaded = []
+        for entity in ENTITIES:
+            file = self.get_file(path, entity)
+            if file is None:
+                continue
+            logger.info(f'Загрузка {entity} из {file}')
+            self.load(entity, read_records(file))
+            loaded.append(entity)
+            if entity == 'tags':
+                self.tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+            elif entity == 'users':
+                self.user_ids = dict(
+                    User.objects.values_list('username', 'id')
+                )
+        if not loaded:
+            raise CommandError(f'В директории {path} нет файлов данных')
+        if not options['no_post_process']:
+            self.post_process(loaded)
+
+    @staticmethod
+    def get_file(path, entity):
+        for extension in EXTENSIONS:
+            file = os.path.join(path, entity + extension)
+            if os.path.isfile(file):
+                return file
+        return None
+
+    def load(self, entity, records):
+        """Загружает записи пакетами. На PostgreSQL пакеты загружаются
+        параллельно в нескольких потоках (у каждого свое соединение),
+        в очереди держится не более 2 * workers пакетов."""
+        loader = getattr(self, f'load_{entity}')
+        start = time.monotonic()
+        total = loaded = 0
+        executor = (
+            ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        )
+        pending = set()
+        for batch in chunked(records, self.batch_size):
+            total += len(batch)
+            if executor is None:
+                loaded += loader(batch)
+                continue
+            if len(pending) >= 2 * self.workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                loaded += sum(future.result() for future in done)
+            pending.add(executor.submit(self.run_in_thread, loader, batch))
+        if executor is not None:
+            loaded += sum(future.result() for future in pending)
+            executor.shutdown()
+        elapsed = time.monotonic() - start
+        logger.info(
+            f'{entity}: строк {total}, загружено {loaded}, '
+            f'пропущено {total - loaded} за {elapsed:.1f} с '
+            f'({total / elapsed if elapsed else 0:.0f} строк/с)'
+        )
+
+    @staticmethod
+    def run_in_thread(loader, batch):
+        try:
+            return loader(batch)
+        finally:
+            connection.close()
+
+    def get_recipe_ids(self, records):
+        """Идентификаторы рецептов по (username автора, название) одним
+        запросом на пакет: {(id автора, название): id рецепта}."""
+        keys = {
+            (self.user_ids.get(record.get('author')), record.get('recipe'))
+            for record in records
+        }
+        return {
+            (author_id, name): pk
+            for author_id, name, pk in Recipe.objects.filter(
+                author_id__in={author_id for author_id, _ in keys},
+                name__in={name for _, name in keys},
+            ).values_list('author_id', 'name', 'id')
+            if (author_id, name) in keys
+        }
+
+    def load_tags(self, records):
+        Tag.objects.bulk_create(
+            [Tag(name=record['name'], slug=record['slug'],
+                 color=record.get('color') or '#FF0000')
+             for record in records],
+            ignore_conflicts=True,
+        )
+        return len(records)
+
+    def load_users(self, records):
+        User.objects.bulk_create(
+            [User(
+                username=record['username'],
+                email=record.get('email', ''),
+                first_name=record.get('first_name', ''),
+                last_name=record.get('last_name', ''),
+                password=hash_password(record.get('password')),
+            ) for record in records],
+            ignore_conflicts=True,
+        )
+        return len(records)
+
+    @transaction.atomic
+    def load_recipes(self, records):
+        """Рецепты с тегами (slug через запятую или список) и, для
+        json/jsonl, ингредиентами (список {name, amount})."""
+        recipes = []
+        for record in records:
+            author_id = self.user_ids.get(record.get('author'))
+            if author_id is None:
+                continue
+            recipes.append(Recipe(
+                author_id=author_id,
+                name=record['name'],
+                text=record.get('text', ''),
+                cooking_time=int(record.get('cooking_time') or 1),
+                image=record.get('image', ''),
+                image_ready=not record.get('image'),
+            ))
+        Recipe.objects.bulk_create(recipes, ignore_conflicts=True)
+        recipe_ids = self.get_recipe_ids(
+            [{**record, 'recipe': record['name']} for record in records]
+        )
+        tags = []
+        amounts = []
+        for record in records:
+            recipe_id = recipe_ids.get(
+                (self.user_ids.get(record.get('author')), record['name'])
+            )
+            if recipe_id is None:
+                continue
+            tags.extend(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in map(self.tag_ids.get, split_list(
+                    record.get('tags')
+                ))
+                if tag_id is not None
+            )
+            amounts.extend(
+                IngredientAmount(
+                    recipe_id=recipe_id,
+                    ingredient_id=self.ingredient_ids[ingredient['name']],
+                    amount=int(ingredient['amount']),
+                )
+                for ingredient in record.get('ingredients') or ()
+                if ingredient['name'] in self.ingredient_ids
+            )
+        Recipe.tags.through.objects.bulk_create(tags, ignore_conflicts=True)
+        IngredientAmount.objects.bulk_create(amounts, ignore_conflicts=True)
+        return len(recipes)
+
+    def load_ingredient_amounts(self, records):
+        recipe_ids = self.get_recipe_ids(records)
+        amounts = []
+        for record in records:
+            recipe_id = recipe_ids.get(
+                (self.user_ids.get(record.get('author')), record.get('recipe'))
+            )
+            ingredient_id = self.ingredient_ids.get(record.get('ingredient'))
+            if recipe_id is None or ingredient_id is None:
+                continue
+            amounts.append(IngredientAmount(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=int(record['amount']),
+            ))
+        IngredientAmount.objects.bulk_create(amounts, ignore_conflicts=True)
+        return len(amounts)
+
+    def load_recipe_relation(self, through, records):
+        recipe_ids = self.get_recipe_ids(records)
+        relations = []
+        for record in records:
+            recipe_id = recipe_ids.get(
+                (self.user_ids.get(record.get('author')), record.get('recipe'))
+            )
+            user_id = self.user_ids.get(record.get('user'))
+            if recipe_id is None or user_id is None:
+                continue
+            relations.append(through(recipe_id=recipe_id, user_id=user_id))
+        through.objects.bulk_create(relations, ignore_conflicts=True)
+        return len(relations)
+
+    def load_favorites(self, records):
+        return self.load_recipe_relation(Recipe.favorited.through, records)
+
+    def load_shopping_cart(self, records):
+        return self.load_recipe_relation(
+            Recipe.in_shopping_cart.through,
+            records,
+        )
+
+    def load_subscriptions(self, records):
+        subscriptions = []
+        for record in records:
+            user_id = self.user_ids.get(record.get('user'))
+            author_id = self.user_ids.get(record.get('author'))
+            if user_id is None or author_id is None or user_id == author_id:
+                continue
+            subscriptions.append(
+                Subscription(user_id=user_id, author_id=author_id)
+            )
+        Subscription.objects.bulk_create(subscriptions, ignore_conflicts=True)
+        return len(subscriptions)
+
+    @staticmethod
+    def post_process(loaded):
+        """Пересчет данных, которые при обычной работе поддерживаются
+        API: счетчики, поисковые векторы, индекс подбора по продуктам,
+        ленты подписок, а также сброс кэша."""
+        call_command('recount_counters')
+        if 'tags' in loaded:
+            bump_version('tags')
+        if {'recipes', 'ingredient_amounts'} & set(loaded):
+            start = time.monotonic()
+            update_search_vectors()
+            rebuild_index()
+            logger.info(
+                'Поисковые векторы и индекс ингредиентов пересчитаны за '
+                f'{time.monotonic() - start:.1f} с'
+            )
+            # Смена версии ingredients сбрасывает и закэшированные
+            # представления рецептов, составы которых могли измениться.
+            reset_index()
+        if {'recipes', 'subscriptions'} & set(loaded):
+            entries = rebuild_timelines()
+            logger.info(f'Ленты подписок перестроены, записей: {entries}')
@@ -1,15 +1,18 @@
-import csv
 import logging
 import os
 import sys
+import time
+from collections import Counter
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.loaders import chunked, read_records
 from recipes.models import Ingredient
+from recipes.search import reset_index
 
-CSV_MODELS = [
-    ('ingredients.csv', Ingredient, ('name', 'measurement_unit',)),
-]
+FIELDNAMES = ('name', 'measurement_unit')
+DATA_FILES = ('ingredients.csv', 'ingredients.json', 'ingredients.jsonl')
 
 formatter = logging.Formatter(
     '%(asctime)s [%(levelname)s] %(message)s'
@@ -22,7 +25,8 @@ logger.addHandler(handler)
 
 
 class Command(BaseCommand):
-    help = 'Loads ingredients data from csv-files into Ingredient model'
+    help = ('Загружает ингредиенты из csv/json/jsonl-файла: добавляет новые '
+            'и обновляет единицы измерения существующих (по наименованию)')
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -31,46 +35,163 @@ class Command(BaseCommand):
             dest='csv_path',
             type=str,
             default=os.path.join(settings.BASE_DIR, 'data'),
-            help='Путь к папке с csv файлами'
-        ),
+            help='Путь к папке с файлом ingredients.csv (.json, .jsonl)'
+        )
+        parser.add_argument(
+            '-f',
+            '--file',
+            type=str,
+            help='Путь к файлу с ингредиентами (вместо папки)',
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='Размер пакета записей',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать изменения, не записывая их в базу',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help=('Удалить ингредиенты, отсутствующие в файле '
+                  '(кроме используемых в рецептах)'),
+        )
         parser.add_argument(
             '--no_delete',
-            action='store_false',
-            help='Не удалять текущие данные перед заливкой новых',
+            action='store_true',
+            help=('Устарел, ничего не делает: ингредиенты больше не '
+                  'удаляются перед загрузкой (удаление - --prune)'),
         )
 
     def handle(self, *args, **options):
+        path = self.get_path(options)
+        logger.info(f'Файл с ингредиентами - {path}')
+        stats = Counter()
+        if options['no_delete']:
+            logger.warning(
+                'Параметр --no_delete устарел и будет удален: '
+                'ингредиенты и так не удаляются перед загрузкой'
+            )
+        rows = self.clean_rows(read_records(path, FIELDNAMES), stats)
+        start = time.monotonic()
+        self.import_chunked(rows, options, stats)
+        elapsed = time.monotonic() - start
+        logger.info(
+            f'{"Проверено" if options["dry_run"] else "Обработано"} '
+            f'строк: {stats["rows"]} за {elapsed:.1f} с '
+            f'({stats["rows"] / elapsed if elapsed else 0:.0f} строк/с); '
+            f'добавлено: {stats["inserted"]}, обновлено: {stats["updated"]}, '
+            f'пропущено: {stats["skipped"]}, удалено: {stats["deleted"]}'
+        )
+        if not options['dry_run'] and (
+            stats['inserted'] or stats['updated'] or stats['deleted']
+        ):
+            reset_index()
+
+    @staticmethod
+    def get_path(options):
+        if options['file']:
+            if not os.path.isfile(options['file']):
+                raise CommandError(f'Файл {options["file"]} не найден!')
+            return options['file']
         csv_path = options['csv_path']
-        try:
-            list_dir = os.listdir(csv_path)
-        except FileNotFoundError:
-            logger.error(f'Директория {csv_path} не найдена!')
-            raise FileNotFoundError
-        logger.info(f'директория с csv-файлами - {csv_path}')
-        files = [f for f in list_dir
-                 if os.path.isfile(os.path.join(csv_path, f))
-                 and f in [CSV_MODELS[i][0] for i in range(len(CSV_MODELS))]]
-        logger.info(f'Файлы - {files}')
-        for file, model, headers in CSV_MODELS:
-            model_observe_number = model.objects.count()
-            if file not in files:
-                logger.warning(f'отсутствует заявленный файл - {file}')
+        if not os.path.isdir(csv_path):
+            raise CommandError(f'Директория {csv_path} не найдена!')
+        for file in DATA_FILES:
+            if os.path.isfile(os.path.join(csv_path, file)):
+                return os.path.join(csv_path, file)
+        raise CommandError(
+            f'В директории {csv_path} нет файлов {", ".join(DATA_FILES)}'
+        )
+
+    @staticmethod
+    def clean_rows(records, stats):
+        """Приводит записи к кортежам (наименование, единица измерения);
+        некорректные записи пропускаются с предупреждением."""
+        name_length = Ingredient._meta.get_field('name').max_length
+        unit_length = Ingredient._meta.get_field(
+            'measurement_unit'
+        ).max_length
+        for number, record in enumerate(records, start=1):
+            stats['rows'] += 1
+            name = str(record.get('name') or '').strip()
+            unit = str(record.get('measurement_unit') or '').strip()
+            if (not name or not unit or len(name) > name_length
+                    or len(unit) > unit_length):
+                logger.warning(f'Запись {number} пропущена: {record}')
+                stats['skipped'] += 1
                 continue
-            if options['no_delete']:
-                model.objects.all().delete()
-            logger.info(f'обработка файла - {file}')
-            with open(
-                os.path.join(csv_path, file),
-                newline='',
-                encoding='utf-8'
-            ) as csvfile:
-                data = csv.DictReader(csvfile, delimiter=',',
-                                      fieldnames=headers,)
-                model.objects.bulk_create(
-                    [model(**observe) for observe in data],
-                    ignore_conflicts=True
+            yield name, unit
+
+    def import_chunked(self, rows, options, stats):
+        """Загрузка пакетами: для каждого пакета одним запросом выбираются
+        существующие ингредиенты, затем выполняются bulk_create новых
+        и bulk_update измененных. Повторы наименования в файле
+        пропускаются (действует первая запись)."""
+        dry_run = options['dry_run']
+        seen = set()
+        for chunk in chunked(rows, options['batch_size']):
+            fresh = {}
+            for name, unit in chunk:
+                if name in seen:
+                    stats['skipped'] += 1
+                    continue
+                seen.add(name)
+                fresh[name] = unit
+            existing = {
+                name: (pk, unit)
+                for pk, name, unit in Ingredient.objects.filter(
+                    name__in=fresh,
+                ).values_list('id', 'name', 'measurement_unit')
+            }
+            created = [
+                (name, unit) for name, unit in fresh.items()
+                if name not in existing
+            ]
+            changed = [
+                (name, unit) for name, unit in fresh.items()
+                if name in existing and existing[name][1] != unit
+            ]
+            stats['inserted'] += len(created)
+            stats['updated'] += len(changed)
+            stats['skipped'] += len(fresh) - len(created) - len(changed)
+            if dry_run:
+                for name, unit in created:
+                    logger.info(f'+ {name} ({unit})')
+                for name, unit in changed:
+                    logger.info(f'~ {name}: {existing[name][1]} -> {unit}')
+                continue
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(
+                    [Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in created],
+                    ignore_conflicts=True,
                 )
-            if model.objects.count() > model_observe_number:
-                logger.info(f'Данные файла {file} загружены')
-            else:
-                logger.warning(f'Данные файла {file} НЕ загружены')
+                Ingredient.objects.bulk_update(
+                    [Ingredient(id=existing[name][0], measurement_unit=unit)
+                     for name, unit in changed],
+                    ('measurement_unit',),
+                )
+        if options['prune']:
+            self.prune_chunked(seen, options, stats)
+
+    @staticmethod
+    def prune_chunked(seen, options, stats):
+        unused = Ingredient.objects.filter(
+            ingredientamount__isnull=True,
+        ).values_list('id', 'name')
+        to_delete = []
+        for pk, name in unused.iterator():
+            if name not in seen:
+                to_delete.append(pk)
+                if options['dry_run']:
+                    logger.info(f'- {name}')
+        stats['deleted'] = len(to_delete)
+        if options['dry_run']:
+            return
+        for batch in chunked(to_delete, options['batch_size']):
+            Ingredient.objects.filter(id__in=batch).delete()
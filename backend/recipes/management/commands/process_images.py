@@ -0,0 +1,95 @@
+import logging
+import sys
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from recipes.images import (ImageTooLarge, delete_variants, generate_variants,
+                            has_variants, save_normalized)
+from recipes.models import Recipe
+
+formatter = logging.Formatter(
+    '%(asctime)s [%(levelname)s] %(message)s'
+)
+handler = logging.StreamHandler(stream=sys.stdout)
+handler.setFormatter(formatter)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+
+class Command(BaseCommand):
+    help = ('Создает уменьшенные копии (JPEG и WebP) картинок рецептов, '
+            'загруженных до появления обработки изображений, отмечает '
+            'картинки обработанными (image_ready) и при --normalize '
+            'уменьшает и очищает от EXIF сами картинки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать и уже существующие копии',
+        )
+        parser.add_argument(
+            '--normalize',
+            action='store_true',
+            help=('Перекодировать исходные картинки (наибольшая сторона '
+                  'RECIPE_IMAGE_MAX_SIDE, без EXIF)'),
+        )
+
+    def handle(self, *args, **options):
+        stats = Counter()
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_ready',
+        )
+        for recipe in recipes.iterator():
+            name = recipe.image.name
+            if not default_storage.exists(name):
+                logger.warning(f'Рецепт {recipe.id}: файл {name} не найден')
+                stats['missing'] += 1
+                continue
+            try:
+                if options['normalize']:
+                    name = self.normalize(recipe, name)
+                    stats['normalized'] += 1
+                if options['force'] or not has_variants(name):
+                    generate_variants(name)
+                    stats['processed'] += 1
+                else:
+                    stats['skipped'] += 1
+                stats['ready'] += self.mark_ready(recipe, name)
+            except (ImageTooLarge, OSError) as error:
+                logger.warning(f'Рецепт {recipe.id}: {name} - {error}')
+                stats['failed'] += 1
+        logger.info(
+            f'Картинок с новыми копиями: {stats["processed"]}, '
+            f'перекодировано: {stats["normalized"]}, '
+            f'пропущено: {stats["skipped"]}, '
+            f'отмечено обработанными: {stats["ready"]}, '
+            f'ошибок: {stats["failed"]}, '
+            f'файлов не найдено: {stats["missing"]}'
+        )
+
+    @staticmethod
+    def mark_ready(recipe, name):
+        """Отмечает картинку рецепта обработанной: у картинки есть копии,
+        и API начинает отдавать их (image_variants). Условие по имени
+        файла - чтобы не отметить картинку, замененную во время работы
+        команды. Возвращает количество отмеченных рецептов."""
+        if recipe.image_ready:
+            return 0
+        return Recipe.objects.filter(id=recipe.id, image=name).update(
+            image_ready=True,
+        )
+
+    @staticmethod
+    def normalize(recipe, name):
+        """Сохраняет перекодированную картинку под новым именем и
+        переключает на нее рецепт (update() - без сигналов, представления
+        рецептов в кэше url картинки не содержат), прежний файл и его
+        копии удаляются."""
+        new_name = save_normalized(name)
+        Recipe.objects.filter(id=recipe.id).update(image=new_name)
+        default_storage.delete(name)
+        delete_variants(name)
+        return new_name
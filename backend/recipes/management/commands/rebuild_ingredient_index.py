@@ -0,0 +1,28 @@
+import logging
+import sys
+
+from django.core.management.base import BaseCommand
+from recipes.pantry import rebuild_index
+
+formatter = logging.Formatter(
+    '%(asctime)s [%(levelname)s] %(message)s'
+)
+handler = logging.StreamHandler(stream=sys.stdout)
+handler.setFormatter(formatter)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает частоту ингредиентов и места ингредиентов '
+            'рецептов по редкости для подбора рецептов по продуктам '
+            '(/recipes/by_ingredients/). Предназначена для периодического '
+            'запуска (cron)')
+
+    def handle(self, *args, **options):
+        updated = rebuild_index()
+        logger.info(
+            f'Индекс перестроен, место по редкости изменилось у строк: '
+            f'{updated}'
+        )
@@ -0,0 +1,23 @@
+import logging
+import sys
+
+from django.core.management.base import BaseCommand
+from recipes.feed import rebuild_timelines
+
+formatter = logging.Formatter(
+    '%(asctime)s [%(levelname)s] %(message)s'
+)
+handler = logging.StreamHandler(stream=sys.stdout)
+handler.setFormatter(formatter)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+
+class Command(BaseCommand):
+    help = ('Перестраивает ленты подписок (/recipes/feed/) по подпискам '
+            'и последним рецептам авторов')
+
+    def handle(self, *args, **options):
+        entries = rebuild_timelines()
+        logger.info(f'Ленты перестроены, записей: {entries}')
@@ -0,0 +1,53 @@
+import logging
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Recipe
+from users.models import Subscription, User
+
+formatter = logging.Formatter(
+    '%(asctime)s [%(levelname)s] %(message)s'
+)
+handler = logging.StreamHandler(stream=sys.stdout)
+handler.setFormatter(formatter)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+
+def count_subquery(model, field):
+    """Подзапрос количества строк model, ссылающихся на текущий объект
+    через поле field (0, если строк нет)."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).values(
+                field).annotate(total=Count('pk')).values('total')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает хранимые счетчики: favorites_count и cart_count '
+            'рецептов, recipes_count и followers_count пользователей')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes_updated = Recipe.objects.update(
+            favorites_count=count_subquery(Recipe.favorited.through, 'recipe'),
+            cart_count=count_subquery(
+                Recipe.in_shopping_cart.through,
+                'recipe',
+            ),
+        )
+        logger.info(f'Счетчики пересчитаны для рецептов: {recipes_updated}')
+        users_updated = User.objects.update(
+            recipes_count=count_subquery(Recipe, 'author'),
+            followers_count=count_subquery(Subscription, 'author'),
+        )
+        logger.info(
+            f'Счетчики пересчитаны для пользователей: {users_updated}'
+        )
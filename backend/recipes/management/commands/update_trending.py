@@ -0,0 +1,71 @@
+import logging
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+from django.utils import timezone
+from recipes.models import Recipe
+
+formatter = logging.Formatter(
+    '%(asctime)s [%(levelname)s] %(message)s'
+)
+handler = logging.StreamHandler(stream=sys.stdout)
+handler.setFormatter(formatter)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+# Возраст рецепта в часах относительно параметра now.
+AGE_HOURS = {
+    'postgresql': 'EXTRACT(EPOCH FROM (%s - pub_date)) / 3600',
+    'sqlite': '(julianday(%s) - julianday(pub_date)) * 24',
+}
+# Рейтинг с затуханием по времени: популярность (избранное + корзина)
+# делится на возраст рецепта в часах в степени gravity; позиции
+# нумеруются оконной функцией и записываются одним UPDATE, строки с
+# неизменной позицией не перезаписываются.
+UPDATE_SQL = '''
+    UPDATE {recipe} SET trending_position = ranked.number
+    FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            ORDER BY score DESC, pub_date DESC, id DESC
+        ) AS number
+        FROM (
+            SELECT id, pub_date,
+                (favorites_count + cart_count) / POWER(
+                    CAST({age} AS DOUBLE PRECISION) + 2, %s
+                ) AS score
+            FROM {recipe}
+        ) scored
+    ) ranked
+    WHERE {recipe}.id = ranked.id
+        AND {recipe}.trending_position <> ranked.number
+'''
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает позиции рецептов в рейтинге «в тренде» '
+            '(Recipe.trending_position). Предназначена для периодического '
+            'запуска (cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--gravity',
+            type=float,
+            default=settings.TRENDING_GRAVITY,
+            help='Скорость затухания рейтинга с возрастом рецепта',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[router.db_for_write(Recipe)]
+        sql = UPDATE_SQL.format(
+            recipe=connection.ops.quote_name(Recipe._meta.db_table),
+            age=AGE_HOURS[connection.vendor],
+        )
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [now, options['gravity']])
+            updated = cursor.rowcount
+        logger.info(f'Рейтинг пересчитан, позиция изменилась у рецептов: '
+                    f'{updated}')
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.5 on 2026-10-18 18:21
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+UNRANKED = 2 ** 31 - 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_position',
+            field=models.PositiveIntegerField(default=UNRANKED, editable=False, verbose_name='Позиция в тренде'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(django.db.models.expressions.OrderBy(django.db.models.expressions.CombinedExpression(django.db.models.expressions.F('favorites_count'), '+', django.db.models.expressions.F('cart_count')), descending=True), django.db.models.expressions.OrderBy(django.db.models.expressions.F('pub_date'), descending=True), name='recipe_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['trending_position', '-pub_date', '-id'], name='recipe_trending_idx'),
+        ),
+    ]
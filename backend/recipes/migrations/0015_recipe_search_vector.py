@@ -0,0 +1,55 @@
+# Generated by Django 4.0.5 on 2026-10-18 18:26
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+UPDATE_SEARCH_VECTORS = '''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector(%(config)s::regconfig,
+                              coalesce(recipes_recipe.name, '')), 'A')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_ingredientamount amount
+            JOIN recipes_ingredient ingredient
+                ON ingredient.id = amount.ingredient_id
+            WHERE amount.recipe_id = recipes_recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector(%(config)s::regconfig,
+                                 coalesce(recipes_recipe.text, '')), 'C')
+'''
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+        'ON recipes_recipe USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        UPDATE_SEARCH_VECTORS,
+        {'config': settings.SEARCH_CONFIG},
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_ingredient_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.0.5 on 2026-10-18 18:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+RANK_SQL = '''
+    UPDATE {amount} SET rarity_rank = ranked.number
+    FROM (
+        SELECT amount.id, ROW_NUMBER() OVER (
+            PARTITION BY amount.recipe_id
+            ORDER BY ingredient.recipes_count, ingredient.id
+        ) - 1 AS number
+        FROM {amount} amount
+        JOIN {ingredient} ingredient ON ingredient.id = amount.ingredient_id
+    ) ranked
+    WHERE {amount}.id = ranked.id
+'''
+
+
+def build_index(apps, schema_editor):
+    """Частота ингредиентов, количество ингредиентов рецептов и места
+    ингредиентов рецептов по редкости."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    Recipe = apps.get_model('recipes', 'Recipe')
+
+    def count(field):
+        return Coalesce(
+            Subquery(
+                IngredientAmount.objects.filter(**{field: OuterRef('pk')})
+                .values(field).annotate(total=Count('pk')).values('total')
+            ),
+            0,
+        )
+
+    Ingredient.objects.update(recipes_count=count('ingredient'))
+    Recipe.objects.update(ingredients_count=count('recipe'))
+    quote = schema_editor.connection.ops.quote_name
+    schema_editor.execute(RANK_SQL.format(
+        amount=quote(IngredientAmount._meta.db_table),
+        ingredient=quote(Ingredient._meta.db_table),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='rarity_rank',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Место по редкости'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Количество ингредиентов'),
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredientamount',
+            index=models.Index(fields=['ingredient', 'rarity_rank', 'recipe'], name='amount_ingredient_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.5 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+def mark_without_image(apps, schema_editor):
+    """Рецепты без картинки обрабатывать не нужно; рецепты с картинкой
+    остаются необработанными до process_images или фоновой задачи."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.filter(image='').update(image_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_ingredient_rarity_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Картинка обработана'),
+        ),
+        migrations.RunPython(mark_without_image, migrations.RunPython.noop),
+    ]
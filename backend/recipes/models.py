@@ -1,10 +1,15 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
 from users.models import User
 
 
 class Ingredient(models.Model):
-    """Модель ингредиента."""
+    """Модель ингредиента.
+    recipes_count - в скольких рецептах встречается ингредиент;
+    пересчитывается командой rebuild_ingredient_index и задает порядок
+    ингредиентов рецепта по редкости (IngredientAmount.rarity_rank)."""
 
     name = models.CharField(
         max_length=128,
@@ -15,6 +20,11 @@ class Ingredient(models.Model):
         max_length=32,
         verbose_name='Единица измерения'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -46,7 +56,14 @@ class Tag(models.Model):
 
 
 class Recipe(models.Model):
-    """Модель рецепта."""
+    """Модель рецепта.
+    trending_position - позиция в рейтинге «в тренде» (1 - первая),
+    пересчитывается командой update_trending; рецепты, еще не попавшие
+    в расчет, имеют позицию UNRANKED и идут в конце. ingredients_count -
+    количество ингредиентов рецепта для подбора по продуктам
+    (recipes.pantry)."""
+
+    UNRANKED = 2 ** 31 - 1
 
     name = models.CharField(max_length=200, verbose_name='Название')
     text = models.TextField(blank=True, verbose_name='Описание')
@@ -65,6 +82,11 @@ class Recipe(models.Model):
         upload_to='recipes/',
         blank=True,
     )
+    image_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Картинка обработана',
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления (мин)'
     )
@@ -89,6 +111,31 @@ class Recipe(models.Model):
         verbose_name='В корзине',
         blank=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное',
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в корзину',
+    )
+    ingredients_count = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество ингредиентов',
+    )
+    trending_position = models.PositiveIntegerField(
+        default=UNRANKED,
+        editable=False,
+        verbose_name='Позиция в тренде',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -100,12 +147,36 @@ class Recipe(models.Model):
                 name='unique_author_recipe',
             )
         ]
+        indexes = [
+            models.Index(
+                (F('favorites_count') + F('cart_count')).desc(),
+                F('pub_date').desc(),
+                name='recipe_popularity_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=('trending_position', '-pub_date', '-id'),
+                name='recipe_trending_idx',
+            ),
+        ]
+
+    @staticmethod
+    def popularity():
+        """Выражение популярности рецепта: число добавлений в избранное
+        и в корзину. Совпадает с выражением индекса recipe_popularity_idx."""
+        return F('favorites_count') + F('cart_count')
 
 
 class IngredientAmount(models.Model):
     """Модель количества ингредиента.
     Промежуточная модель для Many-to-Many связи модели рецепта (Recipe)
-    с моделью ингредиента (Ingredient)."""
+    с моделью ингредиента (Ingredient). rarity_rank - место ингредиента
+    среди ингредиентов рецепта от редких к частым (0 - самый редкий),
+    используется для отбора кандидатов при подборе по продуктам
+    (recipes.pantry)."""
 
     amount = models.PositiveSmallIntegerField(verbose_name='Количество')
     recipe = models.ForeignKey(
@@ -118,6 +189,11 @@ class IngredientAmount(models.Model):
         on_delete=models.RESTRICT,
         verbose_name='Ингредиент'
     )
+    rarity_rank = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Место по редкости',
+    )
 
     class Meta:
         verbose_name = 'Количество ингредиента'
@@ -128,3 +204,55 @@ class IngredientAmount(models.Model):
                 name='unique_recipe_ingredient',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('ingredient', 'rarity_rank', 'recipe'),
+                name='amount_ingredient_rank_idx',
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Модель ленты подписок: рецепт автора, на которого подписан
+    пользователь. Записи добавляются при публикации рецепта подписчикам
+    автора (fan-out on write) и при подписке, удаляются при отписке
+    (recipes.feed). Дата публикации рецепта хранится в записи, поэтому
+    страница ленты читается по одному индексу timeline_user_idx."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        db_index=False,
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False,
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_idx',
+            ),
+        ]
@@ -0,0 +1,121 @@
+from django.db import connections, router, transaction
+from django.db.models import Count, F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Ingredient, IngredientAmount, Recipe
+
+# Места ингредиентов рецептов по редкости: нумерация внутри рецепта
+# по возрастанию Ingredient.recipes_count; {where} - условие на рецепты.
+# Строки с неизменным местом не перезаписываются.
+RANK_SQL = '''
+    UPDATE {amount} SET rarity_rank = ranked.number
+    FROM (
+        SELECT amount.id, ROW_NUMBER() OVER (
+            PARTITION BY amount.recipe_id
+            ORDER BY ingredient.recipes_count, ingredient.id
+        ) - 1 AS number
+        FROM {amount} amount
+        JOIN {ingredient} ingredient ON ingredient.id = amount.ingredient_id
+        {where}
+    ) ranked
+    WHERE {amount}.id = ranked.id AND {amount}.rarity_rank <> ranked.number
+'''
+
+
+def count_subquery(field):
+    """Подзапрос количества строк IngredientAmount, ссылающихся на текущий
+    объект через поле field."""
+    return Coalesce(
+        Subquery(
+            IngredientAmount.objects.filter(**{field: OuterRef('pk')}).values(
+                field).annotate(total=Count('pk')).values('total')
+        ),
+        0,
+    )
+
+
+def rank_ingredients(ingredients):
+    """Места ингредиентов рецепта по редкости {id ингредиента: место}
+    для объектов Ingredient, 0 - самый редкий."""
+    ordered = sorted(
+        ingredients,
+        key=lambda ingredient: (ingredient.recipes_count, ingredient.id),
+    )
+    return {ingredient.id: rank for rank, ingredient in enumerate(ordered)}
+
+
+@transaction.atomic
+def update_index(recipe_ids=None):
+    """Пересчитывает по таблице IngredientAmount количество ингредиентов
+    и места ингредиентов по редкости у рецептов recipe_ids (None - у всех
+    рецептов). Нужен, когда состав изменен в обход RecipePostSerializer
+    (админка, загрузка данных). Возвращает количество строк
+    IngredientAmount, у которых изменилось место."""
+    recipes = Recipe.objects.all()
+    where = ''
+    params = []
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return 0
+        recipes = recipes.filter(id__in=recipe_ids)
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        where = f'WHERE amount.recipe_id IN ({placeholders})'
+        params = recipe_ids
+    recipes.update(ingredients_count=count_subquery('recipe'))
+    connection = connections[router.db_for_write(IngredientAmount)]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RANK_SQL.format(
+                amount=quote(IngredientAmount._meta.db_table),
+                ingredient=quote(Ingredient._meta.db_table),
+                where=where,
+            ),
+            params,
+        )
+        return cursor.rowcount
+
+
+@transaction.atomic
+def rebuild_index():
+    """Пересчитывает частоту ингредиентов (Ingredient.recipes_count),
+    затем количество и места ингредиентов всех рецептов. Возвращает
+    количество строк IngredientAmount, у которых изменилось место."""
+    Ingredient.objects.update(recipes_count=count_subquery('ingredient'))
+    return update_index()
+
+
+def find_recipes(queryset, ingredient_ids, missing_max=0):
+    """Подбирает рецепты queryset по набору имеющихся ингредиентов:
+    рецепты, в которых есть хотя бы один из ингредиентов и не хватает
+    не более missing_max. Возвращает QuerySet (страница выбирается в БД),
+    упорядоченный по доле имеющихся ингредиентов (coverage), затем по
+    числу недостающих (missing), затем от новых к старым.
+    Кандидаты отбираются по индексу amount_ingredient_rank_idx: если
+    не хватает не более missing_max ингредиентов, то хотя бы один из
+    missing_max + 1 самых редких ингредиентов рецепта есть в наборе.
+    Поэтому частые ингредиенты (соль, мука) дают кандидатов, только когда
+    они - среди самых редких в рецепте, а не для всех рецептов с ними.
+    Места по редкости влияют лишь на число кандидатов, не на результат,
+    пока у каждого рецепта они не больше нумерации 0, 1, ... в каком-либо
+    порядке: устаревшие после пересчета частот места и нулевые места
+    новых строк допустимы, пропуски в нумерации - нет.
+    Для кандидатов совпадения считаются GROUP BY ... HAVING по индексу
+    уникальности (рецепт, ингредиент)."""
+    candidates = IngredientAmount.objects.filter(
+        ingredient_id__in=ingredient_ids,
+        rarity_rank__lte=missing_max,
+    ).values('recipe_id')
+    return queryset.filter(
+        id__in=candidates,
+        ingredients_count__lte=len(ingredient_ids) + missing_max,
+        ingredientamount__ingredient_id__in=ingredient_ids,
+    ).annotate(
+        found=Count('ingredientamount'),
+    ).annotate(
+        missing=F('ingredients_count') - F('found'),
+        coverage=Cast('found', FloatField()) / F('ingredients_count'),
+    ).filter(
+        missing__lte=missing_max,
+    ).order_by('-coverage', 'missing', '-id')
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from PIL import Image, ImageDraw, ImageFont
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: вместо записи возвращает строку,
+    что позволяет отдавать csv построчно без промежуточного файла."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer, ABC):
+    """Базовый рендерер списка покупок.
+    Список покупок - последовательность кортежей
+    (наименование, единица измерения, количество). Наследники обязаны
+    реализовать генератор stream (абстрактный метод), который используется
+    вьюсетом для потоковой отдачи (StreamingHttpResponse). Метод render
+    нужен для ответов, сформированных DRF (например, ошибок
+    аутентификации), в согласованном формате.
+    Рендереры, которые формируют документ целиком (streaming = False),
+    вызываются во вьюсете до отдачи ответа: под ASGI потоковый ответ
+    итерируется в цикле событий, и тяжелый рендеринг блокировал бы его."""
+
+    charset = 'utf-8'
+    extension = None
+    streaming = True
+    # Строки списка склеиваются в куски такого размера, чтобы сервер
+    # (особенно ASGI, где каждый кусок - отдельное сообщение) не отправлял
+    # ответ по одной строке.
+    chunk_size = 64 * 1024
+
+    @staticmethod
+    def get_rows(data):
+        if isinstance(data, dict):
+            return [(f'{key}: {value}',) for key, value in data.items()]
+        return data
+
+    @abstractmethod
+    def stream(self, rows):
+        """Генератор байтовых частей документа для строк rows."""
+
+    def stream_chunks(self, rows):
+        chunk = []
+        size = 0
+        for part in self.stream(rows):
+            chunk.append(part)
+            size += len(part)
+            if size >= self.chunk_size:
+                yield b''.join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield b''.join(chunk)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(self.stream(self.get_rows(data)))
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    extension = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        for row in rows:
+            yield writer.writerow(row).encode(self.charset)
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    extension = 'txt'
+
+    @staticmethod
+    def format_row(row):
+        if len(row) == 3:
+            name, measurement_unit, amount = row
+            return f'{name} ({measurement_unit}) — {amount}'
+        return ' '.join(str(value) for value in row)
+
+    def stream(self, rows):
+        for row in rows:
+            yield f'{self.format_row(row)}\n'.encode(self.charset)
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    extension = 'json'
+    charset = None
+
+    def stream(self, rows):
+        yield b'['
+        for number, row in enumerate(rows):
+            if len(row) == 3:
+                name, measurement_unit, amount = row
+                item = {
+                    'name': name,
+                    'measurement_unit': measurement_unit,
+                    'amount': amount,
+                }
+            else:
+                item = row[0]
+            prefix = ', ' if number else ''
+            yield (prefix + json.dumps(item, ensure_ascii=False)).encode()
+        yield b']'
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """Рендерер списка покупок в pdf.
+    Страницы формата A4 растеризуются средствами Pillow (уже используется
+    проектом для изображений), поэтому для кириллицы нужен TrueType-шрифт:
+    путь или имя файла задается настройкой SHOPPING_LIST_PDF_FONT.
+    Встроенный шрифт Pillow кириллицу не поддерживает, поэтому без
+    TrueType-шрифта рендеринг завершается ошибкой конфигурации."""
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    extension = 'pdf'
+    charset = None
+    streaming = False
+
+    page_size = (827, 1169)
+    margin = 60
+    font_size = 22
+    line_spacing = 12
+
+    def get_font(self):
+        try:
+            return ImageFont.truetype(
+                settings.SHOPPING_LIST_PDF_FONT,
+                self.font_size,
+            )
+        except OSError as error:
+            raise ImproperlyConfigured(
+                'Не найден шрифт для списка покупок в pdf '
+                f'(SHOPPING_LIST_PDF_FONT={settings.SHOPPING_LIST_PDF_FONT}): '
+                'установите TrueType-шрифт с кириллицей, например '
+                'fonts-dejavu-core'
+            ) from error
+
+    def stream(self, rows):
+        font = self.get_font()
+        line_height = self.font_size + self.line_spacing
+        lines_per_page = (
+            (self.page_size[1] - 2 * self.margin) // line_height
+        )
+        lines = [
+            ShoppingListTextRenderer.format_row(row) for row in rows
+        ] or ['']
+        pages = []
+        for start in range(0, len(lines), lines_per_page):
+            page = Image.new('RGB', self.page_size, 'white')
+            draw = ImageDraw.Draw(page)
+            for number, line in enumerate(
+                lines[start:start + lines_per_page]
+            ):
+                draw.text(
+                    (self.margin, self.margin + number * line_height),
+                    line,
+                    font=font,
+                    fill='black',
+                )
+            pages.append(page)
+        buffer = io.BytesIO()
+        pages[0].save(
+            buffer,
+            format='PDF',
+            save_all=True,
+            append_images=pages[1:],
+            resolution=100.0,
+        )
+        yield buffer.getvalue()
+
+
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListCSVRenderer,
+    ShoppingListTextRenderer,
+    ShoppingListJSONRenderer,
+    ShoppingListPDFRenderer,
+)
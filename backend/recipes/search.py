@@ -0,0 +1,249 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from api.cache import bump_version, get_version
+from api.replicas import primary_reads
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connections
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Q,
+                              Subquery, Value, When)
+from django.db.models.functions import Coalesce
+
+from .models import Ingredient, IngredientAmount, Recipe
+
+WORD_SPLIT = re.compile(r'\W+')
+
+
+def trigrams(value):
+    """Множество триграмм строки в духе pg_trgm: строка приводится к нижнему
+    регистру, каждое слово дополняется двумя пробелами в начале и одним
+    в конце."""
+    result = set()
+    for word in WORD_SPLIT.split(value.lower()):
+        if not word:
+            continue
+        padded = f'  {word} '
+        result.update(
+            padded[index:index + 3] for index in range(len(padded) - 2)
+        )
+    return result
+
+
+class IngredientSearchIndex:
+    """Индекс ингредиентов в памяти процесса для СУБД без pg_trgm (SQLite
+    в тестах и локальной разработке).
+    Префиксный поиск - бинарный поиск по отсортированному списку
+    наименований; поиск по вхождению и нечеткий поиск - по инвертированному
+    индексу триграмм (триграмма -> идентификаторы ингредиентов)."""
+
+    similarity_threshold = 0.3
+
+    def __init__(self, rows):
+        self.names = {}
+        self.sorted_names = []
+        self.postings = {}
+        for ingredient_id, name in rows:
+            name = name.lower()
+            self.names[ingredient_id] = name
+            self.sorted_names.append((name, ingredient_id))
+            for trigram in trigrams(name):
+                self.postings.setdefault(trigram, []).append(ingredient_id)
+        self.sorted_names.sort()
+        self.trigram_counts = {
+            ingredient_id: len(trigrams(name))
+            for ingredient_id, name in self.names.items()
+        }
+
+    def prefix_matches(self, value):
+        start = bisect_left(self.sorted_names, (value,))
+        for name, ingredient_id in self.sorted_names[start:]:
+            if not name.startswith(value):
+                break
+            yield ingredient_id
+
+    def search(self, value, limit=None):
+        """Возвращает идентификаторы ингредиентов в порядке выдачи:
+        сначала совпадения по началу наименования, затем по вхождению
+        в произвольном месте (оба - по алфавиту), затем похожие наименования
+        (по убыванию сходства триграмм)."""
+        value = value.lower()
+        result = list(self.prefix_matches(value))
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        found = set(result)
+        value_trigrams = trigrams(value)
+        shared = Counter()
+        for trigram in value_trigrams:
+            shared.update(self.postings.get(trigram, ()))
+        result.extend(sorted(
+            (
+                ingredient_id for ingredient_id in self.names
+                if ingredient_id not in found
+                and value in self.names[ingredient_id]
+            ) if len(value) < 3 else (
+                ingredient_id for ingredient_id in shared
+                if ingredient_id not in found
+                and value in self.names[ingredient_id]
+            ),
+            key=self.names.get,
+        ))
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        found.update(result)
+        similar = []
+        for ingredient_id, common in shared.items():
+            if ingredient_id in found:
+                continue
+            similarity = common / (
+                len(value_trigrams)
+                + self.trigram_counts[ingredient_id]
+                - common
+            )
+            if similarity > self.similarity_threshold:
+                similar.append(
+                    (-similarity, self.names[ingredient_id], ingredient_id)
+                )
+        similar.sort()
+        result.extend(ingredient_id for _, _, ingredient_id in similar)
+        return result if limit is None else result[:limit]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс ингредиентов текущего процесса. Перестраивается, если версия
+    пространства имен кэша ingredients сменилась (общая для всех
+    процессов при общем бэкенде кэша). Индекс строится по основной базе:
+    построенный по отстающей реплике, он остался бы устаревшим до
+    следующей смены версии."""
+    version = get_version('ingredients')
+    with _indexes_lock, primary_reads():
+        built_version, index = _indexes.get('ingredients', (None, None))
+        if built_version != version:
+            index = IngredientSearchIndex(
+                Ingredient.objects.values_list('id', 'name').iterator()
+            )
+            _indexes['ingredients'] = (version, index)
+        return index
+
+
+def reset_index():
+    """Сбрасывает индекс и закэшированные ответы /ingredients во всех
+    процессах. Вызывается при изменении ингредиентов (сигналы, команда
+    load_ingredients)."""
+    bump_version('ingredients')
+
+
+def search_ingredients(queryset, value, limit=None):
+    """Поиск ингредиентов по наименованию.
+    На PostgreSQL использует GIN-индексы pg_trgm (вхождение - LIKE по
+    UPPER(name), опечатки - оператор %), на прочих СУБД -
+    IngredientSearchIndex. Порядок выдачи: совпадения по началу
+    наименования, по вхождению, затем похожие по триграммам."""
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.filter(
+            Q(name__icontains=value) | Q(name__trigram_similar=value)
+        ).annotate(
+            order=Case(
+                When(name__istartswith=value, then=Value(1)),
+                When(name__icontains=value, then=Value(2)),
+                default=Value(3),
+            ),
+            similarity=TrigramSimilarity('name', value),
+        ).order_by('order', '-similarity', 'name')
+    ids = get_index().search(value, limit)
+    return queryset.filter(id__in=ids).annotate(
+        order=Case(
+            *[When(id=ingredient_id, then=Value(position))
+              for position, ingredient_id in enumerate(ids)],
+            output_field=IntegerField(),
+        ),
+    ).order_by('order')
+
+
+def search_vector():
+    """Выражение поискового вектора рецепта: наименование - вес A,
+    наименования ингредиентов - B, описание - C."""
+    ingredient_names = Subquery(
+        IngredientAmount.objects.filter(
+            recipe=OuterRef('pk'),
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' '),
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=settings.SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(ingredient_names, Value('')),
+            weight='B',
+            config=settings.SEARCH_CONFIG,
+        )
+        + SearchVector('text', weight='C', config=settings.SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipe_ids=None):
+    """Пересчитывает хранимый поисковый вектор рецептов (все рецепты или
+    recipe_ids). Вне PostgreSQL поиск работает без вектора."""
+    if connections[Recipe.objects.db].vendor != 'postgresql':
+        return
+    queryset = Recipe.objects.all()
+    if recipe_ids is not None:
+        queryset = queryset.filter(id__in=recipe_ids)
+    queryset.update(search_vector=search_vector())
+
+
+def set_search_vector(recipe):
+    """Назначает рецепту выражение поискового вектора, чтобы вектор
+    пересчитался тем же UPDATE, что сохраняет остальные поля
+    (save(update_fields=...)). Вне PostgreSQL ничего не делает и
+    возвращает False."""
+    if connections[Recipe.objects.db].vendor != 'postgresql':
+        return False
+    recipe.search_vector = search_vector()
+    return True
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск рецептов с сортировкой по релевантности.
+    На PostgreSQL - по хранимому вектору (GIN-индекс) с ранжированием
+    SearchRank, на прочих СУБД - по вхождению каждого слова запроса
+    в наименование, описание или наименования ингредиентов."""
+    if connections[queryset.db].vendor == 'postgresql':
+        query = SearchQuery(
+            value,
+            config=settings.SEARCH_CONFIG,
+            search_type='websearch',
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query),
+        ).order_by('-rank', '-pub_date')
+    for word in value.split():
+        queryset = queryset.filter(
+            Q(name__icontains=word)
+            | Q(text__icontains=word)
+            | Exists(IngredientAmount.objects.filter(
+                recipe=OuterRef('pk'),
+                ingredient__name__icontains=word,
+            ))
+        )
+    return queryset.annotate(
+        rank=Case(
+            When(name__icontains=value, then=Value(3)),
+            When(
+                Exists(IngredientAmount.objects.filter(
+                    recipe=OuterRef('pk'),
+                    ingredient__name__icontains=value,
+                )),
+                then=Value(2),
+            ),
+            default=Value(1),
+        ),
+    ).order_by('-rank', '-pub_date')
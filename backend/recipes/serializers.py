@@ -1,9 +1,24 @@
-from django.db import transaction
-from drf_extra_fields.fields import Base64ImageField
+import binascii
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models, transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from jobs.queue import enqueue
 from rest_framework import serializers
+from users.models import User
 from users.serializers import CurrentUserSerializer
+from users.viewer import get_viewer_state
 
+from .cache import (delete_fragments, get_fragments, get_fragments_version,
+                    set_fragments)
+from .feed import fan_out
+from .images import ImageTooLarge, open_image, variant_names
 from .models import Ingredient, IngredientAmount, Recipe, Tag
+from .pantry import rank_ingredients
+from .search import set_search_vector, update_search_vectors
+from .uploads import decode_base64
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -11,7 +26,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit',)
 
 
 class IngredientAmountSerializer(serializers.ModelSerializer):
@@ -49,15 +64,83 @@ class TagSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RecipeImageField(Base64ImageField):
+    """Картинка рецепта: строка base64 в JSON или файл (multipart/form-data
+    и загрузка телом запроса, recipes.uploads). base64 декодируется
+    порциями во временный файл, без копии декодированных данных в памяти.
+    Размер проверяется до декодирования (RECIPE_IMAGE_MAX_BYTES) и по
+    заголовку изображения (RECIPE_IMAGE_MAX_PIXELS). Сохраняется
+    загруженный файл как есть, уменьшенную копию без EXIF и варианты
+    создает фоновая задача (recipes.tasks.process_image)."""
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if isinstance(data, str):
+            size = len(data) // 4 * 3
+        elif isinstance(data, UploadedFile):
+            size = data.size
+        else:
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        if size > settings.RECIPE_IMAGE_MAX_BYTES:
+            raise serializers.ValidationError(
+                'Размер изображения больше '
+                f'{round(settings.RECIPE_IMAGE_MAX_BYTES / 2 ** 20, 1):g} МБ.'
+            )
+        if isinstance(data, str):
+            data = self.decode(data)
+        try:
+            image_format = open_image(data).format
+        except ImageTooLarge as error:
+            raise serializers.ValidationError(str(error))
+        except OSError:
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        extension = image_format.lower().replace('jpeg', 'jpg')
+        if extension not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        data.name = f'{self.get_file_name(data)}.{extension}'
+        data.seek(0)
+        uploaded = super(Base64FieldMixin, self).to_internal_value(data)
+        uploaded.seek(0)
+        return uploaded
+
+    def decode(self, data):
+        """Декодирует data URL или строку base64 во временный файл."""
+        header_end = data.find(';base64,', 0, 100)
+        try:
+            return decode_base64(
+                data,
+                header_end + len(';base64,') if header_end >= 0 else 0,
+            )
+        except (binascii.Error, ValueError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Представление списка рецептов с получением закэшированных
+    фрагментов всей страницы одним запросом к кэшу."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        return self.child.to_representation_many(iterable)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для представления списка рецептов и деталей рецепта.
     Также используется в качестве представления (to_representation)
     при создании рецептов в рамках соответствующего сериализатора
-    (RecipePostSerializer)."""
+    (RecipePostSerializer).
+    Не зависящая от пользователя часть представления кэшируется по id
+    рецепта (recipes.cache); признаки избранного, корзины, подписки на
+    автора (по множествам id текущего пользователя, users.viewer) и
+    абсолютные url картинки и ее уменьшенных копий (image_variants)
+    вычисляются для каждого запроса. Пока картинка не обработана фоновой
+    задачей, image - исходный файл, а image_variants - null."""
 
     tags = TagSerializer(read_only=True, many=True)
     author = CurrentUserSerializer(read_only=True)
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -65,75 +148,320 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time',)
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time',)
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, instances):
+        version = get_fragments_version()
+        fragments = get_fragments(
+            [instance.pk for instance in instances],
+            version,
+        )
+        prefetch_related_objects(
+            [instance for instance in instances
+             if instance.pk not in fragments],
+            'tags',
+            Prefetch(
+                'ingredientamount_set',
+                queryset=IngredientAmount.objects.select_related('ingredient'),
+            ),
+        )
+        missing = {}
+        result = []
+        viewer = get_viewer_state(self.context.get('request'))
+        for instance in instances:
+            fragment = fragments.get(instance.pk)
+            if fragment is None:
+                fragment = missing[instance.pk] = self.make_fragment(
+                    super().to_representation(instance)
+                )
+            result.append({
+                **fragment,
+                'author': {
+                    **fragment['author'],
+                    'is_subscribed': self.fields['author'].get_is_subscribed(
+                        instance.author
+                    ),
+                },
+                'is_favorited': instance.id in viewer.favorites,
+                'is_in_shopping_cart': instance.id in viewer.shopping_cart,
+                'image': self.fields['image'].to_representation(
+                    instance.image
+                ),
+                'image_variants': self.get_image_variants(instance),
+            })
+        set_fragments(missing, version, settings.API_CACHE_TIMEOUT)
+        return result
+
+    @staticmethod
+    def make_fragment(representation):
+        """Фрагмент для кэша: представление без полей, зависящих от
+        запроса (их места сохраняются, чтобы не менялся порядок полей)."""
+        return {
+            **representation,
+            'author': {**representation['author'], 'is_subscribed': None},
+            'is_favorited': None,
+            'is_in_shopping_cart': None,
+            'image': None,
+            'image_variants': None,
+        }
+
+    def get_image_variants(self, obj):
+        """Абсолютные URL уменьшенных копий картинки:
+        {'list': {'jpg': ..., 'webp': ...}, 'detail': {...}}."""
+        if not obj.image or not obj.image_ready:
+            return None
+        request = self.context.get('request')
+        storage = obj.image.storage
+        return {
+            variant: {
+                extension: (
+                    request.build_absolute_uri(storage.url(name))
+                    if request else storage.url(name)
+                )
+                for extension, name in names.items()
+            }
+            for variant, names in variant_names(obj.image.name).items()
+        }
 
     def get_ingredients(self, obj):
         return FullIngredientAmountSerializer(
-            IngredientAmount.objects.filter(recipe=obj),
+            obj.ingredientamount_set.all(),
             many=True,
         ).data
 
     def get_is_favorited(self, obj):
-        return obj.favorited.filter(
-            id=self.context.get('request').user.id
-        ).exists()
+        return obj.id in get_viewer_state(
+            self.context.get('request')
+        ).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        return obj.in_shopping_cart.filter(
-            id=self.context.get('request').user.id
-        ).exists()
+        return obj.id in get_viewer_state(
+            self.context.get('request')
+        ).shopping_cart
+
+
+class PantrySerializer(serializers.Serializer):
+    """Сериализатор параметров подбора рецептов по продуктам
+    (action by_ingredients вьюсета RecipeViewSet): have - идентификаторы
+    имеющихся ингредиентов через запятую, missing_max - сколько
+    ингредиентов рецепта может не хватать."""
+
+    have = serializers.CharField()
+    missing_max = serializers.IntegerField(
+        min_value=0,
+        max_value=255,
+        default=0,
+    )
+
+    def validate_have(self, value):
+        try:
+            ingredient_ids = {int(item) for item in value.split(',') if item}
+        except ValueError:
+            raise serializers.ValidationError(
+                'Укажите идентификаторы ингредиентов через запятую.'
+            )
+        if not ingredient_ids:
+            raise serializers.ValidationError(
+                'Укажите хотя бы один ингредиент.'
+            )
+        return ingredient_ids
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор пакетного добавления рецептов в избранное или корзину
+    и удаления из них: recipes - список идентификаторов рецептов (не больше
+    RECIPE_BULK_MAX_SIZE, повторы отбрасываются с сохранением порядка)."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BULK_MAX_SIZE,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
 
 
 class RecipePostSerializer(serializers.ModelSerializer):
     """Сериализатор для создания (create) и обновления (update) рецептов."""
 
     ingredients = IngredientAmountSerializer(many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
         fields = ('ingredients', 'tags', 'image', 'name', 'text',
                   'cooking_time',)
 
+    def validate_ingredients(self, value):
+        ingredient_ids = [ingredient['id'].id for ingredient in value]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Ингредиенты рецепта не должны повторяться.'
+            )
+        return value
+
     @staticmethod
     def ingredients_tags_create(instance, ingredients, tags):
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredients_list.append(IngredientAmount(
+        ranks = rank_ingredients(
+            ingredient['id'] for ingredient in ingredients
+        )
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(
                 amount=ingredient['amount'],
                 recipe=instance,
                 ingredient=ingredient['id'],
-            ))
-        IngredientAmount.objects.bulk_create(ingredients_list)
-        for tag in tags:
-            instance.tags.add(tag)
+                rarity_rank=ranks[ingredient['id'].id],
+            )
+            for ingredient in ingredients
+        ])
+        instance.tags.add(*tags)
+
+    @staticmethod
+    def ingredients_update(instance, ingredients):
+        """Приводит количества ингредиентов рецепта к ingredients, изменяя
+        только отличающиеся строки: удаленные ингредиенты - одним DELETE,
+        новые - одним INSERT (bulk_create), измененные количества и места
+        по редкости (recipes.pantry) - одним UPDATE (bulk_update).
+        Возвращает прежние id ингредиентов."""
+        current = {
+            amount.ingredient_id: amount
+            for amount in IngredientAmount.objects.filter(recipe=instance)
+        }
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        ranks = rank_ingredients(
+            ingredient['id'] for ingredient in ingredients
+        )
+        removed = [
+            amount.id for ingredient_id, amount in current.items()
+            if ingredient_id not in amounts
+        ]
+        if removed:
+            IngredientAmount.objects.filter(id__in=removed).delete()
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(
+                amount=amount,
+                recipe=instance,
+                ingredient_id=ingredient_id,
+                rarity_rank=ranks[ingredient_id],
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ])
+        changed = []
+        for ingredient_id, amount in current.items():
+            if ingredient_id not in amounts:
+                continue
+            if (amount.amount, amount.rarity_rank) != (
+                amounts[ingredient_id], ranks[ingredient_id]
+            ):
+                amount.amount = amounts[ingredient_id]
+                amount.rarity_rank = ranks[ingredient_id]
+                changed.append(amount)
+        IngredientAmount.objects.bulk_update(
+            changed,
+            ('amount', 'rarity_rank'),
+        )
+        return set(current)
+
+    @classmethod
+    def relations_update(cls, instance, ingredients, tags):
+        """Изменяет ингредиенты и теги рецепта, если они переданы (None -
+        не изменять). Возвращает прежние и новые id ингредиентов."""
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is None:
+            return set(), set()
+        return (
+            cls.ingredients_update(instance, ingredients),
+            {ingredient['id'].id for ingredient in ingredients},
+        )
+
+    @staticmethod
+    def process_image(recipe):
+        """Ставит обработку загруженной картинки в фоновую очередь
+        (в той же транзакции, что и рецепт)."""
+        enqueue(
+            'recipes.process_image',
+            recipe_id=recipe.id,
+            name=recipe.image.name,
+        )
 
     @transaction.atomic
     def create(self, validated_data):
         current_ingredients = validated_data.pop('ingredients')
         current_tags = validated_data.pop('tags')
+        validated_data['image_ready'] = not validated_data.get('image')
+        validated_data['ingredients_count'] = len(current_ingredients)
         recipe_created = Recipe.objects.create(**validated_data)
         self.ingredients_tags_create(
             recipe_created,
             current_ingredients,
             current_tags,
         )
-        recipe_created.save()
+        User.objects.filter(id=recipe_created.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+        update_search_vectors([recipe_created.id])
+        fan_out(recipe_created.id)
+        if recipe_created.image:
+            self.process_image(recipe_created)
         return recipe_created
 
     @transaction.atomic
     def update(self, recipe_updated, validated_data):
-        current_ingredients = validated_data.pop('ingredients')
-        current_tags = validated_data.pop('tags')
-        recipe_updated.ingredients.clear()
-        recipe_updated.tags.clear()
-        self.ingredients_tags_create(
+        """Обновляет рецепт, не пересоздавая связи: ингредиенты и теги
+        изменяются на разницу с текущими (ingredients_update, tags.set()),
+        при частичном обновлении (PATCH) - только если переданы. Поля
+        рецепта и поисковый вектор (при изменении состава, названия или
+        описания) и количество ингредиентов (при его изменении)
+        записываются одним UPDATE."""
+        old_ingredient_ids, new_ingredient_ids = self.relations_update(
             recipe_updated,
-            current_ingredients,
-            current_tags,
+            validated_data.pop('ingredients', None),
+            validated_data.pop('tags', None),
+        )
+        text_changed = any(
+            getattr(recipe_updated, attr) != validated_data[attr]
+            for attr in ('name', 'text') if attr in validated_data
         )
-        recipe_updated.save()
+        if 'image' in validated_data:
+            validated_data['image_ready'] = not validated_data['image']
+        ingredients_count = len(new_ingredient_ids)
+        if ingredients_count and (
+            ingredients_count != recipe_updated.ingredients_count
+        ):
+            validated_data['ingredients_count'] = ingredients_count
+        for attr, value in validated_data.items():
+            setattr(recipe_updated, attr, value)
+        # Хранимые счетчики изменяются только атомарно (F()), поэтому
+        # сохраняются лишь поля, пришедшие в запросе.
+        update_fields = list(validated_data)
+        ingredients_changed = old_ingredient_ids != new_ingredient_ids
+        if (ingredients_changed or text_changed) and set_search_vector(
+            recipe_updated
+        ):
+            update_fields.append('search_vector')
+        if not update_fields:
+            # Изменены только связи: bulk_create и bulk_update ингредиентов
+            # не отправляют сигналов, а save() не нужен.
+            delete_fragments([recipe_updated.id])
+        else:
+            recipe_updated.save(update_fields=update_fields)
+        if 'search_vector' in update_fields:
+            # Выражение вектора не остается в объекте: поле снова
+            # отложенное и при обращении читается из БД.
+            del recipe_updated.search_vector
+        if 'image' in validated_data and recipe_updated.image:
+            self.process_image(recipe_updated)
         return recipe_updated
 
     def to_representation(self, obj):
@@ -141,3 +469,28 @@ class RecipePostSerializer(serializers.ModelSerializer):
             obj,
             context={'request': self.context.get('request')},
         ).data
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Сериализатор замены картинки рецепта файлом (action image вьюсета
+    RecipeViewSet)."""
+
+    image = RecipeImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    @transaction.atomic
+    def update(self, recipe, validated_data):
+        recipe.image = validated_data['image']
+        recipe.image_ready = False
+        recipe.save(update_fields=('image', 'image_ready'))
+        RecipePostSerializer.process_image(recipe)
+        return recipe
+
+    def to_representation(self, obj):
+        return RecipeSerializer(
+            obj,
+            context={'request': self.context.get('request')},
+        ).data
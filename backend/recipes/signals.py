@@ -0,0 +1,89 @@
+from api.cache import bump_version
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from django_cleanup.signals import cleanup_pre_delete
+from users.models import User
+
+from .cache import delete_fragments
+from .images import VARIANTS_DIR, delete_variants
+from .models import Ingredient, IngredientAmount, Recipe, Tag
+from .search import reset_index
+
+# Поля пользователя, входящие в представление автора рецепта.
+AUTHOR_FIELDS = frozenset(('email', 'username', 'first_name', 'last_name'))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    reset_index()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    delete_fragments([instance.pk])
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def ingredient_amount_changed(sender, instance, **kwargs):
+    delete_fragments([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        delete_fragments([instance.pk])
+    elif pk_set:
+        delete_fragments(pk_set)
+
+
+@receiver(pre_save, sender=User)
+def author_changing(sender, instance, update_fields, **kwargs):
+    """При сохранении без update_fields (админка, смена пароля)
+    запоминает, изменились ли поля автора: сравнение с базой - один
+    запрос по первичному ключу вместо сброса кэша всех рецептов."""
+    if instance._state.adding or update_fields is not None:
+        return
+    stored = User.objects.filter(pk=instance.pk).values(
+        *AUTHOR_FIELDS,
+    ).first()
+    instance._author_changed = stored is None or any(
+        stored[field] != getattr(instance, field) for field in AUTHOR_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """Сбрасывает кэш рецептов автора, только если изменились поля
+    из его представления (не при обновлении last_login)."""
+    if created:
+        return
+    if update_fields is not None:
+        changed = not AUTHOR_FIELDS.isdisjoint(update_fields)
+    else:
+        changed = instance.__dict__.pop('_author_changed', True)
+    if changed:
+        delete_fragments(instance.recipes.values_list('pk', flat=True))
+
+
+@receiver(cleanup_pre_delete)
+def image_deleted(sender, file, **kwargs):
+    """django_cleanup удаляет замененную или ненужную картинку рецепта -
+    удаляются и ее уменьшенные копии."""
+    if file.name.startswith('recipes/') and not file.name.startswith(
+        VARIANTS_DIR
+    ):
+        delete_variants(file.name, file.storage)
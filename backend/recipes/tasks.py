@@ -0,0 +1,47 @@
+from django.core.files.storage import default_storage
+from jobs.queue import task
+
+from . import feed
+from .images import delete_variants, generate_variants, save_normalized
+from .models import Recipe
+
+
+def discard(name):
+    default_storage.delete(name)
+    delete_variants(name)
+
+
+@task('recipes.process_image')
+def process_image(recipe_id, name):
+    """Обработка загруженной картинки рецепта в фоновом воркере:
+    перекодированная копия (recipes.images.normalize) заменяет исходный
+    файл, создаются уменьшенные копии, рецепт помечается image_ready.
+    Если картинку успели заменить или рецепт удален, задача ничего
+    не делает; замена выполняется условным update() по имени файла,
+    чтобы не затереть картинку, загруженную во время обработки."""
+    if not Recipe.objects.filter(id=recipe_id, image=name).exists():
+        return
+    new_name = save_normalized(name)
+    try:
+        generate_variants(new_name)
+        updated = Recipe.objects.filter(id=recipe_id, image=name).update(
+            image=new_name,
+            image_ready=True,
+        )
+    except Exception:
+        discard(new_name)
+        raise
+    if not updated:
+        discard(new_name)
+        return
+    # update() не вызывает сигналов django_cleanup: исходный файл
+    # удаляется явно. Кэш фрагментов рецепта url картинки не содержит.
+    default_storage.delete(name)
+
+
+@task('recipes.backfill_followers')
+def backfill_followers(author_id):
+    """Последние рецепты автора в ленты подписчиков (recipes.feed):
+    после отписок рецепты автора снова записываются в ленты при
+    публикации и перестают читаться при запросе ленты."""
+    feed.backfill_followers(author_id)
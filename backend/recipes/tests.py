@@ -0,0 +1,1107 @@
+import base64
+import csv
+import io
+import json
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+
+from api.pagination import LimitPageNumberPagination
+from api.relations import add_relation
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from jobs.models import Job
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework.views import APIView
+from users.models import User
+
+from .feed import fan_out, rebuild_timelines
+from .management.commands.recount_counters import count_subquery
+from .models import Ingredient, IngredientAmount, Recipe, Tag, TimelineEntry
+from .pantry import rebuild_index, update_index
+from .renderers import ShoppingListPDFRenderer
+
+
+def write_statements(queries):
+    """Запросы записи из queries (CaptureQueriesContext) парами
+    (INSERT, UPDATE или DELETE; таблица)."""
+    statements = []
+    for query in queries:
+        words = query['sql'].split(None, 3)
+        statement = words[0].upper()
+        if statement in ('INSERT', 'UPDATE', 'DELETE'):
+            table = words[1] if statement == 'UPDATE' else words[2]
+            statements.append((statement, table.strip('"')))
+    return statements
+
+
+def writes(queries, table):
+    """Количество запросов записи в таблицу table по видам:
+    {'INSERT': 1, ...}."""
+    counts = {}
+    for statement, target in write_statements(queries):
+        if target == table:
+            counts[statement] = counts.get(statement, 0) + 1
+    return counts
+
+
+class RecipeTestCase(APITestCase):
+    """Автор с рецептами (теги и ингредиенты у каждого), читатель с
+    избранным, корзиной и подпиской на автора."""
+
+    recipes_count = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='author-password',
+            first_name='Автор',
+            last_name='Автор',
+        )
+        cls.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='reader-password',
+            first_name='Читатель',
+            last_name='Читатель',
+        )
+        cls.reader_token = Token.objects.create(user=cls.reader).key
+        cls.author_token = Token.objects.create(user=cls.author).key
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г',
+            )
+            for number in range(6)
+        ]
+        cls.recipes = []
+        for number in range(cls.recipes_count):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=f'Рецепт {number}',
+                text=f'Описание {number}',
+                cooking_time=number + 1,
+            )
+            recipe.tags.set(cls.tags[:number % 3 + 1])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=10,
+                )
+                for ingredient in cls.ingredients[:number % 4 + 1]
+            )
+            cls.recipes.append(recipe)
+        cls.reader.favorites.add(*cls.recipes[::2])
+        cls.reader.shopping_cart.add(*cls.recipes[::3])
+        cls.reader.subscriber.create(author=cls.author)
+        Recipe.objects.update(
+            favorites_count=count_subquery(Recipe.favorited.through, 'recipe'),
+            cart_count=count_subquery(
+                Recipe.in_shopping_cart.through,
+                'recipe',
+            ),
+            ingredients_count=count_subquery(IngredientAmount, 'recipe'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        # Классы ограничения частоты запросов читаются из настроек при
+        # импорте APIView, override_settings их не меняет.
+        throttling = mock.patch.object(APIView, 'throttle_classes', [])
+        throttling.start()
+        self.addCleanup(throttling.stop)
+
+    def authenticate(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+
+class RecipeListQueriesTest(RecipeTestCase):
+    """Количество запросов списка рецептов не зависит от размера
+    страницы."""
+
+    def count_queries(self, limit):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self):
+        small = self.count_queries(2)
+        with self.assertNumQueries(small):
+            cache.clear()
+            response = self.client.get('/api/recipes/', {'limit': 12})
+        self.assertEqual(len(response.data['results']), 12)
+
+    def test_anonymous(self):
+        self.assert_constant_queries()
+
+    def test_authenticated(self):
+        self.authenticate(self.reader_token)
+        self.assert_constant_queries()
+
+    def test_authenticated_flags(self):
+        self.authenticate(self.reader_token)
+        response = self.client.get('/api/recipes/', {'limit': 12})
+        favorites = {recipe.id for recipe in self.recipes[::2]}
+        cart = {recipe.id for recipe in self.recipes[::3]}
+        for recipe in response.data['results']:
+            self.assertEqual(
+                recipe['is_favorited'],
+                recipe['id'] in favorites,
+            )
+            self.assertEqual(
+                recipe['is_in_shopping_cart'],
+                recipe['id'] in cart,
+            )
+            self.assertTrue(recipe['author']['is_subscribed'])
+
+
+class RecipeUpdateWritesTest(RecipeTestCase):
+    """Изменение рецепта записывает только отличающиеся данные."""
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.author_token)
+        self.recipe = self.recipes[3]
+
+    def update(self, method, data):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(
+                f'/api/recipes/{self.recipe.id}/',
+                data,
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        return context.captured_queries
+
+    def test_text_only_patch(self):
+        queries = self.update('patch', {'text': 'Новое описание'})
+        self.assertEqual(
+            write_statements(queries),
+            [('UPDATE', Recipe._meta.db_table)],
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.text, 'Новое описание')
+
+    def test_ingredients_diff(self):
+        current = list(IngredientAmount.objects.filter(
+            recipe=self.recipe,
+        ).order_by('ingredient_id'))
+        self.assertEqual(len(current), 4)
+        # Первый ингредиент удаляется, второй меняет количество,
+        # остальные без изменений, добавляются два новых.
+        ingredients = [
+            {'id': current[1].ingredient_id, 'amount': 25},
+            *({'id': amount.ingredient_id, 'amount': amount.amount}
+              for amount in current[2:]),
+            {'id': self.ingredients[4].id, 'amount': 5},
+            {'id': self.ingredients[5].id, 'amount': 7},
+        ]
+        queries = self.update('patch', {
+            'tags': [tag.id for tag in self.recipe.tags.all()],
+            'ingredients': ingredients,
+        })
+        counts = writes(queries, IngredientAmount._meta.db_table)
+        self.assertLessEqual(counts.get('DELETE', 0), 1)
+        self.assertLessEqual(counts.get('INSERT', 0), 1)
+        self.assertLessEqual(counts.get('UPDATE', 0), 1)
+        self.assertEqual(
+            dict(IngredientAmount.objects.filter(
+                recipe=self.recipe,
+            ).values_list('ingredient_id', 'amount')),
+            {ingredient['id']: ingredient['amount']
+             for ingredient in ingredients},
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.ingredients_count, len(ingredients))
+        self.assertEqual(
+            writes(queries, Recipe.tags.through._meta.db_table),
+            {},
+        )
+
+
+class TrendingTest(RecipeTestCase):
+    """Позиции «в тренде» рассчитываются командой update_trending, список
+    по ним доступен с курсорной пагинацией."""
+
+    def update_trending(self):
+        with self.assertLogs(
+            'recipes.management.commands.update_trending',
+        ):
+            call_command('update_trending')
+
+    def test_positions(self):
+        popular = self.recipes[5], self.recipes[1], self.recipes[9]
+        for count, recipe in zip((30, 20, 10), popular):
+            Recipe.objects.filter(id=recipe.id).update(favorites_count=count)
+        self.update_trending()
+        positions = dict(
+            Recipe.objects.values_list('id', 'trending_position')
+        )
+        self.assertEqual(
+            sorted(positions.values()),
+            list(range(1, self.recipes_count + 1)),
+        )
+        self.assertEqual(
+            [positions[recipe.id] for recipe in popular],
+            [1, 2, 3],
+        )
+
+    def test_cursor_pagination(self):
+        Recipe.objects.filter(id=self.recipes[7].id).update(cart_count=5)
+        self.update_trending()
+        expected = list(Recipe.objects.order_by(
+            'trending_position',
+        ).values_list('id', flat=True))
+        self.assertEqual(expected[0], self.recipes[7].id)
+        received = []
+        url = '/api/recipes/?ordering=trending&limit=4&cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            received.extend(
+                recipe['id'] for recipe in response.data['results']
+            )
+            url = response.data['next']
+        self.assertEqual(received, expected)
+
+
+class BulkRelationsTest(RecipeTestCase):
+    """Пакетное добавление и удаление рецептов избранного и корзины
+    изменяет счетчики только для фактически добавленных или удаленных
+    связей."""
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.reader_token)
+
+    def counters(self, field):
+        return dict(Recipe.objects.values_list('id', field))
+
+    def assert_bulk(self, url, relation, field):
+        recipe_ids = [recipe.id for recipe in self.recipes[:6]]
+        in_list = set(getattr(self.reader, relation).filter(
+            id__in=recipe_ids,
+        ).values_list('id', flat=True))
+        before = self.counters(field)
+        response = self.client.post(
+            url, {'recipes': recipe_ids}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data],
+            recipe_ids,
+        )
+        added = self.counters(field)
+        self.assertEqual(added, {
+            recipe_id: count + (
+                recipe_id in recipe_ids and recipe_id not in in_list
+            )
+            for recipe_id, count in before.items()
+        })
+        response = self.client.post(
+            url, {'recipes': recipe_ids}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.counters(field), added)
+        response = self.client.delete(
+            url, {'recipes': recipe_ids[:3]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data],
+            recipe_ids[:3],
+        )
+        response = self.client.delete(
+            url, {'recipes': recipe_ids[:3]}, format='json',
+        )
+        self.assertEqual(response.data, [])
+        self.assertEqual(self.counters(field), {
+            recipe_id: count - (recipe_id in recipe_ids[:3])
+            for recipe_id, count in added.items()
+        })
+
+    def test_favorite(self):
+        self.assert_bulk('/api/recipes/favorite/', 'favorites',
+                         'favorites_count')
+
+    def test_shopping_cart(self):
+        self.assert_bulk('/api/recipes/shopping_cart/', 'shopping_cart',
+                         'cart_count')
+
+    def test_clear_shopping_cart(self):
+        in_cart = set(self.reader.shopping_cart.values_list('id', flat=True))
+        before = self.counters('cart_count')
+        response = self.client.delete('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            {recipe['id'] for recipe in response.data},
+            in_cart,
+        )
+        self.assertFalse(self.reader.shopping_cart.exists())
+        self.assertEqual(self.counters('cart_count'), {
+            recipe_id: count - (recipe_id in in_cart)
+            for recipe_id, count in before.items()
+        })
+
+
+class PantryTest(RecipeTestCase):
+    """Подбор рецептов по продуктам: доля имеющихся ингредиентов,
+    допустимое число недостающих и постраничная выдача из БД."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        rebuild_index()
+
+    def find(self, have, missing_max, **params):
+        response = self.client.get('/api/recipes/by_ingredients/', {
+            'have': ','.join(str(ingredient.id) for ingredient in have),
+            'missing_max': missing_max,
+            **params,
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def expected(self, have, missing_max):
+        """Ожидаемый порядок: доля имеющихся ингредиентов, число
+        недостающих, от новых к старым."""
+        have = {ingredient.id for ingredient in have}
+        ranked = []
+        for number, recipe in enumerate(self.recipes):
+            composition = {
+                ingredient.id
+                for ingredient in self.ingredients[:number % 4 + 1]
+            }
+            found = len(composition & have)
+            missing = len(composition) - found
+            if found and missing <= missing_max:
+                ranked.append(
+                    (-found / len(composition), missing, -recipe.id)
+                )
+        return [-recipe_id for _, _, recipe_id in sorted(ranked)]
+
+    def test_covered(self):
+        have = self.ingredients[:2]
+        data = self.find(have, 0, limit=20)
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']],
+            self.expected(have, 0),
+        )
+        self.assertEqual(data['count'], len(self.expected(have, 0)))
+
+    def test_missing_max(self):
+        have = [self.ingredients[1], self.ingredients[2]]
+        expected = self.expected(have, 2)
+        self.assertGreater(len(expected), len(self.expected(have, 0)))
+        data = self.find(have, 2, limit=20)
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']],
+            expected,
+        )
+
+    def test_pages(self):
+        have = self.ingredients[:3]
+        expected = self.expected(have, 1)
+        received = []
+        for page in range(1, 4):
+            data = self.find(have, 1, limit=4, page=page)
+            received.extend(recipe['id'] for recipe in data['results'])
+        self.assertEqual(received, expected[:12])
+
+    def test_cursor(self):
+        have = self.ingredients[:3]
+        received = []
+        data = self.find(have, 1, limit=4, cursor='')
+        while True:
+            received.extend(recipe['id'] for recipe in data['results'])
+            if not data['next']:
+                break
+            response = self.client.get(data['next'])
+            self.assertEqual(response.status_code, 200, response.data)
+            data = response.data
+        self.assertEqual(received, self.expected(have, 1))
+
+    def test_ranks(self):
+        """Места по редкости: самый частый ингредиент (есть во всех
+        рецептах) - последний; при изменении состава места
+        пересчитываются."""
+        recipe = self.recipes[3]
+        self.assertEqual(
+            list(IngredientAmount.objects.filter(recipe=recipe).order_by(
+                'rarity_rank',
+            ).values_list('ingredient_id', flat=True)),
+            [ingredient.id for ingredient in self.ingredients[3::-1]],
+        )
+        self.authenticate(self.author_token)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 1},
+                {'id': self.ingredients[5].id, 'amount': 1},
+            ]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            dict(IngredientAmount.objects.filter(
+                recipe=recipe,
+            ).values_list('ingredient_id', 'rarity_rank')),
+            {self.ingredients[5].id: 0, self.ingredients[0].id: 1},
+        )
+        data = self.find([self.ingredients[5]], 1)
+        self.assertIn(recipe.id, [item['id'] for item in data['results']])
+
+    def test_update_index(self):
+        """Состав, измененный в обход API (админка), пересчитывается
+        update_index."""
+        recipe = self.recipes[0]
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients[4:]
+        )
+        update_index([recipe.id])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredients_count, 3)
+        self.assertEqual(
+            sorted(IngredientAmount.objects.filter(
+                recipe=recipe,
+            ).values_list('rarity_rank', flat=True)),
+            [0, 1, 2],
+        )
+        data = self.find(self.ingredients[4:], 1)
+        self.assertEqual(
+            [item['id'] for item in data['results']],
+            [recipe.id],
+        )
+
+
+class RecipeAdminTest(RecipeTestCase):
+    """Рецепт, созданный в админке вместе с ингредиентами (inline),
+    попадает в подбор по продуктам и поиск."""
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='admin-password',
+        )
+        self.client.force_login(admin)
+
+    def add_recipe(self, ingredients, **extra):
+        data = {
+            'name': 'Рецепт из админки',
+            'text': 'Описание',
+            'author': self.author.id,
+            'cooking_time': 5,
+            'tags': [self.tags[0].id],
+            'ingredientamount_set-TOTAL_FORMS': len(ingredients),
+            'ingredientamount_set-INITIAL_FORMS': 0,
+        }
+        for number, ingredient in enumerate(ingredients):
+            data[f'ingredientamount_set-{number}-ingredient'] = ingredient.id
+            data[f'ingredientamount_set-{number}-amount'] = 1
+        response = self.client.post(
+            '/admin/recipes/recipe/add/',
+            {**data, **extra},
+        )
+        self.assertEqual(response.status_code, 302)
+        return Recipe.objects.get(name='Рецепт из админки')
+
+    def test_add(self):
+        rebuild_index()
+        with mock.patch(
+            'recipes.admin.update_search_vectors',
+        ) as update_search_vectors:
+            recipe = self.add_recipe(self.ingredients[:2])
+        update_search_vectors.assert_called_once_with([recipe.id])
+        self.assertTrue(recipe.image_ready)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(recipe.ingredients_count, 2)
+        self.assertEqual(
+            dict(IngredientAmount.objects.filter(
+                recipe=recipe,
+            ).values_list('ingredient_id', 'rarity_rank')),
+            {self.ingredients[1].id: 0, self.ingredients[0].id: 1},
+        )
+
+    def test_add_image(self):
+        """Картинка, загруженная в админке, обрабатывается фоновой
+        задачей; до обработки копии не отдаются."""
+        image = io.BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(image, 'PNG')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root,
+        ):
+            recipe = self.add_recipe(
+                self.ingredients[:1],
+                image=SimpleUploadedFile(
+                    'image.png', image.getvalue(), 'image/png',
+                ),
+            )
+        self.assertFalse(recipe.image_ready)
+        job = Job.objects.get()
+        self.assertEqual(job.task, 'recipes.process_image')
+        self.assertEqual(
+            job.payload,
+            {'recipe_id': recipe.id, 'name': recipe.image.name},
+        )
+
+    def test_ingredient_rename(self):
+        ingredient = self.ingredients[3]
+        with mock.patch(
+            'recipes.admin.update_search_vectors',
+        ) as update_search_vectors:
+            response = self.client.post(
+                f'/admin/recipes/ingredient/{ingredient.id}/change/',
+                {'name': 'Новое наименование', 'measurement_unit': 'г'},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(update_search_vectors.call_args.args[0]),
+            [recipe.id for recipe in self.recipes[3::4]],
+        )
+
+
+class AuthorChangedTest(RecipeTestCase):
+    """Кэш рецептов сбрасывается только при изменении полей автора."""
+
+    def assert_reset(self, save, expected):
+        with mock.patch('recipes.signals.delete_fragments') as delete:
+            save()
+        if expected:
+            self.assertEqual(
+                sorted(delete.call_args.args[0]),
+                sorted(recipe.id for recipe in self.recipes),
+            )
+        else:
+            delete.assert_not_called()
+
+    def test_last_login(self):
+        self.assert_reset(
+            lambda: update_last_login(None, self.author),
+            False,
+        )
+
+    def test_unchanged(self):
+        self.author.set_password('new-password')
+        self.assert_reset(self.author.save, False)
+
+    def test_changed(self):
+        self.author.first_name = 'Новое имя'
+        self.assert_reset(self.author.save, True)
+
+    def test_update_fields(self):
+        self.author.last_name = 'Новая фамилия'
+        self.assert_reset(
+            lambda: self.author.save(update_fields=('last_name',)),
+            True,
+        )
+
+
+class ShoppingListDownloadTest(RecipeTestCase):
+    """Скачивание списка покупок в разных форматах, потоковая отдача
+    и повторное скачивание по ETag."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.reader_token)
+
+    def expected(self):
+        """Суммированный список покупок читателя по составам рецептов
+        корзины: (наименование, единица измерения, количество)."""
+        amounts = Counter()
+        for number in range(0, len(self.recipes), 3):
+            for ingredient in self.ingredients[:number % 4 + 1]:
+                amounts[ingredient] += 10
+        return [
+            (ingredient.name, ingredient.measurement_unit, amount)
+            for ingredient, amount in sorted(
+                amounts.items(), key=lambda item: item[0].name,
+            )
+        ]
+
+    def download(self, format, **headers):
+        return self.client.get(self.url, {'format': format}, **headers)
+
+    def test_csv(self):
+        response = self.download('csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="shopping_list.csv"',
+        )
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(
+            list(csv.reader(io.StringIO(content))),
+            [[name, unit, str(amount)]
+             for name, unit, amount in self.expected()],
+        )
+
+    def test_txt(self):
+        response = self.download('txt')
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines(),
+            [f'{name} ({unit}) — {amount}'
+             for name, unit, amount in self.expected()],
+        )
+
+    def test_json(self):
+        response = self.download('json')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content)),
+            [{'name': name, 'measurement_unit': unit, 'amount': amount}
+             for name, unit, amount in self.expected()],
+        )
+
+    def test_pdf(self):
+        response = self.download('pdf')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+    @override_settings(SHOPPING_LIST_PDF_FONT='missing-font.ttf')
+    def test_pdf_without_font(self):
+        with self.assertRaisesMessage(
+            ImproperlyConfigured, 'SHOPPING_LIST_PDF_FONT',
+        ):
+            ShoppingListPDFRenderer().render(self.expected())
+
+    def test_not_modified(self):
+        response = self.download('csv')
+        etag = response['ETag']
+        response = self.download('csv', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('Content-Disposition', response)
+        self.assertNotEqual(self.download('txt')['ETag'], etag)
+        self.reader.shopping_cart.remove(self.recipes[0])
+        response = self.download('csv', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class KeysetPaginationTest(RecipeTestCase):
+    """Keyset-пагинация (?cursor=): проход по страницам вперед и назад,
+    курсоры и их проверка."""
+
+    def walk(self, url, link='next'):
+        """id рецептов со всех страниц, начиная с url, по ссылкам link."""
+        received = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertIsNone(response.data['count'])
+            received.extend(
+                recipe['id'] for recipe in response.data['results']
+            )
+            last = url
+            url = response.data[link]
+        return received, last
+
+    def test_pages(self):
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id',
+        ).values_list('id', flat=True))
+        received, last = self.walk('/api/recipes/?limit=4&cursor=')
+        self.assertEqual(received, expected)
+        response = self.client.get(last)
+        backwards, _ = self.walk(response.data['previous'], 'previous')
+        self.assertEqual(
+            backwards,
+            [
+                recipe_id
+                for start in range(8, -1, -4)
+                for recipe_id in expected[start:start + 4]
+            ],
+        )
+
+    def test_ascending_ordering(self):
+        received, _ = self.walk(
+            '/api/recipes/?ordering=cooking_time&limit=4&cursor=',
+        )
+        self.assertEqual(
+            received,
+            [recipe.id for recipe in self.recipes],
+        )
+
+    def test_expression_ordering(self):
+        response = self.client.get('/api/recipes/?ordering=popular&cursor=')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor(self):
+        paginator = LimitPageNumberPagination()
+        position = ['2026-01-01T00:00:00+00:00', 5]
+        for reverse in (False, True):
+            cursor = paginator.encode_cursor(position, reverse)
+            request = Request(APIRequestFactory().get('/', {'cursor': cursor}))
+            self.assertEqual(
+                paginator.decode_cursor(request),
+                (position, reverse),
+            )
+
+    def test_invalid_cursor(self):
+        def encode(value):
+            return base64.urlsafe_b64encode(
+                json.dumps(value).encode()
+            ).decode()
+
+        recipe = self.recipes[0]
+        for cursor in (
+            'не base64',
+            base64.urlsafe_b64encode(b'not json').decode(),
+            encode({'position': [1]}),
+            encode({'p': [recipe.pub_date.isoformat()]}),
+            encode({'p': ['not a date', recipe.id]}),
+            encode({'p': [recipe.pub_date.isoformat(), 'not an id']}),
+            encode({'p': [None, None]}),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/recipes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_approximate_count(self):
+        self.assertIsNone(
+            LimitPageNumberPagination.get_approximate_count(
+                Recipe.objects.all(),
+            )
+        )
+
+
+class FeedTest(RecipeTestCase):
+    """Лента подписок: записи при публикации и подписке, удаление при
+    отписке и объединение записей ленты с рецептами популярных авторов,
+    которые читаются при запросе (Feed.page)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        User.objects.filter(id=cls.author.id).update(followers_count=1)
+        rebuild_timelines()
+
+    def feed(self, token, limit=4):
+        """id рецептов ленты со всех страниц."""
+        self.authenticate(token)
+        received = []
+        url = f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            received.extend(
+                recipe['id'] for recipe in response.data['results']
+            )
+            url = response.data['next']
+        return received
+
+    @staticmethod
+    def latest(*authors):
+        return list(Recipe.objects.filter(author__in=authors).order_by(
+            '-pub_date', '-id',
+        ).values_list('id', flat=True))
+
+    def create_user(self, username, token=True):
+        user = User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            password=f'{username}-password',
+        )
+        return user, Token.objects.create(user=user).key if token else None
+
+    def test_fan_out(self):
+        self.authenticate(self.author_token)
+        response = self.client.post('/api/recipes/', {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': '',
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        feed = self.feed(self.reader_token)
+        self.assertEqual(feed[0], response.data['id'])
+        self.assertEqual(feed, self.latest(self.author))
+
+    @override_settings(FEED_BACKFILL_SIZE=5)
+    def test_subscribe(self):
+        follower, token = self.create_user('follower')
+        self.assertEqual(self.feed(token), [])
+        self.authenticate(token)
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.feed(token), self.latest(self.author)[:5])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 2)
+
+    def test_unsubscribe(self):
+        self.authenticate(self.reader_token)
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/',
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.reader,
+        ).exists())
+        self.assertEqual(self.feed(self.reader_token), [])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_pulled(self):
+        """Рецепты автора с числом подписчиков больше
+        FEED_FANOUT_MAX_FOLLOWERS в ленты не записываются и
+        объединяются с записями ленты при чтении."""
+        popular, _ = self.create_user('popular', token=False)
+        fan, _ = self.create_user('fan', token=False)
+        for user in (self.reader, fan):
+            user.subscriber.create(author=popular)
+        User.objects.filter(id=popular.id).update(followers_count=2)
+        pulled = []
+        for number in range(6):
+            recipe = Recipe.objects.create(
+                author=popular,
+                name=f'Популярный рецепт {number}',
+                cooking_time=1,
+            )
+            self.assertEqual(fan_out(recipe.id), 0)
+            pulled.append(recipe.id)
+            # Публикации популярного автора чередуются с рецептами
+            # автора из ленты.
+            Recipe.objects.filter(id=recipe.id).update(
+                pub_date=self.recipes[number * 2].pub_date
+                + timedelta(microseconds=1),
+            )
+        self.assertFalse(TimelineEntry.objects.filter(
+            author=popular,
+        ).exists())
+        feed = self.feed(self.reader_token)
+        self.assertEqual(feed, self.latest(self.author, popular))
+        self.assertEqual(feed[-2:], [pulled[0], self.recipes[0].id])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_pulled_duplicates(self):
+        """Рецепты, записанные в ленту до того, как у автора стало больше
+        FEED_FANOUT_MAX_FOLLOWERS подписчиков, в ленте не повторяются."""
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader,
+        ).exists())
+        self.assertEqual(
+            self.feed(self.reader_token),
+            self.latest(self.author),
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_unsubscribe_below_limit(self):
+        """Когда подписчиков становится не больше
+        FEED_FANOUT_MAX_FOLLOWERS, рецепты автора записываются в ленты
+        подписчиков фоновой задачей."""
+        fan, token = self.create_user('fan')
+        fan.subscriber.create(author=self.author)
+        User.objects.filter(id=self.author.id).update(followers_count=2)
+        self.authenticate(token)
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/',
+        )
+        self.assertEqual(response.status_code, 204)
+        job = Job.objects.get()
+        self.assertEqual(job.task, 'recipes.backfill_followers')
+        self.assertEqual(job.payload, {'author_id': self.author.id})
+
+
+class SubscriptionRecipesTest(RecipeTestCase):
+    """Последние рецепты авторов в списке подписок: recipes_limit
+    действует для каждого автора, некорректное значение игнорируется."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='other-password',
+        )
+        for number in range(3):
+            Recipe.objects.create(
+                author=cls.other,
+                name=f'Рецепт {number}',
+                cooking_time=1,
+            )
+        cls.reader.subscriber.create(author=cls.other)
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.reader_token)
+
+    def subscriptions(self, **params):
+        response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return {
+            author['id']: [recipe['id'] for recipe in author['recipes']]
+            for author in response.data['results']
+        }
+
+    @staticmethod
+    def latest(author, limit=None):
+        return list(author.recipes.order_by(
+            '-pub_date', '-id',
+        ).values_list('id', flat=True)[:limit])
+
+    def test_limit(self):
+        self.assertEqual(self.subscriptions(recipes_limit=2), {
+            self.author.id: self.latest(self.author, 2),
+            self.other.id: self.latest(self.other, 2),
+        })
+
+    def test_zero(self):
+        self.assertEqual(self.subscriptions(recipes_limit=0), {
+            self.author.id: [],
+            self.other.id: [],
+        })
+
+    def test_no_limit(self):
+        expected = {
+            self.author.id: self.latest(self.author),
+            self.other.id: self.latest(self.other),
+        }
+        self.assertEqual(self.subscriptions(), expected)
+        for value in ('abc', '-1', ''):
+            with self.subTest(recipes_limit=value):
+                self.assertEqual(
+                    self.subscriptions(recipes_limit=value),
+                    expected,
+                )
+
+    def test_queries(self):
+        """Рецепты всех авторов страницы выбираются одним запросом."""
+        with CaptureQueriesContext(connection) as one_author:
+            self.subscriptions(recipes_limit=2, limit=1)
+        with CaptureQueriesContext(connection) as two_authors:
+            self.subscriptions(recipes_limit=2, limit=2)
+        self.assertEqual(len(two_authors), len(one_author))
+
+    def test_subscribe(self):
+        follower = User.objects.create_user(
+            username='follower',
+            email='follower@example.com',
+            password='follower-password',
+        )
+        self.authenticate(Token.objects.create(user=follower).key)
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/?recipes_limit=1',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['recipes']],
+            self.latest(self.author, 1),
+        )
+
+
+class RelationToggleTest(RecipeTestCase):
+    """Добавление и удаление избранного, корзины и подписок: повтор -
+    ошибка 400, счетчики и кэш пользователя изменяются только при
+    фактическом изменении связи."""
+
+    relations = (
+        ('favorite', 'favorites_count', 'favorites'),
+        ('shopping_cart', 'cart_count', 'shopping_cart'),
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.reader_token)
+
+    def toggle(self, method, url, viewer_module, status, changed):
+        with mock.patch(f'{viewer_module}.viewer_changed') as viewer_changed:
+            response = getattr(self.client, method)(url)
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(viewer_changed.called, changed)
+
+    def counter(self, recipe, counter):
+        return Recipe.objects.values_list(counter, flat=True).get(
+            id=recipe.id,
+        )
+
+    def test_add_relation(self):
+        through = Recipe.favorited.through
+        recipe = self.recipes[1]
+        self.assertTrue(
+            add_relation(through, user=self.reader.id, recipe=recipe.id)
+        )
+        self.assertFalse(
+            add_relation(through, user=self.reader.id, recipe=recipe.id)
+        )
+        self.assertEqual(
+            through.objects.filter(user=self.reader, recipe=recipe).count(),
+            1,
+        )
+
+    def test_recipe_relations(self):
+        # Рецепт 6 есть и в избранном, и в корзине читателя, рецепт 1 -
+        # ни там, ни там.
+        present, absent = self.recipes[6], self.recipes[1]
+        view = 'recipes.views'
+        for action, counter, related_name in self.relations:
+            with self.subTest(action=action):
+                url = f'/api/recipes/{{}}/{action}/'.format
+                before = self.counter(present, counter)
+                self.toggle('post', url(present.id), view, 400, False)
+                self.toggle('delete', url(absent.id), view, 400, False)
+                self.toggle('delete', url(0), view, 404, False)
+                self.assertEqual(self.counter(present, counter), before)
+                self.assertEqual(self.counter(absent, counter), 0)
+
+                self.toggle('delete', url(present.id), view, 204, True)
+                self.assertEqual(self.counter(present, counter), before - 1)
+                self.toggle('post', url(absent.id), view, 201, True)
+                self.assertEqual(self.counter(absent, counter), 1)
+                self.assertEqual(
+                    set(getattr(self.reader, related_name).filter(
+                        id__in=(present.id, absent.id),
+                    ).values_list('id', flat=True)),
+                    {absent.id},
+                )
+
+    def test_subscription(self):
+        User.objects.filter(id=self.author.id).update(followers_count=1)
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.toggle('post', url, 'users.views', 400, False)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+
+        self.toggle('delete', url, 'users.views', 204, True)
+        self.toggle('delete', url, 'users.views', 400, False)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+        self.toggle('post', url, 'users.views', 201, True)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
@@ -0,0 +1,156 @@
+import binascii
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.http import QueryDict
+from rest_framework import exceptions, parsers
+from rest_framework.utils import json
+
+# Кратно 4: каждая порция base64 декодируется независимо.
+BASE64_CHUNK_SIZE = 64 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+WHITESPACE = str.maketrans('', '', ' \t\r\n')
+
+
+class PayloadTooLarge(exceptions.APIException):
+    status_code = 413
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'payload_too_large'
+
+
+def check_size(size):
+    if size > settings.RECIPE_UPLOAD_MAX_BYTES:
+        raise PayloadTooLarge(
+            f'Размер запроса больше {settings.RECIPE_UPLOAD_MAX_BYTES} байт.'
+        )
+
+
+def check_content_length(parser_context):
+    """Отклоняет запрос с телом больше RECIPE_UPLOAD_MAX_BYTES по
+    заголовку Content-Length - до чтения тела."""
+    request = parser_context['request']
+    try:
+        check_size(int(request.META.get('CONTENT_LENGTH') or 0))
+    except ValueError:
+        pass
+
+
+def read_chunks(stream):
+    """Тело запроса порциями по UPLOAD_CHUNK_SIZE с проверкой размера
+    по мере чтения (на случай тела без Content-Length)."""
+    size = 0
+    for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+        size += len(chunk)
+        check_size(size)
+        yield chunk
+
+
+class TemporaryImageFile(TemporaryUploadedFile):
+    """Временный файл картинки из тела запроса или декодированный из
+    base64. Файлы multipart/form-data закрывает Django по окончании
+    запроса, этот - закрывается при удалении объекта (после сохранения
+    в хранилище файл уже перемещен)."""
+
+    def __del__(self):
+        self.close()
+
+
+def decode_base64(data, offset=0):
+    """Декодирует строку base64 (начиная с позиции offset - без копии
+    строки без заголовка data URL) во временный файл порциями: в памяти,
+    кроме самой строки, одновременно находится только порция данных.
+    Пробельные символы пропускаются."""
+    file = TemporaryImageFile('image', None, 0, None)
+    try:
+        file.size = write_base64(data, offset, file)
+    except (binascii.Error, ValueError):
+        file.close()
+        raise
+    file.seek(0)
+    return file
+
+
+def write_base64(data, offset, file):
+    size = 0
+    pending = ''
+    for start in range(offset, len(data), BASE64_CHUNK_SIZE):
+        chunk = (
+            pending + data[start:start + BASE64_CHUNK_SIZE]
+        ).translate(WHITESPACE)
+        end = len(chunk) - len(chunk) % 4
+        decoded = binascii.a2b_base64(chunk[:end])
+        file.write(decoded)
+        size += len(decoded)
+        pending = chunk[end:]
+    if pending:
+        raise binascii.Error('Incorrect padding')
+    return size
+
+
+class RecipeJSONParser(parsers.JSONParser):
+    """JSON с ограничением размера тела запроса. Тело читается порциями
+    в один буфер и разбирается из байтов: JSONParser читает его через
+    codecs.StreamReader, который при чтении целиком делает несколько
+    копий тела (с картинкой в base64 - по несколько мегабайт)."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        check_content_length(parser_context)
+        body = bytearray()
+        for chunk in read_chunks(stream):
+            body += chunk
+        try:
+            return json.loads(
+                body,
+                parse_constant=json.strict_constant if self.strict else None,
+            )
+        except ValueError as error:
+            raise exceptions.ParseError(f'JSON parse error - {error}')
+
+
+class RecipeMultiPartParser(parsers.MultiPartParser):
+    """multipart/form-data с ограничением размера тела запроса. Файлы
+    больше FILE_UPLOAD_MAX_MEMORY_SIZE пишутся на диск порциями по мере
+    чтения запроса."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        check_content_length(parser_context)
+        return super().parse(stream, media_type, parser_context)
+
+
+def unpack_multipart(data):
+    """Данные рецепта из multipart/form-data: JSON рецепта (как в теле
+    обычного запроса) передается в части data, файлы - отдельными
+    частями (image). Остальные данные возвращаются без изменений."""
+    if not isinstance(data, QueryDict) or 'data' not in data:
+        return data
+    try:
+        unpacked = json.loads(data['data'])
+    except ValueError as error:
+        raise exceptions.ParseError(f'Некорректный JSON в data: {error}')
+    if not isinstance(unpacked, dict):
+        raise exceptions.ParseError('В data ожидается JSON-объект.')
+    unpacked.update(
+        (key, value) for key, value in data.items() if key != 'data'
+    )
+    return unpacked
+
+
+class ImageUploadParser(parsers.BaseParser):
+    """Картинка телом запроса (Content-Type: image/jpeg, image/png, ...).
+    Тело пишется во временный файл порциями и передается как файл
+    image; размер ограничен RECIPE_UPLOAD_MAX_BYTES."""
+
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        check_content_length(parser_context)
+        file = TemporaryImageFile('image', media_type, 0, None)
+        try:
+            for chunk in read_chunks(stream):
+                file.write(chunk)
+        except PayloadTooLarge:
+            file.close()
+            raise
+        file.size = file.tell()
+        file.seek(0)
+        return parsers.DataAndFiles({}, {'image': file})
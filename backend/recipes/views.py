@@ -1,25 +1,46 @@
-import csv
+import hashlib
 
-from django.db.models import Sum
-from django.http import FileResponse
+from api.cache import CachedReadOnlyMixin
+from api.relations import add_relation, add_relations, remove_relations
+from api.replicas import ReplicaReadMixin
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http import (Http404, HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from users.models import User
 from users.serializers import AddRemoveRecipeSerializer
+from users.viewer import viewer_changed
 
+from .feed import Feed, FeedPagination
 from .filters import IngredientFilter, RecipeFilter
 from .mixins import PostDeleteViewSet
 from .models import Ingredient, IngredientAmount, Recipe, Tag
+from .pantry import find_recipes
 from .permissions import AuthorOrReadOnly
-from .serializers import (IngredientSerializer, RecipePostSerializer,
-                          RecipeSerializer, TagSerializer)
+from .renderers import SHOPPING_LIST_RENDERERS
+from .serializers import (IngredientSerializer, PantrySerializer,
+                          RecipeIdsSerializer, RecipeImageSerializer,
+                          RecipePostSerializer, RecipeSerializer,
+                          TagSerializer)
+from .uploads import (ImageUploadParser, RecipeJSONParser,
+                      RecipeMultiPartParser, unpack_multipart)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Обрабатывает запросы на ендпоинты /ingredients."""
+class IngredientViewSet(ReplicaReadMixin, CachedReadOnlyMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    """Обрабатывает запросы на ендпоинты /ingredients.
+    Ответы кэшируются (api.cache), кэш сбрасывается при изменении
+    ингредиентов."""
 
+    cache_namespace = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
@@ -28,46 +49,174 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
-    """Обрабатывает запросы на ендпоинты /tags."""
+class TagViewSet(ReplicaReadMixin, CachedReadOnlyMixin,
+                 viewsets.ReadOnlyModelViewSet):
+    """Обрабатывает запросы на ендпоинты /tags.
+    Ответы кэшируются (api.cache), кэш сбрасывается при изменении тегов."""
 
+    cache_namespace = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Обрабатывает запросы на ендпоинты /recipes.
     Также обрабатывает запрос на скачивание корзины (списка покупок)
-    (action download_shopping_cart_get)."""
+    (action download_shopping_cart_get).
+    Рецепт принимается в JSON (картинка в base64) или в
+    multipart/form-data (JSON рецепта в части data, картинка файлом
+    в части image, recipes.uploads); размер тела запроса ограничен
+    RECIPE_UPLOAD_MAX_BYTES."""
 
     queryset = Recipe.objects.all()
     permission_classes = (AuthorOrReadOnly,)
+    parser_classes = (RecipeJSONParser, RecipeMultiPartParser)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """Для чтения собирает один запрос со всеми данными для
+        RecipeSerializer: рецепты с автором (select_related). Признаки
+        избранного, корзины и подписки на автора сериализатор берет из
+        множеств id текущего пользователя (users.viewer), теги и
+        ингредиенты подгружает только для рецептов, которых нет в кэше.
+        Количество запросов к БД не зависит от размера страницы."""
+        queryset = super().get_queryset()
+        if self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+        return queryset.defer('search_vector').select_related('author')
+
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
             return RecipeSerializer
         return RecipePostSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        if 'data' in kwargs:
+            kwargs['data'] = unpack_multipart(kwargs['data'])
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
-    def perform_update(self, serializer):
-        serializer.save(author=self.request.user)
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        author_id = instance.author_id
+        instance.delete()
+        User.objects.filter(id=author_id).update(
+            recipes_count=F('recipes_count') - 1
+        )
+
+    @action(
+        methods=['get'],
+        detail=False,
+        url_path='by_ingredients',
+    )
+    def by_ingredients(self, request):
+        """Подбор рецептов по имеющимся продуктам:
+        /recipes/by_ingredients/?have=1,5,9&missing_max=2.
+        Рецепты подбираются и упорядочиваются по доле имеющихся
+        ингредиентов одним запросом (recipes.pantry), страница выбирается
+        в БД."""
+        params = PantrySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(find_recipes(
+            self.get_queryset(),
+            params.validated_data['have'],
+            params.validated_data['missing_max'],
+        ))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        """Лента подписок: рецепты авторов, на которых подписан текущий
+        пользователь, от новых к старым (recipes.feed). Страницы - по
+        курсору из ссылки next, размер страницы - параметр limit."""
+        recipe_ids = self.paginate_queryset(Feed(request.user))
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in recipe_ids
+             if recipe_id in recipes],
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['put'],
+        detail=True,
+        parser_classes=(ImageUploadParser, RecipeMultiPartParser),
+    )
+    def image(self, request, pk=None):
+        """Замена картинки рецепта файлом: PUT /recipes/{id}/image/
+        с картинкой в теле запроса (Content-Type: image/jpeg, image/png,
+        image/gif) или в части image multipart/form-data. Тело пишется
+        во временный файл порциями, не читаясь в память целиком."""
+        serializer = RecipeImageSerializer(
+            self.get_object(),
+            data=request.data,
+            context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def shopping_cart(self, request):
+        """Добавление (POST) и удаление (DELETE) нескольких рецептов
+        корзины одним запросом: {"recipes": [1, 2, 3]}."""
+        return ShopingCartViewSet.bulk(request)
+
+    @action(
+        methods=['delete'],
+        detail=False,
+        url_path='shopping_cart/clear',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def clear_shopping_cart(self, request):
+        """Очистка корзины; возвращает удаленные из нее рецепты."""
+        return ShopingCartViewSet.remove_recipes(request)
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def favorite(self, request):
+        """Добавление (POST) и удаление (DELETE) нескольких рецептов
+        избранного одним запросом: {"recipes": [1, 2, 3]}."""
+        return FavoriteViewSet.bulk(request)
 
     @action(
         methods=['get'],
         detail=False,
         url_path='download_shopping_cart',
+        permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=SHOPPING_LIST_RENDERERS,
     )
     def download_shopping_cart_get(self, request):
-        ingredient_amounts = IngredientAmount.objects.filter(
-            recipe__in=request.user.shopping_cart.all()).select_related(
-                'ingredient')
-        shopping_list = ingredient_amounts.values(
+        """Отдает суммированный список покупок текущего пользователя.
+        Формат выбирается параметром ?format=csv|txt|json|pdf (или заголовком
+        Accept), по умолчанию - csv. Список формируется в памяти и отдается
+        потоком кусками по 64 КБ (pdf - одним ответом), без временных
+        файлов. ETag вычисляется по содержимому
+        списка, поэтому повторное скачивание неизменного списка
+        возвращает 304."""
+        renderer = request.accepted_renderer
+        shopping_list = list(IngredientAmount.objects.filter(
+            recipe__in_shopping_cart=request.user,
+        ).values(
             'ingredient__name',
             'ingredient__measurement_unit',
         ).annotate(
@@ -76,39 +225,78 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'ingredient__name',
             'ingredient__measurement_unit',
             'ingredient_amount',
+        ).order_by('ingredient__name'))
+        etag = '"{}"'.format(hashlib.md5(
+            repr((renderer.format, shopping_list)).encode()
+        ).hexdigest())
+        content_type = (
+            f'{renderer.media_type}; charset={renderer.charset}'
+            if renderer.charset else renderer.media_type
         )
-        with open(
-            'shopping_list.csv',
-            'w',
-            newline='',
-            encoding='utf-8'
-        ) as csvfile:
-            writer = csv.writer(csvfile)
-            for ingredient in shopping_list:
-                writer.writerow(ingredient)
-        return FileResponse(
-            open('shopping_list.csv', 'rb'),
-            content_type='text/plain'
-        )
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        elif renderer.streaming:
+            response = StreamingHttpResponse(
+                renderer.stream_chunks(shopping_list),
+                content_type=content_type,
+            )
+        else:
+            response = HttpResponse(
+                b''.join(renderer.stream(shopping_list)),
+                content_type=content_type,
+            )
+        if response.status_code == 200:
+            response['Content-Disposition'] = (
+                f'attachment; filename="shopping_list.{renderer.extension}"'
+            )
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
-class ShopingCartViewSet(PostDeleteViewSet):
-    """Включает/исключает рецепт в корзину (список покупок).
-    Атрибут in_shopping_cart модели Recipes и соответствующий
-    атрибут shopping_cart модели User."""
+class RecipeRelationViewSet(PostDeleteViewSet):
+    """Базовый вьюсет для включения/исключения рецепта в список пользователя.
+    relation - имя Many-to-Many поля модели Recipe, counter - имя хранимого
+    счетчика рецепта, который изменяется атомарно (F()) только при
+    фактическом добавлении или удалении связи, duplicate_message - ошибка
+    повторного добавления рецепта, missing_message - ошибка удаления
+    рецепта, которого нет в списке.
+    Пакетные операции (add_recipes, remove_recipes) вызываются из действий
+    RecipeViewSet: /recipes/shopping_cart/ и /recipes/favorite/."""
 
     serializer_class = AddRemoveRecipeSerializer
+    relation = None
+    counter = None
+    duplicate_message = None
+    missing_message = None
 
-    def get_queryset(self):
-        return self.request.user.shopping_cart
+    @classmethod
+    def get_through_model(cls):
+        return getattr(Recipe, cls.relation).through
+
+    @classmethod
+    def update_counters(cls, recipe_ids, delta):
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            **{cls.counter: F(cls.counter) + delta}
+        )
 
     def create(self, request, *args, **kwargs):
+        """Добавляет рецепт в список: одна вставка связи по id (api.relations)
+        и изменение счетчика, без сохранения строки рецепта. Повторное
+        добавление - ошибка 400."""
         recipe = get_object_or_404(
-            Recipe,
+            Recipe.objects.only(*AddRemoveRecipeSerializer.Meta.fields),
             id=self.kwargs.get('id')
         )
-        recipe.in_shopping_cart.add(request.user)
-        recipe.save()
+        with transaction.atomic():
+            if not add_relation(
+                self.get_through_model(),
+                user=request.user.id,
+                recipe=recipe.id,
+            ):
+                raise ValidationError(self.duplicate_message)
+            self.update_counters([recipe.id], 1)
+            viewer_changed(request)
         serializer = self.get_serializer(recipe)
         headers = self.get_success_headers(serializer.data)
         return Response(
@@ -118,45 +306,134 @@ class ShopingCartViewSet(PostDeleteViewSet):
         )
 
     def delete(self, request, id):
-        recipe = get_object_or_404(
-            Recipe,
-            id=id
-        )
-        recipe.in_shopping_cart.remove(request.user)
-        recipe.save()
+        """Удаляет рецепт из списка одним DELETE по id; рецепт читается,
+        только если связи не было: несуществующий рецепт - ошибка 404,
+        рецепт не в списке - 400."""
+        with transaction.atomic():
+            deleted, _ = self.get_through_model().objects.filter(
+                recipe_id=id,
+                user=request.user,
+            ).delete()
+            if not deleted:
+                if not Recipe.objects.filter(id=id).exists():
+                    raise Http404
+                raise ValidationError(self.missing_message)
+            self.update_counters([id], -deleted)
+            viewer_changed(request)
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def get_recipes(recipe_ids):
+        """Рецепты recipe_ids в порядке запроса одним запросом; если каких-то
+        рецептов нет - ошибка валидации."""
+        recipes = Recipe.objects.only(
+            *AddRemoveRecipeSerializer.Meta.fields
+        ).in_bulk(recipe_ids)
+        missing = [
+            str(recipe_id) for recipe_id in recipe_ids
+            if recipe_id not in recipes
+        ]
+        if missing:
+            raise ValidationError(
+                {'recipes': f'Рецепты не найдены: {", ".join(missing)}.'}
+            )
+        return [recipes[recipe_id] for recipe_id in recipe_ids]
+
+    @classmethod
+    def add_recipes(cls, request, recipe_ids):
+        """Добавляет рецепты в список одним многострочным INSERT ...
+        ON CONFLICT DO NOTHING RETURNING и возвращает все переданные рецепты
+        (уже бывшие в списке - тоже). Счетчики увеличиваются только для
+        фактически вставленных строк, поэтому одновременные одинаковые
+        запросы их не завышают."""
+        recipes = cls.get_recipes(recipe_ids)
+        with transaction.atomic():
+            added = add_relations(
+                cls.get_through_model(),
+                'recipe',
+                [
+                    {'user': request.user.id, 'recipe': recipe_id}
+                    for recipe_id in recipe_ids
+                ],
+            )
+            if added:
+                cls.update_counters(added, 1)
+                viewer_changed(request)
+        return Response(
+            AddRemoveRecipeSerializer(
+                recipes,
+                many=True,
+                context={'request': request},
+            ).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    @classmethod
+    def remove_recipes(cls, request, recipe_ids=None):
+        """Удаляет рецепты recipe_ids (None - все) из списка одним
+        DELETE ... RETURNING и возвращает удаленные рецепты. Счетчики
+        уменьшаются только для фактически удаленных строк."""
+        filters = {'user': request.user.id}
+        if recipe_ids is not None:
+            recipes = cls.get_recipes(recipe_ids)
+            filters['recipe'] = recipe_ids
+        with transaction.atomic():
+            removed = remove_relations(
+                cls.get_through_model(),
+                'recipe',
+                **filters,
+            )
+            if removed:
+                cls.update_counters(removed, -1)
+                viewer_changed(request)
+        if recipe_ids is None:
+            recipes = Recipe.objects.only(
+                *AddRemoveRecipeSerializer.Meta.fields
+            ).filter(id__in=removed)
+        else:
+            removed = set(removed)
+            recipes = [recipe for recipe in recipes if recipe.id in removed]
+        return Response(AddRemoveRecipeSerializer(
+            recipes,
+            many=True,
+            context={'request': request},
+        ).data)
+
+    @classmethod
+    def bulk(cls, request):
+        """Пакетное добавление (POST) или удаление (DELETE) рецептов
+        из тела запроса {"recipes": [1, 2, 3]}."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            return cls.add_recipes(request, recipe_ids)
+        return cls.remove_recipes(request, recipe_ids)
+
+
+class ShopingCartViewSet(RecipeRelationViewSet):
+    """Включает/исключает рецепт в корзину (список покупок).
+    Атрибут in_shopping_cart модели Recipes и соответствующий
+    атрибут shopping_cart модели User."""
+
+    relation = 'in_shopping_cart'
+    counter = 'cart_count'
+    duplicate_message = 'Рецепт уже в корзине.'
+    missing_message = 'Рецепта нет в корзине.'
+
+    def get_queryset(self):
+        return self.request.user.shopping_cart
+
 
-class FavoriteViewSet(PostDeleteViewSet):
+class FavoriteViewSet(RecipeRelationViewSet):
     """Включает/исключает рецепт в избранное.
     Атрибут favorited модели Recipes и соответствующий
     атрибут favorites модели User."""
 
-    serializer_class = AddRemoveRecipeSerializer
+    relation = 'favorited'
+    counter = 'favorites_count'
+    duplicate_message = 'Рецепт уже в избранном.'
+    missing_message = 'Рецепта нет в избранном.'
 
     def get_queryset(self):
         return self.request.user.favorites
-
-    def create(self, request, *args, **kwargs):
-        recipe = get_object_or_404(
-            Recipe,
-            id=self.kwargs.get('id')
-        )
-        recipe.favorited.add(request.user)
-        recipe.save()
-        serializer = self.get_serializer(recipe)
-        headers = self.get_success_headers(serializer.data)
-        return Response(
-            serializer.data,
-            status=status.HTTP_201_CREATED,
-            headers=headers
-        )
-
-    def delete(self, request, id):
-        recipe = get_object_or_404(
-            Recipe,
-            id=id
-        )
-        recipe.favorited.remove(request.user)
-        recipe.save()
-        return Response({}, status=status.HTTP_204_NO_CONTENT)
@@ -1,8 +1,38 @@
+from collections import Counter
+
+from api.cache import bump_version
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db import transaction
+from django.db.models import F
+from recipes.feed import add_subscription, remove_subscription
+from recipes.models import Recipe
 
 from .models import Subscription, User
 
+# Хранимые счетчики рецептов, которые изменяют inline-формы избранного
+# и корзины.
+RECIPE_COUNTERS = {
+    User.favorites.through: 'favorites_count',
+    User.shopping_cart.through: 'cart_count',
+}
+
+
+def relation_changes(formset, field):
+    """Изменения связей после сохранения inline-формсета: Counter
+    id объекта поля field - на сколько изменилось количество связей с ним
+    (добавленные строки, удаленные и строки с измененным field)."""
+    changes = Counter()
+    for obj in formset.new_objects:
+        changes[getattr(obj, f'{field}_id')] += 1
+    for form in formset.initial_forms:
+        deleted = form in formset.deleted_forms
+        if deleted or field in form.changed_data:
+            changes[form.initial[field]] -= 1
+            if not deleted:
+                changes[getattr(form.instance, f'{field}_id')] += 1
+    return changes
+
 
 class FavoriteInline(admin.TabularInline):
     model = User.favorites.through
@@ -28,10 +58,48 @@ class SubscriptionInline(admin.TabularInline):
 
 @admin.register(User)
 class MyUserAdmin(UserAdmin):
-    list_display = ('id', 'email', 'username', 'first_name', 'last_name',)
+    list_display = (
+        'id', 'email', 'username', 'first_name', 'last_name', 'recipes_count',
+        'followers_count',
+    )
     inlines = (FavoriteInline, ShoppingCartInline, SubscriptionInline,)
     search_fields = ('first_name', 'last_name',)
 
+    def save_formset(self, request, form, formset, change):
+        """Изменения избранного и корзины в inline-формах меняют счетчики
+        рецептов (F()) и версию кэша состояния пользователя, изменения
+        подписчиков - счетчик подписчиков и ленты, как в API."""
+        super().save_formset(request, form, formset, change)
+        user = form.instance
+        if formset.model in RECIPE_COUNTERS:
+            counter = RECIPE_COUNTERS[formset.model]
+            changes = relation_changes(formset, 'recipe')
+            for recipe_id, delta in changes.items():
+                if delta:
+                    Recipe.objects.filter(id=recipe_id).update(
+                        **{counter: F(counter) + delta}
+                    )
+            if changes:
+                transaction.on_commit(
+                    lambda: bump_version(f'viewer:{user.id}')
+                )
+        elif formset.model is Subscription:
+            for user_id, delta in relation_changes(formset, 'user').items():
+                if delta > 0:
+                    add_subscription(user_id, user.id)
+                elif delta < 0:
+                    remove_subscription(
+                        user_id,
+                        User.objects.get(id=user.id),
+                        -delta,
+                    )
+                if delta:
+                    transaction.on_commit(
+                        lambda user_id=user_id: bump_version(
+                            f'viewer:{user_id}'
+                        )
+                    )
+
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
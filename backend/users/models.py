@@ -12,6 +12,17 @@ class User(AbstractUser):
         'email',
     ]
 
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
+
 
 class Subscription(models.Model):
     """Модель подписки одного пользователя (user) на другого (author)."""
@@ -1,13 +1,16 @@
 from django.contrib.auth.password_validation import validate_password
-from django.db import transaction
+from django.db import models, transaction
 from recipes.models import Recipe
 from rest_framework import exceptions, serializers
 
 from .models import User
+from .viewer import get_viewer_state
 
 
 class CurrentUserSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели пользователя."""
+    """Сериализатор для модели пользователя.
+    Признак подписки вычисляется по множеству авторов, на которых подписан
+    текущий пользователь (users.viewer), без запроса для каждого объекта."""
 
     is_subscribed = serializers.SerializerMethodField()
 
@@ -26,11 +29,12 @@ class CurrentUserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, obj):
-        current_user = self.context.get('request').user
-        return (
-            current_user.is_authenticated
-            and current_user.subscribed.filter(user=current_user).exists()
-        )
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return obj.id in get_viewer_state(
+            self.context.get('request')
+        ).subscriptions
 
     @transaction.atomic
     def create(self, validated_data):
@@ -82,13 +86,27 @@ class AddRemoveRecipeSerializer(serializers.ModelSerializer):
         }
 
 
+class SubscriptionListSerializer(serializers.ListSerializer):
+    """Представление списка подписок с выборкой рецептов всех авторов
+    страницы одним запросом."""
+
+    def to_representation(self, data):
+        iterable = list(
+            data.all() if isinstance(data, models.Manager) else data
+        )
+        self.child.prefetch_recipes(iterable)
+        return super().to_representation(iterable)
+
+
 class SubscriptionSerializer(CurrentUserSerializer):
     """Сериализатор для создания/удаления подписок на других пользователей.
     Также используется вьюфункцией UserViewSet для отображения
-    списка подписчиков (action get_subscriptions)."""
+    списка подписчиков (action get_subscriptions).
+    Параметр запроса recipes_limit ограничивает количество последних
+    рецептов автора в поле recipes; recipes_count - хранимый счетчик."""
 
-    recipes = AddRemoveRecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.IntegerField()
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(CurrentUserSerializer.Meta):
         fields = CurrentUserSerializer.Meta.fields + (
@@ -104,3 +122,62 @@ class SubscriptionSerializer(CurrentUserSerializer):
             'password': {'required': False,
                          'write_only': True}
         }
+        list_serializer_class = SubscriptionListSerializer
+
+    def get_recipes_limit(self):
+        """Значение recipes_limit (None - без ограничения; некорректное
+        значение игнорируется, как и limit пагинации)."""
+        request = self.context.get('request')
+        try:
+            limit = int(request.query_params['recipes_limit'])
+        except (AttributeError, KeyError, ValueError):
+            return None
+        return limit if limit >= 0 else None
+
+    def prefetch_recipes(self, authors):
+        """Последние рецепты (не больше recipes_limit) всех авторов одним
+        запросом: рецепты нумеруются в пределах автора оконной функцией
+        ROW_NUMBER по дате публикации. Результат сохраняется в атрибуте
+        recipe_previews каждого автора."""
+        limit = self.get_recipes_limit()
+        author_ids = [author.id for author in authors]
+        previews = {author_id: [] for author_id in author_ids}
+        if author_ids and limit != 0:
+            for recipe in self.get_recipe_previews(author_ids, limit):
+                previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipe_previews = previews[author.id]
+
+    @staticmethod
+    def get_recipe_previews(author_ids, limit):
+        if limit is None:
+            return Recipe.objects.filter(author__in=author_ids).only(
+                'id', 'name', 'image', 'cooking_time', 'author_id',
+            ).order_by('author', '-pub_date', '-id')
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        return Recipe.objects.raw(
+            f'''
+            SELECT id, name, image, cooking_time, author_id FROM (
+                SELECT id, name, image, cooking_time, author_id, pub_date,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+                    ) AS number
+                FROM {Recipe._meta.db_table}
+                WHERE author_id IN ({placeholders})
+            ) recipe
+            WHERE number <= %s
+            ORDER BY author_id, pub_date DESC, id DESC
+            ''',
+            [*author_ids, limit],
+        )
+
+    def get_recipes(self, obj):
+        recipes = getattr(obj, 'recipe_previews', None)
+        if recipes is None:
+            limit = self.get_recipes_limit()
+            recipes = obj.recipes.all()[:limit]
+        return AddRemoveRecipeSerializer(
+            recipes,
+            many=True,
+            context=self.context,
+        ).data
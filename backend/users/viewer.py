@@ -0,0 +1,99 @@
+from array import array
+from functools import cached_property
+
+from api.cache import bump_version, make_key
+from api.replicas import primary_reads
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from recipes.models import Recipe
+
+from .models import Subscription
+
+SETS = ('favorites', 'shopping_cart', 'subscriptions')
+
+
+class ViewerState:
+    """Состояние текущего пользователя для представлений: id рецептов
+    в избранном и в корзине и id авторов, на которых он подписан.
+    Каждое множество загружается при первом обращении один раз за запрос -
+    одним запросом к БД или из кэша (VIEWER_STATE_CACHE), где хранится
+    массивом 64-битных чисел. Версия кэша у каждого пользователя своя и
+    сменяется при изменении его избранного, корзины или подписок
+    (viewer_changed). Для анонимного пользователя множества пусты и
+    не загружаются."""
+
+    def __init__(self, user):
+        self.user = user
+        self.changed = False
+
+    @cached_property
+    def favorites(self):
+        return self.load(
+            'favorites',
+            Recipe.favorited.through,
+            'recipe_id',
+        )
+
+    @cached_property
+    def shopping_cart(self):
+        return self.load(
+            'shopping_cart',
+            Recipe.in_shopping_cart.through,
+            'recipe_id',
+        )
+
+    @cached_property
+    def subscriptions(self):
+        return self.load(
+            'subscriptions',
+            Subscription,
+            'author_id',
+        )
+
+    @cached_property
+    def key_prefix(self):
+        return make_key(f'viewer:{self.user.id}')
+
+    def load(self, name, model, field):
+        if not self.user.is_authenticated:
+            return frozenset()
+        ids = model.objects.filter(user=self.user).values_list(
+            field, flat=True
+        )
+        # После изменения в текущем запросе кэш пропускается: новая
+        # версия кэша назначается только после фиксации транзакции.
+        if not settings.VIEWER_STATE_CACHE or self.changed:
+            return frozenset(ids)
+        key = f'{self.key_prefix}:{name}'
+        cached = cache.get(key)
+        if cached is None:
+            with primary_reads():
+                cached = array('Q', sorted(ids))
+            cache.set(key, cached, settings.API_CACHE_TIMEOUT)
+        return frozenset(cached)
+
+
+def get_viewer_state(request):
+    """Состояние пользователя запроса; создается один раз за запрос
+    и хранится в самом запросе (HttpRequest - общий для всех
+    сериализаторов). Без запроса возвращается пустое состояние."""
+    if request is None:
+        return ViewerState(AnonymousUser())
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, 'viewer_state'):
+        http_request.viewer_state = ViewerState(request.user)
+    return http_request.viewer_state
+
+
+def viewer_changed(request):
+    """Избранное, корзина или подписки пользователя запроса изменились:
+    после фиксации транзакции сменяется версия его кэша, в текущем
+    запросе множества загружаются заново из БД."""
+    user_id = request.user.id
+    transaction.on_commit(lambda: bump_version(f'viewer:{user_id}'))
+    state = get_viewer_state(request)
+    state.changed = True
+    for name in SETS:
+        state.__dict__.pop(name, None)
@@ -1,17 +1,24 @@
-from django.db.models import Count
+from api.cache import cached_response, make_key
+from api.relations import add_relation
+from api.replicas import ReplicaReadMixin
+from django.db import transaction
+from django.db.models import F, Value
 from django.shortcuts import get_object_or_404
+from recipes.feed import add_subscription, remove_subscription
 from recipes.mixins import PostDeleteViewSet
 from rest_framework import filters, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
 from .models import Subscription, User
 from .permissions import DetailsAuthenticatedOnly
 from .serializers import (CurrentUserSerializer, SubscriptionSerializer,
                           UserSetPasswordSerializer)
+from .viewer import viewer_changed
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Базовый вьюсет для обработки запросов на ендпоинты /users."""
 
     queryset = User.objects.all()
@@ -27,11 +34,16 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def get_me(self, request):
-        serializer = CurrentUserSerializer(
-            request.user,
-            context={'request': request}
+        """Профиль текущего пользователя. Ответ кэшируется и сбрасывается
+        при изменении пользователя (users.signals)."""
+        return cached_response(
+            request,
+            make_key('users', 'me', request.user.pk),
+            lambda: CurrentUserSerializer(
+                request.user,
+                context={'request': request}
+            ).data,
         )
-        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         methods=['post'],
@@ -58,8 +70,11 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def get_subscriptions(self, request):
         queryset = User.objects.filter(
-            subscribed__user=request.user).annotate(
-                recipes_count=Count('recipes'))
+            subscribed__user=request.user,
+        ).annotate(
+            subscription_id=F('subscribed__id'),
+            is_subscribed=Value(True),
+        ).order_by('-subscription_id')
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
             pages,
@@ -72,7 +87,11 @@ class UserViewSet(viewsets.ModelViewSet):
 class SubscriptionViewSet(PostDeleteViewSet):
     """Вьюсет для подписки/отписки.
     Внимание! За отображение списка подписчиков отвечает
-    action get_subscriptions вьюсета UserViewSet."""
+    action get_subscriptions вьюсета UserViewSet.
+    Вместе с подпиской изменяются счетчик подписчиков автора и лента
+    подписок пользователя (recipes.feed). Подписка добавляется одной
+    вставкой по id (api.relations), повторная подписка и отписка от
+    автора, на которого пользователь не подписан, - ошибка 400."""
 
     serializer_class = SubscriptionSerializer
 
@@ -82,21 +101,32 @@ class SubscriptionViewSet(PostDeleteViewSet):
             id=self.kwargs.get('id')
         )
         if not request.user == subscribed:
-            Subscription.objects.create(
-                user=request.user,
-                author=subscribed,
-            )
-        subscribed.recipes_count = subscribed.recipes.count()
+            with transaction.atomic():
+                if not add_relation(
+                    Subscription,
+                    user=request.user.id,
+                    author=subscribed.id,
+                ):
+                    raise ValidationError(
+                        'Вы уже подписаны на этого автора.'
+                    )
+                add_subscription(request.user.id, subscribed.id)
+                viewer_changed(request)
         serializer = self.get_serializer(subscribed)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
         subscribed = get_object_or_404(
-            User,
+            User.objects.only('id', 'followers_count'),
             id=id
         )
-        Subscription.objects.filter(
-            user=request.user,
-            author=subscribed,
-        ).delete()
+        with transaction.atomic():
+            deleted, _ = Subscription.objects.filter(
+                user=request.user,
+                author_id=subscribed.id,
+            ).delete()
+            if not deleted:
+                raise ValidationError('Вы не подписаны на этого автора.')
+            remove_subscription(request.user.id, subscribed, deleted)
+            viewer_changed(request)
         return Response({}, status=status.HTTP_204_NO_CONTENT)